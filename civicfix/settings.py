@@ -42,11 +42,13 @@ AUTH_USER_MODEL = 'core.User'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  
+    'core.metrics.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.BanEnforcementMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -108,6 +110,45 @@ cloudinary.config(
 # Default storage (Cloudinary)
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
+# Issue photos are staged in the database and uploaded by the
+# process_photo_uploads worker through this backend
+PHOTO_UPLOAD_BACKEND = os.getenv("PHOTO_UPLOAD_BACKEND", "core.uploads.CloudinaryUploader")
+
+# Live updates (see core/events.py). The event streams stay open, so they need
+# the ASGI app under an async server, e.g.
+#   uvicorn civicfix.asgi:application --host 0.0.0.0 --port $PORT
+# Under WSGI every open stream would hold a worker: leave them off there and
+# pages don't open streams at all
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "False") == "True"
+# Pub/sub backend behind the live-update streams
+LIVE_UPDATES_BROKER = os.getenv("LIVE_UPDATES_BROKER", "core.events.InMemoryBroker")
+
+# Request metrics (see core/metrics.py): share of requests whose queries are
+# instrumented, the threshold for keeping a slow-query sample, and the bearer
+# token a Prometheus scraper sends to /metrics/ (unset: superadmins only)
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0.1"))
+METRICS_SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS", "100"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Token-bucket limits for the write endpoints (see core/throttle.py), per
+# user and per IP: "<requests>/<sec|min|hour|day>". THROTTLE_CACHE should be
+# a cache shared by every server process in production.
+THROTTLE_RATES = {
+    "vote": os.getenv("THROTTLE_VOTE_RATE", "30/min"),
+    "comment": os.getenv("THROTTLE_COMMENT_RATE", "10/min"),
+    "report": os.getenv("THROTTLE_REPORT_RATE", "10/hour"),
+}
+THROTTLE_CACHE = os.getenv("THROTTLE_CACHE", "default")
+# Reverse proxies in front of the app that append to X-Forwarded-For
+THROTTLE_NUM_PROXIES = int(os.getenv("THROTTLE_NUM_PROXIES", "0"))
+
+
+# Sessions are read from the cache and written through to the database, so
+# a signed-in request normally reads neither its session nor (see
+# core.middleware.CachedAuthenticationMiddleware) its user from the database.
+# With several server processes the default cache must be shared (e.g. Redis).
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
+
 
 # Auth redirects
 LOGIN_REDIRECT_URL = 'citizen_dashboard'
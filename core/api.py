@@ -0,0 +1,194 @@
+"""
+Read-only JSON API, version 1 (mounted under /api/v1/).
+
+Every endpoint accepts ?fields=a,b,c to choose the keys it returns; only the
+columns (and joins) behind those fields are queried. Rows are read with
+values() and never hydrated into model instances. Lists are keyset-paginated:
+pass the returned ``next_cursor`` back as ?cursor= for the next page.
+
+The map endpoint is the exception: /api/v1/map/<z>/<x>/<y>/ returns the
+marker clusters of one slippy-map tile (see core.clusters), cacheable by
+browsers and proxies and revalidated by ETag.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .clusters import MAP_TILE_MAX_AGE, cached_tile_clusters, is_valid_tile, tile_etag
+from .models import Comment, Department, Issue
+from .pagination import InvalidCursor, keyset_paginate
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# API field name -> values() lookup
+ISSUE_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "status": "status",
+    "location": "location",
+    "latitude": "latitude",
+    "longitude": "longitude",
+    "vote_count": "vote_count",
+    "department_id": "department_id",
+    "department": "department__name",
+    "photo": "photo",
+    "thumbnails": "thumbnails",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+ISSUE_LIST_DEFAULT = ["id", "title", "status", "department", "vote_count", "created_at"]
+ISSUE_ORDERINGS = {
+    "newest": ("-created_at", "-id"),
+    "most_voted": ("-vote_count", "-created_at", "-id"),
+}
+
+COMMENT_FIELDS = {
+    "id": "id",
+    "parent_id": "parent_id",
+    "user": "user__username",
+    "content": "content",
+    "depth": "path",
+    "created_at": "created_at",
+}
+
+DEPARTMENT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+}
+
+# Post-processing for values that aren't JSON-ready as read
+TRANSFORMS = {
+    "photo": lambda photo: photo.url if photo else None,
+    "depth": lambda path: max(path.count("/") - 1, 0),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(payload, status=200):
+    return JsonResponse(
+        payload, status=status, encoder=DjangoJSONEncoder, json_dumps_params={"separators": (",", ":")},
+    )
+
+
+def _error(e):
+    return _json({"success": False, "error": str(e)}, status=e.status)
+
+
+def _requested_fields(request, spec, default):
+    raw = request.GET.get("fields")
+    names = default if not raw else list(dict.fromkeys(n.strip() for n in raw.split(",") if n.strip()))
+    unknown = [n for n in names if n not in spec]
+    if unknown or not names:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(spec)}")
+    return names
+
+
+def _serialize(row, names, spec):
+    item = {}
+    for name in names:
+        value = row[spec[name]]
+        transform = TRANSFORMS.get(name)
+        item[name] = transform(value) if transform and value is not None else value
+    return item
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise ApiError("limit must be a number")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _page(request, queryset, names, spec, ordering):
+    """One keyset page of `queryset` as a JSON response body."""
+    lookups = {spec[n] for n in names} | {f.lstrip("-") for f in ordering}
+    try:
+        page = keyset_paginate(queryset.values(*lookups), request.GET.get("cursor"), _limit(request), ordering)
+    except InvalidCursor:
+        raise ApiError("Invalid cursor")
+    return {
+        "success": True,
+        "results": [_serialize(row, names, spec) for row in page],
+        "next_cursor": page.next_cursor,
+    }
+
+
+@require_GET
+def issue_list(request):
+    try:
+        names = _requested_fields(request, ISSUE_FIELDS, ISSUE_LIST_DEFAULT)
+        ordering = ISSUE_ORDERINGS.get(request.GET.get("sort") or "newest")
+        if ordering is None:
+            raise ApiError(f"sort must be one of: {', '.join(ISSUE_ORDERINGS)}")
+
+        issues = Issue.objects.all()
+        if request.GET.get("status"):
+            issues = issues.filter(status=request.GET["status"])
+        department = request.GET.get("department")
+        if department == "none":
+            issues = issues.filter(department__isnull=True)
+        elif department:
+            if not department.isdigit():
+                raise ApiError("department must be an id or 'none'")
+            issues = issues.filter(department_id=department)
+        if request.GET.get("q"):
+            issues = issues.search(request.GET["q"])
+
+        return _json(_page(request, issues, names, ISSUE_FIELDS, ordering))
+    except ApiError as e:
+        return _error(e)
+
+
+@require_GET
+def issue_detail(request, pk):
+    try:
+        names = _requested_fields(request, ISSUE_FIELDS, list(ISSUE_FIELDS))
+    except ApiError as e:
+        return _error(e)
+    row = Issue.objects.filter(pk=pk).values(*{ISSUE_FIELDS[n] for n in names}).first()
+    if row is None:
+        return _error(ApiError("Issue not found", status=404))
+    return _json({"success": True, "result": _serialize(row, names, ISSUE_FIELDS)})
+
+
+@require_GET
+def issue_comments(request, pk):
+    """Comments of an issue, threads flattened depth-first (see Comment.path)."""
+    try:
+        names = _requested_fields(request, COMMENT_FIELDS, list(COMMENT_FIELDS))
+        body = _page(request, Comment.objects.filter(issue_id=pk), names, COMMENT_FIELDS, ("path",))
+    except ApiError as e:
+        return _error(e)
+    if not body["results"] and not Issue.objects.filter(pk=pk).exists():
+        return _error(ApiError("Issue not found", status=404))
+    return _json(body)
+
+
+@require_GET
+def department_list(request):
+    try:
+        names = _requested_fields(request, DEPARTMENT_FIELDS, ["id", "name"])
+        return _json(_page(request, Department.objects.all(), names, DEPARTMENT_FIELDS, ("name", "id")))
+    except ApiError as e:
+        return _error(e)
+
+
+@require_GET
+@condition(etag_func=tile_etag)
+def map_tile(request, z, x, y):
+    """Marker clusters (count, centroid, status mix) of the map tile z/x/y."""
+    if not is_valid_tile(z, x, y):
+        return _error(ApiError("No such tile", status=404))
+    response = _json({"success": True, **cached_tile_clusters(z, x, y)})
+    patch_cache_control(response, public=True, max_age=MAP_TILE_MAX_AGE)
+    return response
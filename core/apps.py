@@ -6,4 +6,4 @@ class CoreConfig(AppConfig):
     
     def ready(self):
         # Import signals or other startup code here if needed
-        pass
\ No newline at end of file
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,227 @@
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from .metrics import record_cache
+from .models import Department, Issue, User
+
+HOME_CACHE_KEY = "core:home:v1"
+HOME_CACHE_TIMEOUT = 300  # seconds; signals invalidate sooner on any change
+HOME_RECENT_COUNT = 3
+HOME_HITS_KEY = "core:home:hits"
+HOME_MISSES_KEY = "core:home:misses"
+PRINCIPAL_CACHE_KEY = "core:principal:%s"
+PRINCIPAL_CACHE_TIMEOUT = 3600
+# User columns kept in the principal; last_login is left out so that logging
+# in doesn't invalidate it, and the password is kept only as the session hash
+PRINCIPAL_FIELDS = (
+    "id", "username", "first_name", "last_name", "email", "is_active", "is_staff", "is_superuser",
+    "is_citizen", "is_moderator", "is_resolver", "is_banned", "banned_until",
+)
+LAST_MODIFIED_KEY = "core:lastmod:%s"
+LAST_MODIFIED_TIMEOUT = 86400
+PAGE_CACHE_KEY = "core:page:%s:%s:%s"
+PAGE_CACHE_TIMEOUT = 600
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter expired or was never set
+        cache.set(key, 1, None)
+
+
+def get_home_block():
+    """
+    Landing-page stats and recent issues, served from the cache.
+
+    The recent issues carry no per-user state; callers overlay
+    ``user_has_voted`` themselves.
+    """
+    block = cache.get(HOME_CACHE_KEY)
+    record_cache("home", block is not None)
+    if block is not None:
+        _bump(HOME_HITS_KEY)
+        return block
+
+    _bump(HOME_MISSES_KEY)
+    recent_issues = list(
+        Issue.objects.select_related('department').order_by('-created_at')[:HOME_RECENT_COUNT]
+    )
+    block = {
+        'total_issues': Issue.objects.count(),
+        'resolved_issues': Issue.objects.filter(status=Issue.STATUS_RESOLVED).count(),
+        'active_users': User.objects.filter(is_active=True).count(),
+        'total_departments': Department.objects.count(),
+        'recent_issues': recent_issues,
+        'recent_ids': {issue.id for issue in recent_issues},
+    }
+    cache.set(HOME_CACHE_KEY, block, HOME_CACHE_TIMEOUT)
+    return block
+
+
+def invalidate_home_block():
+    cache.delete(HOME_CACHE_KEY)
+
+
+def home_cache_stats():
+    hits = cache.get(HOME_HITS_KEY, 0)
+    misses = cache.get(HOME_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(100 * hits / total, 1) if total else None,
+    }
+
+
+def get_principal(user_id):
+    """
+    Everything a request needs to know about signed-in user `user_id`: the
+    PRINCIPAL_FIELDS, the session auth hash, department ids and the
+    department they administer. Cached so that authenticating a request,
+    checking its ban and rendering the role-dependent nav run no query; one
+    query on a miss. None if the user doesn't exist.
+
+    Signals invalidate it whenever any of that changes (see
+    invalidate_principals in core.signals).
+    """
+    key = PRINCIPAL_CACHE_KEY % user_id
+    principal = cache.get(key)
+    record_cache("principal", principal is not None)
+    if principal is None:
+        # One row per department, with the user's columns repeated
+        rows = list(
+            User.objects.filter(pk=user_id)
+            .values_list(*PRINCIPAL_FIELDS, "password", "departments__id", "admin_of_department__id")
+        )
+        if not rows:
+            return None
+        fields = dict(zip(PRINCIPAL_FIELDS, rows[0]))
+        principal = {
+            "fields": fields,
+            "session_hash": User(password=rows[0][len(PRINCIPAL_FIELDS)], **fields).get_session_auth_hash(),
+            "department_ids": sorted({row[-2] for row in rows if row[-2] is not None}),
+            "admin_department_id": rows[0][-1],
+        }
+        cache.set(key, principal, PRINCIPAL_CACHE_TIMEOUT)
+    return principal
+
+
+def principal_user(principal):
+    """
+    A User built from a principal without touching the database. The other
+    columns are deferred: reading one loads it, and save() writes only the
+    loaded ones.
+    """
+    fields = principal["fields"]
+    user = User.from_db(
+        User.objects.db,
+        list(fields),
+        [fields[f.attname] for f in User._meta.concrete_fields if f.attname in fields],
+    )
+    # Fill the cached properties so they don't query either
+    user.__dict__["department_ids"] = principal["department_ids"]
+    user.__dict__["admin_department_id"] = principal["admin_department_id"]
+    return user
+
+
+def invalidate_principals(user_ids):
+    cache.delete_many([PRINCIPAL_CACHE_KEY % pk for pk in user_ids])
+
+
+# ---- Conditional GET and anonymous page cache ----
+#
+# Each cacheable scope ("feed", "map", "issue:<pk>") has a last-modified time.
+# Signals stamp it whenever something shown in that scope changes; on a cache
+# miss it is derived from the database. It drives the ETag/Last-Modified validators
+# and is part of every page cache key, so a change retires stale pages at once.
+
+def touch_last_modified(*scopes):
+    now = timezone.now()
+    cache.set_many({LAST_MODIFIED_KEY % scope: now for scope in scopes}, LAST_MODIFIED_TIMEOUT)
+
+
+def issue_last_modified(pk):
+    """When issue `pk` or its comments last changed (None if it doesn't exist)."""
+    key = LAST_MODIFIED_KEY % f"issue:{pk}"
+    modified = cache.get(key)
+    record_cache("last_modified", modified is not None)
+    if modified is None:
+        # A plain aggregate: no GROUP BY over every Issue column to sort
+        row = Issue.objects.filter(pk=pk).aggregate(
+            updated_at=Max('updated_at'), last_comment=Max('comments__created_at'),
+        )
+        if row['updated_at'] is None:
+            return None
+        modified = max(filter(None, row.values()))
+        cache.set(key, modified, LAST_MODIFIED_TIMEOUT)
+    return modified
+
+
+def _stamped_last_modified(scope):
+    key = LAST_MODIFIED_KEY % scope
+    modified = cache.get(key)
+    record_cache("last_modified", modified is not None)
+    if modified is None:
+        # Deletions leave no trace in the table, so start from now
+        modified = timezone.now()
+        cache.set(key, modified, LAST_MODIFIED_TIMEOUT)
+    return modified
+
+
+def feed_last_modified():
+    return _stamped_last_modified("feed")
+
+
+def map_last_modified():
+    """When the map grid (core.clusters) last changed."""
+    return _stamped_last_modified("map")
+
+
+def page_etag(request, modified):
+    """ETag for a page: its scope's last change, the viewer and the exact URL."""
+    if modified is None or len(get_messages(request)):
+        # Pending flash messages make the page differ from the cached one
+        return None
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    raw = f"{modified.isoformat()}|{user_id}|{request.get_full_path()}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_anonymous_page(scope_func, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    Serve anonymous GETs of a view from the cache. `scope_func(*args, **kwargs)`
+    returns (scope, last_modified) for the view's arguments.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or request.user.is_authenticated or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+            scope, modified = scope_func(*args, **kwargs)
+            if modified is None:
+                return view(request, *args, **kwargs)
+
+            url_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = PAGE_CACHE_KEY % (scope, modified.timestamp(), url_hash)
+            response = cache.get(key)
+            record_cache("page", response is not None)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # Never share a page that sets cookies or carries a CSRF token
+                if (
+                    response.status_code == 200 and not response.cookies
+                    and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+                ):
+                    if hasattr(response, "render"):
+                        response.render()
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,271 @@
+"""
+Marker clusters for the city-wide issue map, served from a precomputed grid.
+
+MapCell counts the issues of each status in every geohash cell at
+precisions 1..CLUSTER_PRECISION, with the sums of their coordinates. Each
+level is a grid four to eight times finer than the one above, so the
+clusters of a map tile are the cells of one level under the tile: a few
+dozen rows read through the (precision, cell) index however many issues
+the city has. A cluster's centroid is lat_sum / count, which for a single
+issue is the issue's own location.
+
+The grid is maintained like the report rollups: signals apply a +1/-1
+delta to an issue's cells on create, status or location change and delete,
+and the bulk moderation paths apply one delta per cell. Every change stamps
+the "map" last-modified scope, which tile ETags and cache keys are built
+from, so tiles can be cached until the next change.
+"""
+import hashlib
+import math
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Substr
+
+from .cache import map_last_modified, touch_last_modified
+from .geo import cell_size, geohash_cover
+from .metrics import record_cache
+from .models import Issue, MapCell
+
+CLUSTER_PRECISION = 7  # finest level, ~150m x 150m cells
+CELLS_PER_TILE = 8  # target cells across a tile's width
+MAX_ZOOM = 22
+CELL_FIELDS = ("geohash", "status", "latitude", "longitude")
+DELTA_CHUNK_SIZE = 250  # cells per statement
+MAP_TILE_KEY = "core:map:%s:%s:%s:%s"
+MAP_TILE_TIMEOUT = 3600
+MAP_TILE_MAX_AGE = 60  # seconds browsers and proxies may reuse a tile unchecked
+
+
+# ---- Keeping the grid up to date ----
+
+def map_cell_key(geohash, status, latitude, longitude):
+    """What an issue contributes to the grid, or None if it has no location."""
+    if not geohash:
+        return None
+    return geohash[:CLUSTER_PRECISION], status, latitude, longitude
+
+
+def issue_map_cell_key(issue):
+    return map_cell_key(*(getattr(issue, f) for f in CELL_FIELDS))
+
+
+def _add_delta(deltas, cell, status, n, lat_sum, lng_sum):
+    # An issue counts in the cell of every level, i.e. every prefix of its geohash
+    for precision in range(1, len(cell) + 1):
+        delta = deltas.setdefault((cell[:precision], status), [0, 0.0, 0.0])
+        delta[0] += n
+        delta[1] += lat_sum
+        delta[2] += lng_sum
+
+
+def _case(deltas, index, output_field):
+    return Case(
+        *(When(cell=cell, status=status, then=Value(d[index])) for (cell, status), d in deltas.items()),
+        default=Value(0), output_field=output_field,
+    )
+
+
+def _increment(deltas):
+    """Add `deltas` to the cells that exist. Returns how many did."""
+    keys = Q()
+    for cell, status in deltas:
+        keys |= Q(cell=cell, status=status)
+    return MapCell.objects.filter(keys).update(
+        count=F("count") + _case(deltas, 0, IntegerField()),
+        lat_sum=F("lat_sum") + _case(deltas, 1, FloatField()),
+        lng_sum=F("lng_sum") + _case(deltas, 2, FloatField()),
+    )
+
+
+def apply_cell_deltas(deltas):
+    """
+    Add `deltas` ({(cell, status): [count, lat_sum, lng_sum]}) to the grid,
+    creating missing cells. One UPDATE per chunk of cells, with the amounts
+    added in SQL so concurrent writers never overwrite each other; wrap the
+    call in a transaction when the chunks must apply together.
+    """
+    deltas = {key: d for key, d in deltas.items() if any(d)}
+    keys = sorted(deltas)
+    for start in range(0, len(keys), DELTA_CHUNK_SIZE):
+        chunk = {key: deltas[key] for key in keys[start:start + DELTA_CHUNK_SIZE]}
+        if _increment(chunk) == len(chunk):
+            continue
+        existing = set(
+            MapCell.objects.filter(cell__in={c for c, _ in chunk}, status__in={s for _, s in chunk})
+            .values_list("cell", "status")
+        )
+        missing = {key: d for key, d in chunk.items() if key not in existing and d[0] > 0}
+        if not missing:
+            continue
+        try:
+            with transaction.atomic():
+                MapCell.objects.bulk_create(
+                    MapCell(precision=len(cell), cell=cell, status=status,
+                            count=d[0], lat_sum=d[1], lng_sum=d[2])
+                    for (cell, status), d in missing.items()
+                )
+        except IntegrityError:
+            # Another request created some of them first; add to those instead
+            apply_cell_deltas(missing)
+    if keys:
+        touch_last_modified("map")
+
+
+def apply_issue_delta(key, n):
+    """Add (n=1) or remove (n=-1) one issue's map_cell_key() from the grid."""
+    if key is None:
+        return
+    cell, status, latitude, longitude = key
+    deltas = {}
+    _add_delta(deltas, cell, status, n, n * latitude, n * longitude)
+    apply_cell_deltas(deltas)
+
+
+def move_map_cell(old_key, new_key):
+    """Move one issue from `old_key` to `new_key`, in one pass over the grid."""
+    if old_key == new_key:
+        return
+    deltas = {}
+    for key, n in ((old_key, -1), (new_key, 1)):
+        if key is not None:
+            cell, status, latitude, longitude = key
+            _add_delta(deltas, cell, status, n, n * latitude, n * longitude)
+    apply_cell_deltas(deltas)
+
+
+def _grouped_cells(queryset):
+    return (
+        queryset.exclude(geohash="")
+        .annotate(cell=Substr("geohash", 1, CLUSTER_PRECISION))
+        .values("cell", "status")
+        .annotate(n=Count("id"), lat_sum=Sum("latitude"), lng_sum=Sum("longitude"))
+        .order_by()
+    )
+
+
+def move_map_cells_bulk(queryset, status):
+    """
+    Apply the grid moves for `queryset` before it is ``update()``-d to
+    `status`: one delta per cell rather than one per issue.
+    """
+    deltas = {}
+    for group in _grouped_cells(queryset.exclude(status=status)):
+        n, lat_sum, lng_sum = group["n"], group["lat_sum"], group["lng_sum"]
+        _add_delta(deltas, group["cell"], group["status"], -n, -lat_sum, -lng_sum)
+        _add_delta(deltas, group["cell"], status, n, lat_sum, lng_sum)
+    apply_cell_deltas(deltas)
+
+
+def remove_map_cells_bulk(queryset):
+    """Subtract `queryset` from the grid before it is deleted."""
+    deltas = {}
+    for group in _grouped_cells(queryset):
+        _add_delta(deltas, group["cell"], group["status"], -group["n"], -group["lat_sum"], -group["lng_sum"])
+    apply_cell_deltas(deltas)
+
+
+def rebuild_map_cells(batch_size=2000):
+    """Recompute the whole grid from Issue. Returns the number of cells written."""
+    with transaction.atomic():
+        MapCell.objects.all().delete()
+        written = 0
+        for precision in range(1, CLUSTER_PRECISION + 1):
+            grouped = (
+                Issue.objects.exclude(geohash="")
+                .annotate(cell=Substr("geohash", 1, precision))
+                .values("cell", "status")
+                .annotate(count=Count("id"), lat_sum=Sum("latitude"), lng_sum=Sum("longitude"))
+                .order_by()
+            )
+            written += len(MapCell.objects.bulk_create(
+                (MapCell(precision=precision, **row) for row in grouped.iterator()),
+                batch_size=batch_size,
+            ))
+    touch_last_modified("map")
+    return written
+
+
+# ---- Serving tiles ----
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of the Web Mercator ("slippy map") tile z/x/y."""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360 - 180, lat(y), (x + 1) / n * 360 - 180
+
+
+def tile_of(lat, lng, z):
+    """(x, y) of the zoom `z` tile containing (lat, lng)."""
+    n = 1 << z
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def zoom_precision(z):
+    """The coarsest grid level with about CELLS_PER_TILE cells across a tile at zoom `z`."""
+    target = 360 / (1 << z) / CELLS_PER_TILE
+    for precision in range(1, CLUSTER_PRECISION + 1):
+        if cell_size(precision)[1] <= target:
+            return precision
+    return CLUSTER_PRECISION
+
+
+def tile_clusters(z, x, y):
+    """
+    The clusters of tile z/x/y: one per non-empty grid cell whose centroid
+    falls inside the tile, so a cell straddling a tile edge is drawn once.
+    """
+    south, west, north, east = tile_bounds(z, x, y)
+    precision = zoom_precision(z)
+    prefixes = {cell[:precision] for cell in geohash_cover(south, west, north, east)}
+    cells = Q()
+    for prefix in prefixes:
+        # Range scan on the (precision, cell) index, as in IssueQuerySet.in_bbox
+        cells |= Q(cell__gte=prefix, cell__lt=prefix + "{")
+    rows = (
+        MapCell.objects.filter(cells, precision=precision, count__gt=0)
+        .values_list("cell", "status", "count", "lat_sum", "lng_sum")
+        .order_by("cell")
+    )
+
+    grouped = {}
+    for cell, status, count, lat_sum, lng_sum in rows:
+        cluster = grouped.setdefault(cell, {"cell": cell, "count": 0, "lat": 0.0, "lng": 0.0, "statuses": {}})
+        cluster["count"] += count
+        cluster["lat"] += lat_sum
+        cluster["lng"] += lng_sum
+        cluster["statuses"][status] = count
+
+    clusters = []
+    for cluster in grouped.values():
+        cluster["lat"] = round(cluster["lat"] / cluster["count"], 6)
+        cluster["lng"] = round(cluster["lng"] / cluster["count"], 6)
+        if south <= cluster["lat"] < north and west <= cluster["lng"] < east:
+            clusters.append(cluster)
+    return {"zoom": z, "precision": precision, "clusters": clusters}
+
+
+def tile_etag(request, z, x, y):
+    raw = f"{map_last_modified().isoformat()}|{request.get_full_path()}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def cached_tile_clusters(z, x, y):
+    """tile_clusters(), cached until the grid next changes."""
+    key = MAP_TILE_KEY % (map_last_modified().timestamp(), z, x, y)
+    tile = cache.get(key)
+    record_cache("map_tile", tile is not None)
+    if tile is None:
+        tile = tile_clusters(z, x, y)
+        cache.set(key, tile, MAP_TILE_TIMEOUT)
+    return tile
@@ -0,0 +1,146 @@
+"""
+Live updates: a pub/sub broker and the server-sent event streams it feeds.
+
+Views publish small JSON events (new vote count, status change, new comment)
+to per-issue and per-department channels once their transaction commits;
+browsers follow a channel with EventSource. Streams are async generators, so
+under an ASGI server (``uvicorn civicfix.asgi:application``) an idle
+connection costs one suspended task, not a thread. Under WSGI each stream
+would tie up a worker, so everything here is off unless
+settings.LIVE_UPDATES is set: pages open no streams and nothing is published.
+
+The broker class is set by settings.LIVE_UPDATES_BROKER. InMemoryBroker only
+reaches subscribers in its own process; a multi-process deployment needs a
+backend over a shared bus (e.g. Redis pub/sub) with the same two methods:
+publish(channel, event) and subscribe(channels) -> Subscription.
+"""
+import asyncio
+import json
+import threading
+from functools import cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+HEARTBEAT_SECONDS = 15  # keeps proxies from closing idle streams
+SUBSCRIBER_QUEUE_SIZE = 100
+RETRY_MS = 5000  # how long EventSource waits before reconnecting
+
+
+def issue_channel(issue_id):
+    return f"issue:{issue_id}"
+
+
+def department_channel(department_id):
+    return f"department:{department_id}"
+
+
+class Subscription:
+    """Events for one connection, buffered on the event loop that serves it."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = list(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event):
+        # Runs on self.loop. A client too slow to drain its queue loses the
+        # oldest events rather than holding memory for them.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """The next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """
+    Fans events out to the subscribers of this process.
+
+    publish() may be called from any thread (sync views run in a thread pool
+    under ASGI); events are handed to each subscriber's loop with
+    call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loop already closed; the subscription is on its way out
+                pass
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+@cache
+def get_broker():
+    return import_string(settings.LIVE_UPDATES_BROKER)()
+
+
+def publish(channels, event_type, **data):
+    """Publish an event to `channels` once the current transaction commits."""
+    if not settings.LIVE_UPDATES:
+        return
+    event = {"type": event_type, **data}
+
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, event)
+
+    transaction.on_commit(send)
+
+
+def publish_issue_event(issue, event_type, **data):
+    """Publish to the issue's own channel and to its department's feed."""
+    channels = [issue_channel(issue.pk)]
+    if issue.department_id:
+        channels.append(department_channel(issue.department_id))
+    publish(channels, event_type, issue_id=issue.pk, **data)
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(channels, heartbeat=HEARTBEAT_SECONDS):
+    """SSE body for `channels`; runs until the client disconnects."""
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            event = await subscription.get(heartbeat)
+            yield format_event(event) if event is not None else ": keep-alive\n\n"
+    finally:
+        subscription.close()
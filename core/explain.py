@@ -0,0 +1,174 @@
+"""
+EXPLAIN the queries behind the hot views, to catch the ones that would fall
+back to a full table scan or a temporary sort as the tables grow.
+
+Each view in HOT_VIEWS is called as a user of the right role, inside a
+transaction that is rolled back and with the cache disabled, so every query
+it can run actually reaches the database. Each distinct SELECT is then
+EXPLAINed:
+- SQLite: EXPLAIN QUERY PLAN. "SCAN <table>" without an index is a full
+  scan; "USE TEMP B-TREE" is a sort no index provided.
+- PostgreSQL: EXPLAIN with enable_seqscan and enable_sort off. The planner
+  then only picks a Seq Scan or Sort when no index can serve the query,
+  instead of whenever the table is still small.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+from django.utils.module_loading import import_string
+
+from .clusters import tile_of
+from .models import Department, Issue, User
+
+# Reference tables that stay small whatever the traffic; scanning them is fine
+SMALL_TABLES = {"core_department", "core_department_users"}
+
+# (label, role, url) — the url is formatted with the sample rows below
+HOT_VIEWS = [
+    ("home", "anon", "/"),
+    ("feed", "citizen", "/issues/"),
+    ("feed by status", "citizen", "/issues/?status=reported"),
+    ("feed most voted", "citizen", "/issues/?sort=most_voted"),
+    ("issue detail", "anon", "/issues/{issue}/"),
+    ("nearby", "anon", "/issues/nearby/?lat={lat}&lng={lng}"),
+    ("citizen dashboard", "citizen", "/dashboard/"),
+    ("work queue", "resolver", "/department/"),
+    ("work queue, all statuses", "resolver", "/department/?status=all"),
+    ("moderation", "admin", "/superadmin/manage/"),
+    ("moderation by status", "admin", "/superadmin/manage/?status=reported"),
+    ("moderation, unassigned", "admin", "/superadmin/manage/?department=none"),
+    ("moderation by department", "admin", "/superadmin/manage/?department={department}"),
+    ("api issues", "anon", "/api/v1/issues/"),
+    ("api issues by department", "anon", "/api/v1/issues/?department={department}"),
+    ("api comments", "anon", "/api/v1/issues/{issue}/comments/"),
+    ("map tile", "anon", "/api/v1/map/{tile}/"),
+    ("map tile, city-wide", "anon", "/api/v1/map/{city_tile}/"),
+]
+
+# (label, SQL fragment) -> why that query's plan is accepted as it is
+KNOWN_PLANS = {
+    ("home", 'FROM "core_user"'): "active-user count; most users are active and the home block caches it",
+    ("issue detail", 'ORDER BY "core_comment"."path"'): "sorts the comments of one page of threads only",
+}
+
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING)")
+SQLITE_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+POSTGRES_TABLE = re.compile(r"Scan (?:using \w+ )?on (\w+)")
+POSTGRES_SORT = re.compile(r"^\s*(->\s+)?Sort\b")
+
+
+def sample_context():
+    """The users and rows the HOT_VIEWS urls are requested with, or None if the database is empty."""
+    issue = (
+        Issue.objects.filter(department__isnull=False, latitude__isnull=False)
+        .annotate(n=Count("comments")).order_by("-n", "id").first()
+    )
+    resolver = User.objects.filter(is_resolver=True, departments__isnull=False).first()
+    if issue is None or resolver is None:
+        return None
+    return {
+        "users": {
+            "anon": AnonymousUser(),
+            "citizen": User.objects.filter(is_citizen=True).annotate(n=Count("reported_issues")).order_by("-n").first(),
+            "resolver": resolver,
+            "admin": User.objects.filter(is_superuser=True).first(),
+        },
+        "issue": issue.pk,
+        "lat": issue.latitude,
+        "lng": issue.longitude,
+        "department": Department.objects.filter(users=resolver).values_list("id", flat=True).first(),
+        "tile": "15/{}/{}".format(*tile_of(issue.latitude, issue.longitude, 15)),
+        "city_tile": "9/{}/{}".format(*tile_of(issue.latitude, issue.longitude, 9)),
+    }
+
+
+def capture_view_queries(url, user):
+    """The (sql, params) of every SELECT the view at `url` runs for `user`."""
+    request = RequestFactory().get(url)
+    request.user = user
+    request.session = import_string(f"{settings.SESSION_ENGINE}.SessionStore")()
+    request._messages = default_storage(request)
+    match = request.resolver_match = resolve(request.path_info)
+
+    queries = []
+
+    def capture(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    dummy_cache = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    with override_settings(CACHES=dummy_cache), transaction.atomic(), connection.execute_wrapper(capture):
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        transaction.set_rollback(True)
+    return list(dict.fromkeys((sql, tuple(params or ())) for sql, params in queries))
+
+
+def explain(sql, params):
+    """The plan of one query, as a list of lines."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan, ignore_tables=SMALL_TABLES):
+    """Full scans and temporary sorts in an EXPLAIN plan, as readable strings."""
+    postgres = connection.vendor == "postgresql"
+    table_pattern = POSTGRES_TABLE if postgres else SQLITE_TABLE
+    tables = {m.group(1) for m in map(table_pattern.search, plan) if m} & set(connection.introspection.table_names())
+    if tables <= ignore_tables:
+        # Only small reference tables involved; nothing here grows
+        return []
+
+    problems = []
+    for line in plan:
+        if postgres:
+            scan, sort = POSTGRES_SCAN.search(line), POSTGRES_SORT.match(line)
+        else:
+            scan, sort = SQLITE_SCAN.match(line.strip()), "USE TEMP B-TREE" in line
+        if scan and scan.group(1) in tables - ignore_tables:
+            problems.append(f"full scan of {scan.group(1)}")
+        if sort:
+            problems.append("sort without an index")
+    return problems
+
+
+def check_views(views=HOT_VIEWS, ignore_tables=SMALL_TABLES):
+    """
+    EXPLAIN every query of every hot view. Yields (label, url, sql, plan,
+    problems, known) per distinct query; `known` is the KNOWN_PLANS reason
+    its problems are accepted, if any.
+    """
+    context = sample_context()
+    if context is None:
+        raise ValueError("No issues with a department, or no resolver: seed some data first (manage.py seed_data)")
+    for label, role, url in views:
+        url = url.format(**context)
+        for sql, params in capture_view_queries(url, context["users"][role]):
+            plan = explain(sql, params)
+            problems = plan_problems(plan, ignore_tables)
+            known = next((why for (view, fragment), why in KNOWN_PLANS.items() if view == label and fragment in sql), None)
+            yield label, url, _inline(sql, params), plan, problems, known
+
+
+def _inline(sql, params):
+    """The SQL with its parameters filled in, for display only."""
+    try:
+        return sql % tuple(f"'{p}'" if isinstance(p, str) else p for p in params)
+    except (TypeError, ValueError):
+        return sql
@@ -0,0 +1,186 @@
+"""
+Streaming data exports (CSV or NDJSON) for the superadmin export view and
+the export_data command.
+
+Rows are read with values_list().iterator(), so the database hands them over
+in chunks (through a server-side cursor on PostgreSQL) and each one is
+written out before the next is fetched. Memory use stays flat whatever the
+number of rows.
+"""
+import csv
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Comment, Issue, IssueDailyRollup, Vote
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+# CSV cells starting with one of these get a leading ' so spreadsheets show
+# them as text (NDJSON stays as entered)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# dataset -> queryset, (column, values lookup) pairs, and the fields the
+# date / department / status filters apply to
+DATASETS = {
+    "issues": {
+        "queryset": lambda: Issue.objects.order_by("id"),
+        "columns": [
+            ("id", "id"),
+            ("title", "title"),
+            ("description", "description"),
+            ("status", "status"),
+            ("department", "department__name"),
+            ("reporter", "reporter__username"),
+            ("location", "location"),
+            ("latitude", "latitude"),
+            ("longitude", "longitude"),
+            ("vote_count", "vote_count"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+        "date_field": "created_at",
+        "department_field": "department_id",
+        "status_field": "status",
+    },
+    "votes": {
+        "queryset": lambda: Vote.objects.order_by("id"),
+        "columns": [
+            ("id", "id"),
+            ("issue_id", "issue_id"),
+            ("user", "user__username"),
+            ("created_at", "created_at"),
+        ],
+        "date_field": "created_at",
+        "department_field": "issue__department_id",
+        "status_field": "issue__status",
+    },
+    "comments": {
+        "queryset": lambda: Comment.objects.order_by("id"),
+        "columns": [
+            ("id", "id"),
+            ("issue_id", "issue_id"),
+            ("parent_id", "parent_id"),
+            ("user", "user__username"),
+            ("content", "content"),
+            ("created_at", "created_at"),
+        ],
+        "date_field": "created_at",
+        "department_field": "issue__department_id",
+        "status_field": "issue__status",
+    },
+    # Daily issue counts per status and department, as superadmin_reports sees them
+    "status_report": {
+        "queryset": lambda: IssueDailyRollup.objects.filter(count__gt=0).order_by("day", "id"),
+        "columns": [
+            ("day", "day"),
+            ("status", "status"),
+            ("department", "department__name"),
+            ("reporter", "reporter__username"),
+            ("count", "count"),
+        ],
+        "date_field": "day",
+        "department_field": "department_id",
+        "status_field": "status",
+    },
+}
+
+
+def parse_filters(params):
+    """
+    Validate ?start=&end= (YYYY-MM-DD, inclusive), ?department= (id or
+    "none") and ?status=. Raises ValueError with a readable message.
+    """
+    filters = {}
+    for name in ("start", "end"):
+        if params.get(name):
+            try:
+                filters[name] = datetime.strptime(params[name], "%Y-%m-%d").date()
+            except ValueError:
+                raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+    department = params.get("department")
+    if department:
+        if department != "none" and not str(department).isdigit():
+            raise ValueError("department must be an id or 'none'")
+        filters["department"] = department
+    status = params.get("status")
+    if status:
+        if status not in dict(Issue.STATUS_CHOICES):
+            raise ValueError(f"status must be one of: {', '.join(dict(Issue.STATUS_CHOICES))}")
+        filters["status"] = status
+    return filters
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(dataset, filters):
+    spec = DATASETS[dataset]
+    queryset = spec["queryset"]()
+    date_field = spec["date_field"]
+    if dataset == "status_report":
+        if "start" in filters:
+            queryset = queryset.filter(**{f"{date_field}__gte": filters["start"]})
+        if "end" in filters:
+            queryset = queryset.filter(**{f"{date_field}__lte": filters["end"]})
+    else:
+        # Compare against datetimes rather than __date so the index is usable
+        if "start" in filters:
+            queryset = queryset.filter(**{f"{date_field}__gte": _day_start(filters["start"])})
+        if "end" in filters:
+            queryset = queryset.filter(**{f"{date_field}__lt": _day_start(filters["end"] + timedelta(days=1))})
+    if filters.get("department") == "none":
+        queryset = queryset.filter(**{f"{spec['department_field']}__isnull": True})
+    elif "department" in filters:
+        queryset = queryset.filter(**{spec["department_field"]: filters["department"]})
+    if "status" in filters:
+        queryset = queryset.filter(**{spec["status_field"]: filters["status"]})
+    return queryset
+
+
+def export_rows(dataset, filters):
+    """Iterate the matching rows as tuples, fetched chunk by chunk."""
+    columns = DATASETS[dataset]["columns"]
+    lookups = [lookup for _, lookup in columns]
+    return export_queryset(dataset, filters).values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    # Citizen-entered text that a spreadsheet would run as a formula
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + "\n"
+
+
+def export_lines(dataset, fmt, filters):
+    """The export as an iterator of text lines in `fmt` ("csv" or "ndjson")."""
+    columns = [name for name, _ in DATASETS[dataset]["columns"]]
+    rows = export_rows(dataset, filters)
+    if fmt == "csv":
+        return csv_lines(columns, rows)
+    return ndjson_lines(columns, rows)
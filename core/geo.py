@@ -0,0 +1,116 @@
+import math
+
+EARTH_RADIUS_M = 6371000
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of `precision` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    ch = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits = 0
+            ch = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell at `precision`."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_cell(geohash):
+    """(row, col) of a geohash's cell in the grid of its precision, counted from (-90, -180)."""
+    row = col = 0
+    even = True
+    for char in geohash:
+        bits = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (bits >> shift) & 1
+            if even:
+                col = (col << 1) | bit
+            else:
+                row = (row << 1) | bit
+            even = not even
+    return row, col
+
+
+def cell_center(row, col, precision):
+    """(lat, lng) of the centre of cell (row, col) at `precision`."""
+    height, width = cell_size(precision)
+    return (row + 0.5) * height - 90, (col + 0.5) * width - 180
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres between two coordinates."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lng, radius_m):
+    """(south, west, north, east) box enclosing a circle of `radius_m` metres."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    # Guard against the poles where a degree of longitude shrinks to nothing
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return (
+        max(lat - dlat, -90.0),
+        max(lng - dlng, -180.0),
+        min(lat + dlat, 90.0),
+        min(lng + dlng, 180.0),
+    )
+
+
+def geohash_cover(south, west, north, east, max_cells=16):
+    """
+    Return the geohash prefixes covering a bounding box, using the finest
+    precision that needs no more than `max_cells` cells.
+    """
+    cells = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((south + 90) / height), math.floor((north + 90) / height) + 1)
+        cols = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+        if len(rows) * len(cols) > max_cells:
+            break
+        cells = sorted({
+            # Encode the centre of each cell so float edges can't misplace it
+            geohash_encode(
+                min((r + 0.5) * height - 90, 90.0),
+                min((c + 0.5) * width - 180, 180.0),
+                precision,
+            )
+            for r in rows
+            for c in cols
+        })
+    return cells
@@ -0,0 +1,260 @@
+"""
+Weekly hotspot grids: where each department's issues cluster, week by week.
+
+For every (week, department, status) the located issues created that week
+are counted per finest map cell (core.clusters.CLUSTER_PRECISION, ~150m)
+and spread with a Gaussian kernel of BANDWIDTH_M into a density surface in
+issues per km². Each grid is one HotspotGrid row holding three packed
+arrays: cell ids, issue counts and densities.
+
+The surface is a sum of one kernel per issue, so when a cell gains or loses
+`n` issues the surface changes by `n` kernels around that cell and nowhere
+else. Signals record the cells an issue write touched (HotspotChange), and
+update_hotspots() recounts only those cells and adds or subtracts their
+kernels, leaving the rest of every grid as it was. rebuild_hotspots()
+recomputes everything, after imports and the like.
+"""
+import math
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, DateField, Max
+from django.db.models.functions import Substr, TruncWeek
+from django.utils import timezone
+
+from .clusters import CLUSTER_PRECISION
+from .geo import EARTH_RADIUS_M, cell_center, cell_size, geohash_cell
+from .models import HotspotChange, HotspotGrid, Issue
+
+HOTSPOT_PRECISION = CLUSTER_PRECISION
+BANDWIDTH_M = 250
+KERNEL_REACH = 3  # bandwidths; further out the kernel is ~1% of its peak
+MIN_DENSITY = 1e-3  # issues per km²; anything lower is dropped from storage
+HOTSPOT_FIELDS = ("created_at", "department_id", "status", "geohash")
+
+
+# ---- Keys and storage ----
+
+def week_start(moment):
+    """The Monday of the (local) week `moment` falls in."""
+    day = timezone.localdate(moment)
+    return day - timedelta(days=day.weekday())
+
+
+def hotspot_key(created_at, department_id, status, geohash):
+    """The (week, department_id, status, cell) an issue counts in, or None if it has no location."""
+    if not geohash:
+        return None
+    return week_start(created_at), department_id, status, geohash[:HOTSPOT_PRECISION]
+
+
+def _pack(typecode, values):
+    data = array(typecode, values)
+    if sys.byteorder == "big":
+        data.byteswap()  # stored little-endian whatever the server
+    return data.tobytes()
+
+
+def _unpack(typecode, raw):
+    data = array(typecode)
+    data.frombytes(bytes(raw))
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data
+
+
+def load_grid(grid):
+    """A grid's ({(row, col): count}, {(row, col): density})."""
+    cells = [(cell >> 32, cell & 0xFFFFFFFF) for cell in _unpack("q", grid.cells)]
+    counts = {cell: n for cell, n in zip(cells, _unpack("I", grid.counts)) if n}
+    return counts, dict(zip(cells, _unpack("f", grid.density)))
+
+
+def _save_grid(grid, counts, density):
+    """Store `counts` and `density` on `grid`, or delete it if no issue is left."""
+    if not counts:
+        if grid.pk:
+            grid.delete()
+        return
+    cells = sorted(cell for cell, value in density.items() if value >= MIN_DENSITY or cell in counts)
+    grid.cells = _pack("q", ((row << 32) | col for row, col in cells))
+    grid.counts = _pack("I", (counts.get(cell, 0) for cell in cells))
+    grid.density = _pack("f", (density[cell] for cell in cells))
+    grid.total = sum(counts.values())
+    grid.save()
+
+
+# ---- Kernel density ----
+
+@lru_cache(maxsize=4096)
+def _kernel(row):
+    """(drow, dcol, weight) of the kernel around a cell in `row`; cells narrow away from the equator."""
+    height, width = cell_size(HOTSPOT_PRECISION)
+    lat = cell_center(row, 0, HOTSPOT_PRECISION)[0]
+    height_m = math.radians(height) * EARTH_RADIUS_M
+    width_m = math.radians(width) * EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)
+    reach_m = KERNEL_REACH * BANDWIDTH_M
+    peak = 1e6 / (2 * math.pi * BANDWIDTH_M ** 2)  # per km², so a kernel integrates to one issue
+
+    offsets = []
+    rows, cols = math.ceil(reach_m / height_m), math.ceil(reach_m / width_m)
+    for drow in range(-rows, rows + 1):
+        for dcol in range(-cols, cols + 1):
+            distance2 = (drow * height_m) ** 2 + (dcol * width_m) ** 2
+            if distance2 <= reach_m ** 2:
+                offsets.append((drow, dcol, peak * math.exp(-distance2 / (2 * BANDWIDTH_M ** 2))))
+    return tuple(offsets)
+
+
+def _spread(density, cell, n):
+    """Add `n` issues' kernels around `cell` to `density` (n < 0 takes them away)."""
+    row, col = cell
+    for drow, dcol, weight in _kernel(row):
+        key = (row + drow, col + dcol)
+        density[key] = density.get(key, 0.0) + n * weight
+
+
+# ---- Batch computation ----
+
+def _count_cells(week, department_id, status, geohashes):
+    """{(row, col): issues} of one grid, limited to the cells in `geohashes`."""
+    start = timezone.make_aware(datetime.combine(week, time.min))
+    return {
+        geohash_cell(cell): n
+        for cell, n in Issue.objects.filter(
+            created_at__gte=start, created_at__lt=start + timedelta(days=7),
+            department_id=department_id, status=status,
+        )
+        .exclude(geohash="")
+        .annotate(cell=Substr("geohash", 1, HOTSPOT_PRECISION))
+        .filter(cell__in=geohashes)
+        .values("cell").annotate(n=Count("id")).order_by()
+        .values_list("cell", "n")
+    }
+
+
+def _update_grid(week, department_id, status, geohashes):
+    grid = HotspotGrid.objects.filter(week=week, department_id=department_id, status=status).first()
+    if grid is None:
+        grid = HotspotGrid(week=week, department_id=department_id, status=status)
+        counts, density = {}, {}
+    else:
+        counts, density = load_grid(grid)
+
+    fresh = _count_cells(week, department_id, status, geohashes)
+    for cell in map(geohash_cell, geohashes):
+        n = fresh.get(cell, 0)
+        delta = n - counts.get(cell, 0)
+        if delta:
+            _spread(density, cell, delta)
+            if n:
+                counts[cell] = n
+            else:
+                del counts[cell]
+    _save_grid(grid, counts, density)
+
+
+def update_hotspots():
+    """
+    Recount the cells recorded in HotspotChange since the last run and patch
+    their grids. Returns the number of grids updated.
+    """
+    last = HotspotChange.objects.aggregate(last=Max("id"))["last"]
+    if last is None:
+        return 0
+    # Changes recorded while this runs have higher ids and wait for the next run
+    pending = HotspotChange.objects.filter(id__lte=last)
+    changed = defaultdict(set)
+    for week, department_id, status, cell in (
+        pending.values_list("week", "department_id", "status", "cell").distinct().order_by()
+    ):
+        changed[week, department_id, status].add(cell)
+    with transaction.atomic():
+        for (week, department_id, status), cells in changed.items():
+            _update_grid(week, department_id, status, cells)
+        pending.delete()
+    return len(changed)
+
+
+def rebuild_hotspots():
+    """Recompute every grid from Issue. Returns the number of grids written."""
+    rows = (
+        Issue.objects.exclude(geohash="")
+        .annotate(week=TruncWeek("created_at", output_field=DateField()), cell=Substr("geohash", 1, HOTSPOT_PRECISION))
+        .values("week", "department_id", "status", "cell")
+        .annotate(n=Count("id"))
+        .order_by("week", "department_id", "status")
+    )
+    written = 0
+    with transaction.atomic():
+        last = HotspotChange.objects.aggregate(last=Max("id"))["last"]
+        HotspotChange.objects.filter(id__lte=last or 0).delete()
+        HotspotGrid.objects.all().delete()
+        for (week, department_id, status), group in groupby(
+            rows.iterator(), key=lambda row: (row["week"], row["department_id"], row["status"]),
+        ):
+            counts, density = {}, {}
+            for row in group:
+                cell = geohash_cell(row["cell"])
+                counts[cell] = row["n"]
+                _spread(density, cell, row["n"])
+            _save_grid(HotspotGrid(week=week, department_id=department_id, status=status), counts, density)
+            written += 1
+    return written
+
+
+# ---- Recording changes ----
+
+def record_hotspot_changes(*keys):
+    """Mark the hotspot_key()s in `keys` for recounting on the next run."""
+    keys = {key for key in keys if key is not None}
+    if keys:
+        HotspotChange.objects.bulk_create(
+            HotspotChange(week=week, department_id=department_id, status=status, cell=cell)
+            for week, department_id, status, cell in keys
+        )
+
+
+def record_hotspot_changes_bulk(queryset, **changes):
+    """
+    Record the cells `queryset` leaves and enters once it is ``update()``-d
+    with `changes` (``status`` and/or ``department_id``), or just the ones
+    it leaves when it is about to be deleted (no `changes`).
+    """
+    keys = set()
+    for created_at, department_id, status, geohash in (
+        queryset.exclude(geohash="").values_list("created_at", "department_id", "status", "geohash").order_by()
+    ):
+        old = hotspot_key(created_at, department_id, status, geohash)
+        new = hotspot_key(
+            created_at, changes.get("department_id", department_id), changes.get("status", status), geohash,
+        )
+        if not changes or new != old:
+            keys.add(old)
+        if changes and new != old:
+            keys.add(new)
+    record_hotspot_changes(*keys)
+
+
+# ---- Reading ----
+
+def merge_grids(grids):
+    """The combined ({(row, col): count}, {(row, col): density}) of several grids, e.g. all statuses."""
+    counts, density = defaultdict(int), defaultdict(float)
+    for grid in grids:
+        grid_counts, grid_density = load_grid(grid)
+        for cell, n in grid_counts.items():
+            counts[cell] += n
+        for cell, value in grid_density.items():
+            density[cell] += value
+    return dict(counts), dict(density)
+
+
+def cell_location(cell):
+    """(lat, lng) of the centre of a grid cell."""
+    return cell_center(*cell, HOTSPOT_PRECISION)
@@ -0,0 +1,217 @@
+"""
+Bulk import of legacy complaint records into Issue, for the import_issues
+command.
+
+Each batch is inserted with bulk_create, so the work save() and the Issue
+signals normally do is done here instead:
+- geohash, signature and priority are computed per row;
+- the legacy created_at/updated_at are kept (auto_now is suspended for the
+  insert, see legacy_timestamps);
+- a checkpoint row (ImportBatch) is written in the same transaction;
+- the command rebuilds the report rollups once the import is finished.
+
+Reporters and departments are resolved by name through in-memory maps; the
+ones that don't exist yet are created in bulk. Several worker processes can
+import batches of the same file at once.
+"""
+import csv
+import json
+import time as clock
+from contextlib import contextmanager
+from datetime import datetime, time
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .geo import geohash_encode
+from .models import Department, ImportBatch, Issue, User
+from .priority import issue_priority
+from .similarity import minhash_signature
+
+IMPORT_BATCH_SIZE = 1000
+LOCK_RETRIES = 3  # attempts per batch when the database reports a lock timeout or deadlock
+
+
+def read_records(path, fmt=None):
+    """Yield each record of a CSV or NDJSON file as a dict, streaming."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batches(records, size=IMPORT_BATCH_SIZE):
+    """Number the records into (batch number, list of records) chunks."""
+    batch = []
+    number = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield number, batch
+            number += 1
+            batch = []
+    if batch:
+        yield number, batch
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_float(value):
+    return float(value) if value not in (None, "") else None
+
+
+@contextmanager
+def legacy_timestamps():
+    """
+    Let bulk_create keep the created_at/updated_at set on each Issue instead
+    of stamping the current time. This changes the model fields for the whole
+    process, so it is only for the import command's own process.
+    """
+    fields = [Issue._meta.get_field("created_at"), Issue._meta.get_field("updated_at")]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class NameMap:
+    """
+    name -> id lookup for reporters (by username) or departments (by name),
+    loaded once and topped up in bulk as unknown names appear.
+    """
+
+    def __init__(self, model, field, defaults=None):
+        self.model = model
+        self.field = field
+        self.defaults = defaults or (lambda name: {})
+        self.ids = dict(model.objects.values_list(field, "id"))
+
+    def resolve(self, names):
+        missing = {name for name in names if name and name not in self.ids}
+        if missing:
+            # ignore_conflicts: another worker may be creating the same names
+            self.model.objects.bulk_create(
+                [self.model(**{self.field: name}, **self.defaults(name)) for name in missing],
+                ignore_conflicts=True,
+            )
+            self.ids.update(
+                self.model.objects.filter(**{f"{self.field}__in": missing}).values_list(self.field, "id")
+            )
+        return self.ids
+
+
+def _new_reporter(name):
+    # Legacy reporters can't log in until they reset their password
+    return {"is_citizen": True, "password": make_password(None)}
+
+
+class BatchImporter:
+    """Imports batches of one source; one instance per worker process."""
+
+    def __init__(self, source, batch_size=IMPORT_BATCH_SIZE):
+        self.source = source
+        self.batch_size = batch_size
+        self.reporters = NameMap(User, "username", _new_reporter)
+        self.departments = NameMap(Department, "name")
+        self.statuses = dict(Issue.STATUS_CHOICES)
+
+    def build(self, record, reporter_ids, department_ids):
+        title = (record.get("title") or "").strip()
+        if not title or not record.get("reporter"):
+            raise ValueError("title and reporter are required")
+        status = record.get("status") or Issue.STATUS_REPORTED
+        if status not in self.statuses:
+            raise ValueError(f"Unknown status: {status!r}")
+        latitude = _parse_float(record.get("latitude"))
+        longitude = _parse_float(record.get("longitude"))
+        created_at = _parse_datetime(record.get("created_at")) or timezone.now()
+        description = record.get("description") or ""
+        return Issue(
+            title=title[:200],
+            description=description,
+            reporter_id=reporter_ids[record["reporter"]],
+            department_id=department_ids.get(record.get("department") or None),
+            location=(record.get("location") or "")[:200],
+            latitude=latitude,
+            longitude=longitude,
+            geohash=geohash_encode(latitude, longitude) if latitude is not None and longitude is not None else "",
+            signature=minhash_signature(f"{title} {description}"),
+            status=status,
+            priority=issue_priority(status, 0, created_at),
+            created_at=created_at,
+            updated_at=_parse_datetime(record.get("updated_at")) or created_at,
+        )
+
+    def import_batch(self, number, records):
+        """
+        Import one batch. Returns (created, skipped), or None if this batch
+        was already imported by an earlier run or another worker.
+        """
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                return self._import_batch(number, records)
+            except OperationalError:
+                # Another worker held the lock too long; the batch rolled back as a whole
+                if attempt == LOCK_RETRIES:
+                    raise
+                clock.sleep(attempt)
+
+    def _import_batch(self, number, records):
+        reporter_ids = self.reporters.resolve({r.get("reporter") for r in records})
+        department_ids = self.departments.resolve({r.get("department") for r in records})
+
+        issues = []
+        skipped = 0
+        for record in records:
+            try:
+                issues.append(self.build(record, reporter_ids, department_ids))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+
+        try:
+            with transaction.atomic(), legacy_timestamps():
+                ImportBatch.objects.create(
+                    source=self.source, batch=number, batch_size=self.batch_size, rows=len(issues),
+                )
+                Issue.objects.bulk_create(issues, batch_size=IMPORT_BATCH_SIZE)
+        except IntegrityError:
+            if ImportBatch.objects.filter(source=self.source, batch=number).exists():
+                return None
+            raise
+        return len(issues), skipped
+
+
+# ---- Worker process entry points (multiprocessing needs module-level functions) ----
+
+_worker_importer = None
+
+
+def init_worker(source, batch_size):
+    global _worker_importer
+    _worker_importer = BatchImporter(source, batch_size)
+
+
+def import_batch_in_worker(number, records):
+    return number, _worker_importer.import_batch(number, records)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from core.clusters import rebuild_map_cells
+from core.models import Issue, IssueDailyRollup
+from core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the IssueDailyRollup table used by superadmin_reports, and the MapCell grid "
+        "behind the map tiles, from the Issue table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Compare per-day totals against Issue without rewriting. Exits non-zero on drift.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            written = rebuild_rollups()
+            cells = rebuild_map_cells()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup row(s) and {cells} map cell(s)."))
+            return
+
+        expected = dict(
+            Issue.objects.annotate(d=TruncDate("created_at"))
+            .values("d").annotate(n=Count("id")).order_by()
+            .values_list("d", "n")
+        )
+        stored = {
+            day: n for day, n in
+            IssueDailyRollup.objects.values("day").annotate(n=Sum("count")).order_by()
+            .values_list("day", "n")
+            if n
+        }
+        drifted = sorted(day for day in expected.keys() | stored.keys() if expected.get(day) != stored.get(day))
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rollups match the Issue table."))
+            return
+        for day in drifted[:20]:
+            self.stdout.write(f"{day}: rollup {stored.get(day, 0)}, actual {expected.get(day, 0)}")
+        self.stderr.write(self.style.ERROR(f"{len(drifted)} day(s) have drifted rollups."))
+        raise SystemExit(1)
@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.cache import invalidate_home_block, touch_last_modified
+from core.clusters import rebuild_map_cells
+from core.geo import bounding_box, geohash_encode, haversine_m
+from core.hotspots import rebuild_hotspots
+from core.imports import legacy_timestamps
+from core.models import Issue
+from core.priority import issue_priority
+from core.rollups import rebuild_rollups, rollups_suspended
+from core.similarity import minhash_signature
+
+BENCH_USERNAME = "bench_nearby"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark radius queries through the geohash index against a plain "
+        "latitude/longitude scan, optionally seeding synthetic issues first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Synthetic issues to create before benchmarking.")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--radius", type=float, default=500, help="Search radius in metres.")
+        parser.add_argument("--center", default="9.9312,76.2673", help="lat,lng the synthetic city is centred on.")
+        parser.add_argument("--spread", type=float, default=0.25, help="Half-width of the synthetic city in degrees.")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the synthetic issues afterwards.")
+
+    def handle(self, *args, **options):
+        lat0, lng0 = (float(v) for v in options["center"].split(","))
+        spread = options["spread"]
+        rng = random.Random(42)
+
+        if options["seed"]:
+            self.seed(options["seed"], lat0, lng0, spread, rng)
+
+        points = [
+            (lat0 + rng.uniform(-spread, spread), lng0 + rng.uniform(-spread, spread))
+            for _ in range(options["queries"])
+        ]
+        radius = options["radius"]
+
+        indexed, found = self.time_queries(lambda lat, lng: Issue.objects.near(lat, lng, radius), points)
+        scanned, _ = self.time_queries(lambda lat, lng: self.scan(lat, lng, radius), points)
+
+        self.stdout.write(f"{connection.vendor}: {Issue.objects.count()} issues, "
+                          f"{len(points)} queries, radius {radius:g} m, {found} hits")
+        self.report("geohash index", indexed)
+        self.report("lat/lng scan", scanned)
+
+        if options["cleanup"]:
+            with transaction.atomic():
+                # The per-row signals would subtract every issue from the
+                # rollups one by one; recount once instead, as after seeding
+                with rollups_suspended():
+                    deleted, _ = Issue.objects.filter(reporter__username=BENCH_USERNAME).delete()
+                self.rebuild_derived_data()
+            self.stdout.write(f"Deleted {deleted} synthetic rows.")
+
+    def seed(self, count, lat0, lng0, spread, rng):
+        reporter, _ = get_user_model().objects.get_or_create(username=BENCH_USERNAME)
+        now = timezone.now()
+        batch = []
+        with transaction.atomic():
+            for i in range(count):
+                lat = lat0 + rng.uniform(-spread, spread)
+                lng = lng0 + rng.uniform(-spread, spread)
+                title, description = f"Synthetic issue {i}", "Generated by benchmark_nearby"
+                # bulk_create skips save(), so fill in what it would have
+                batch.append(Issue(
+                    title=title,
+                    description=description,
+                    reporter=reporter,
+                    latitude=lat,
+                    longitude=lng,
+                    geohash=geohash_encode(lat, lng),
+                    signature=minhash_signature(f"{title} {description}"),
+                    priority=issue_priority(Issue.STATUS_REPORTED, 0, now),
+                    created_at=now,
+                    updated_at=now,
+                ))
+            with legacy_timestamps():
+                Issue.objects.bulk_create(batch, batch_size=5000)
+            # ...and the rollup, map and hotspot signals
+            self.rebuild_derived_data()
+        self.stdout.write(f"Seeded {count} synthetic issues.")
+
+    def rebuild_derived_data(self):
+        rebuild_rollups()
+        rebuild_map_cells()
+        rebuild_hotspots()
+        invalidate_home_block()
+        touch_last_modified("feed")
+
+    def scan(self, lat, lng, radius):
+        south, west, north, east = bounding_box(lat, lng, radius)
+        candidates = Issue.objects.filter(
+            latitude__range=(south, north),
+            longitude__range=(west, east),
+        )
+        return [i for i in candidates if haversine_m(lat, lng, i.latitude, i.longitude) <= radius]
+
+    def time_queries(self, query, points):
+        timings = []
+        found = 0
+        for lat, lng in points:
+            start = time.perf_counter()
+            found += len(query(lat, lng))
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings, found
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"  {label:<14} p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.hotspots import rebuild_hotspots, update_hotspots
+from core.models import HotspotGrid
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the weekly hotspot grids behind department_hotspots up to date, recomputing only "
+        "the cells whose issues changed since the last run. Meant to run from cron, e.g. hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every grid from scratch (done anyway on the first run).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options["full"] or not HotspotGrid.objects.exists():
+            written = rebuild_hotspots()
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {written} hotspot grid(s) in {time.monotonic() - started:.1f}s."
+            ))
+            return
+
+        updated = update_hotspots()
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} hotspot grid(s) in {time.monotonic() - started:.1f}s."
+        ))
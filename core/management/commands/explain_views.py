@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.explain import SMALL_TABLES, check_views
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every query of the hot views (see core/explain.py) and flag "
+        "the ones that fall back to a full table scan or a sort without an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plans", action="store_true", help="Print every plan, not only the flagged ones.")
+        parser.add_argument(
+            "--ignore", action="append", default=[], metavar="TABLE",
+            help="Also accept full scans of this table (repeatable).",
+        )
+        parser.add_argument("--strict", action="store_true", help="Exit with an error if anything is flagged.")
+
+    def handle(self, *args, **options):
+        flagged = checked = 0
+        try:
+            for label, url, sql, plan, problems, known in check_views(
+                ignore_tables=SMALL_TABLES | set(options["ignore"])
+            ):
+                checked += 1
+                if problems and not known:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(f"{label} ({url}): {', '.join(problems)}"))
+                elif options["plans"]:
+                    self.stdout.write(f"{label} ({url}): " + (f"known, {known}" if problems else "ok"))
+                else:
+                    continue
+                self.stdout.write(f"  {sql}")
+                for line in plan:
+                    self.stdout.write(f"    {line}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        summary = f"{checked} queries checked, {flagged} flagged."
+        if flagged and options["strict"]:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary) if not flagged else summary)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import DATASETS, EXPORT_FORMATS, export_lines, parse_filters
+
+
+class Command(BaseCommand):
+    help = "Stream issues, votes, comments or the daily status report as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(DATASETS))
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--start", help="First day to include (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument("--department", help="Department id, or 'none' for unassigned issues.")
+        parser.add_argument("--status", help="Only issues with this status.")
+        parser.add_argument("--output", "-o", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options)
+        except ValueError as e:
+            raise CommandError(e)
+
+        lines = export_lines(options["dataset"], options["format"], filters)
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as f:
+                written = sum(1 for line in lines if f.write(line) is not None)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {written} line(s) to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.cache import invalidate_home_block, touch_last_modified
+from core.clusters import rebuild_map_cells
+from core.hotspots import rebuild_hotspots
+from core.imports import (
+    IMPORT_BATCH_SIZE, BatchImporter, batches, import_batch_in_worker, init_worker, read_records,
+)
+from core.models import ImportBatch
+from core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Import legacy complaint records (CSV or NDJSON) into Issue in batches. "
+        "Columns: title, description, reporter, department, status, location, "
+        "latitude, longitude, created_at, updated_at. Re-running resumes after "
+        "the last imported batch, with the same batch size. Report rollups are "
+        "rebuilt at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Default: from the file extension.")
+        parser.add_argument(
+            "--source",
+            help="Checkpoint name for this file (default: its file name). Reuse it to resume.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int,
+            help=f"Rows per batch (default: {IMPORT_BATCH_SIZE}, or the size already used when resuming).",
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Parallel worker processes.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        source = options["source"] or os.path.basename(path)
+        workers = max(options["workers"], 1)
+
+        checkpoints = ImportBatch.objects.filter(source=source)
+        batch_size = self.resume_batch_size(source, checkpoints, options["batch_size"])
+        done = set(checkpoints.values_list("batch", flat=True))
+        if done:
+            self.stdout.write(f"Resuming {source}: {len(done)} batch(es) of {batch_size} rows already imported.")
+        todo = (
+            (number, records)
+            for number, records in batches(read_records(path, options["format"]), batch_size)
+            if number not in done
+        )
+
+        self.started = time.monotonic()
+        self.created = self.skipped = 0
+        if workers == 1:
+            importer = BatchImporter(source, batch_size)
+            for number, records in todo:
+                self.report(number, importer.import_batch(number, records))
+        else:
+            self.run_parallel(source, batch_size, todo, workers)
+
+        # bulk_create skipped the rollup, map and hotspot signals; recount once for the whole import
+        rebuild_rollups()
+        rebuild_map_cells()
+        rebuild_hotspots()
+        invalidate_home_block()
+        touch_last_modified("feed")
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.created} issue(s), skipped {self.skipped} invalid row(s) "
+            f"in {elapsed:.1f}s ({self.created / max(elapsed, 1e-9):.0f} rows/s)."
+        ))
+
+    def resume_batch_size(self, source, checkpoints, requested):
+        """
+        The batch size to import `source` with. Batch numbers only name the
+        same rows at the same size, so a resume must keep the size it
+        started with.
+        """
+        if requested is not None and requested < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        sizes = set(checkpoints.exclude(batch_size=None).values_list("batch_size", flat=True))
+        if len(sizes) > 1:
+            raise CommandError(
+                f"{source} was imported with several batch sizes ({', '.join(map(str, sorted(sizes)))}); "
+                "its checkpoints can't be resumed. Import under a new --source after removing its issues."
+            )
+        if sizes:
+            (used,) = sizes
+            if requested is not None and requested != used:
+                raise CommandError(
+                    f"{source} was imported in batches of {used} rows; resume it with --batch-size {used}."
+                )
+            return used
+        return requested or IMPORT_BATCH_SIZE
+
+    def run_parallel(self, source, batch_size, todo, workers):
+        # Children open their own connections; never share the parent's
+        connections.close_all()
+        with multiprocessing.get_context("fork").Pool(workers, init_worker, (source, batch_size)) as pool:
+            # Keep a bounded number of batches in flight so the file is read
+            # no faster than it is imported
+            pending = deque()
+            for number, records in todo:
+                pending.append(pool.apply_async(import_batch_in_worker, (number, records)))
+                if len(pending) >= workers * 2:
+                    self.report(*pending.popleft().get())
+            while pending:
+                self.report(*pending.popleft().get())
+
+    def report(self, number, result):
+        if result is None:
+            self.stdout.write(f"Batch {number}: already imported, skipped.")
+            return
+        created, skipped = result
+        self.created += created
+        self.skipped += skipped
+        rate = self.created / max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(f"Batch {number}: {created} imported, {skipped} skipped ({rate:.0f} rows/s overall).")
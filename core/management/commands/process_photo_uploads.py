@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import process_pending_uploads
+
+
+class Command(BaseCommand):
+    help = "Upload staged issue photos to the photo backend, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10, help="Uploads to attempt per pass.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when idle.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when idle in --loop mode.")
+
+    def handle(self, *args, **options):
+        while True:
+            uploaded, failed = process_pending_uploads(limit=options["batch"])
+            if uploaded or failed:
+                self.stdout.write(f"Uploaded {uploaded}, failed {failed}.")
+            if not options["loop"]:
+                break
+            if not (uploaded or failed):
+                time.sleep(options["interval"])
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.models import Issue, Vote
+from core.priority import VOTE_WEIGHT
+
+
+def actual_vote_count():
+    """Subquery counting the Vote rows of the outer Issue."""
+    counts = (
+        Vote.objects.filter(issue=OuterRef("pk"))
+        .order_by()
+        .values("issue")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = "Check Issue.vote_count against the Vote table and rebuild it where it drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drifted issues, don't fix them. Exits non-zero on drift.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = (
+            Issue.objects.annotate(actual=actual_vote_count())
+            .exclude(vote_count=F("actual"))
+        )
+
+        if options["check"]:
+            rows = list(drifted.values_list("id", "vote_count", "actual")[:20])
+            if not rows:
+                self.stdout.write(self.style.SUCCESS("All vote counts match."))
+                return
+            for issue_id, stored, actual in rows:
+                self.stdout.write(f"Issue {issue_id}: stored {stored}, actual {actual}")
+            self.stderr.write(self.style.ERROR(f"{drifted.count()} issue(s) have a drifted vote count."))
+            raise SystemExit(1)
+
+        with transaction.atomic():
+            fixed = (
+                Issue.objects.filter(pk__in=drifted.values("pk"))
+                .update(
+                    # priority carries VOTE_WEIGHT per vote, so shift it by the correction
+                    priority=F("priority") + (actual_vote_count() - F("vote_count")) * VOTE_WEIGHT,
+                    vote_count=actual_vote_count(),
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt vote count for {fixed} issue(s)."))
@@ -0,0 +1,199 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import invalidate_home_block, touch_last_modified
+from core.clusters import rebuild_map_cells
+from core.hotspots import rebuild_hotspots
+from core.geo import geohash_encode
+from core.imports import legacy_timestamps
+from core.models import Comment, Department, Issue, User, Vote, comment_path_segment
+from core.priority import issue_priority
+from core.rollups import rebuild_rollups
+from core.similarity import minhash_signature
+
+SEED_PREFIX = "seed_"
+SEED_PASSWORD = "seed-password"  # every seeded account, for logging in while benchmarking
+DEPARTMENT_NAMES = [
+    "Roads & Transportation",
+    "Sanitation & Waste Management",
+    "Public Safety",
+    "Water & Sewage",
+    "Parks & Recreation",
+    "Electricity & Utilities",
+    "Environmental Services",
+    "Public Works",
+]
+PROBLEMS = [
+    ("Pothole", "Deep pothole in the middle of the lane, two-wheelers keep swerving"),
+    ("Garbage pile", "Uncollected garbage has been piling up for a week and smells"),
+    ("Streetlight out", "The streetlight has not worked for days, the road is dark at night"),
+    ("Water leak", "Drinking water pipe leaking onto the road since morning"),
+    ("Blocked drain", "Drain is blocked and overflows every time it rains"),
+    ("Fallen tree", "A tree fell across the footpath after the storm"),
+    ("Broken footpath", "Footpath slabs are broken, elderly people keep tripping"),
+    ("Illegal dumping", "Construction debris dumped on the roadside overnight"),
+]
+PLACES = ["MG Road", "Market Junction", "Bus Stand", "Temple Street", "Ward 12", "Railway Colony", "Beach Road"]
+REPLIES = ["Same problem here.", "Reported this last month too.", "Any update?", "Thanks for raising this.",
+           "It got worse today.", "The ward office says it is scheduled."]
+MAX_COMMENT_DEPTH = 6
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, departments, issues, votes and "
+        "threaded comments. Seeded usernames start with 'seed_'; their password is "
+        f"'{SEED_PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--issues", type=int, default=1000)
+        parser.add_argument("--votes", type=float, default=3.0, help="Average votes per issue.")
+        parser.add_argument("--comments", type=float, default=2.0, help="Average comments per issue.")
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiply --users and --issues.")
+        parser.add_argument("--days", type=int, default=365, help="Spread issues over this many past days.")
+        parser.add_argument("--center", default="9.9312,76.2673", help="lat,lng the synthetic city is centred on.")
+        parser.add_argument("--spread", type=float, default=0.1, help="Half-width of the city in degrees.")
+        parser.add_argument("--random-seed", type=int, default=42)
+        parser.add_argument("--flush", action="store_true", help="Delete earlier seeded data first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["random_seed"])
+        started = time.monotonic()
+        if options["flush"]:
+            deleted, _ = User.objects.filter(username__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f"Flushed {deleted} seeded row(s).")
+
+        with transaction.atomic():
+            departments = self.seed_departments()
+            citizens, resolvers, admin = self.seed_users(round(options["users"] * options["scale"]), departments)
+            issues = self.seed_issues(round(options["issues"] * options["scale"]), citizens, departments, rng, options)
+            votes = self.seed_votes(issues, citizens, rng)
+            comments = self.seed_comments(issues, citizens + resolvers, options["comments"], rng)
+            rebuild_rollups()
+            rebuild_map_cells()
+            rebuild_hotspots()
+        invalidate_home_block()
+        touch_last_modified("feed")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(citizens)} citizens, {len(resolvers)} resolvers, {len(issues)} issues, "
+            f"{votes} votes and {comments} comments in {time.monotonic() - started:.1f}s. "
+            f"Superadmin: {admin.username}"
+        ))
+
+    def seed_departments(self):
+        for name in DEPARTMENT_NAMES:
+            Department.objects.get_or_create(name=name)
+        return list(Department.objects.filter(name__in=DEPARTMENT_NAMES))
+
+    def seed_users(self, count, departments):
+        password = make_password(SEED_PASSWORD)  # hash once, share across accounts
+        existing = User.objects.filter(username__startswith=SEED_PREFIX).count()
+        citizens = [
+            User(username=f"{SEED_PREFIX}citizen{existing + i}", password=password, is_citizen=True)
+            for i in range(count)
+        ]
+        resolvers = [
+            User(username=f"{SEED_PREFIX}resolver{existing + i}", password=password, is_resolver=True)
+            for i in range(len(departments))
+        ]
+        User.objects.bulk_create(citizens + resolvers, batch_size=1000)
+        for department, resolver in zip(departments, resolvers):
+            department.users.add(resolver)
+
+        admin, created = User.objects.get_or_create(
+            username=f"{SEED_PREFIX}admin",
+            defaults={"password": password, "is_superuser": True, "is_staff": True},
+        )
+        return citizens, resolvers, admin
+
+    def seed_issues(self, count, citizens, departments, rng, options):
+        lat0, lng0 = (float(v) for v in options["center"].split(","))
+        spread = options["spread"]
+        now = timezone.now()
+        issues = []
+        for i in range(count):
+            title, description = rng.choice(PROBLEMS)
+            title = f"{title} near {rng.choice(PLACES)}"
+            # A few hotspots get most of the reports
+            if rng.random() < 0.6:
+                lat = lat0 + rng.gauss(0, spread / 10)
+                lng = lng0 + rng.gauss(0, spread / 10)
+            else:
+                lat = lat0 + rng.uniform(-spread, spread)
+                lng = lng0 + rng.uniform(-spread, spread)
+            status = rng.choices(
+                [Issue.STATUS_REPORTED, Issue.STATUS_ACKNOWLEDGED, Issue.STATUS_IN_PROGRESS, Issue.STATUS_RESOLVED],
+                weights=[4, 2, 2, 3],
+            )[0]
+            created_at = now - timedelta(days=rng.uniform(0, options["days"]))
+            # Long-tailed: most issues get a couple of votes, a few go viral
+            votes = min(int(rng.paretovariate(1.5) * options["votes"] / 3), len(citizens))
+            issues.append(Issue(
+                title=title,
+                description=description,
+                reporter=rng.choice(citizens),
+                department=None if status == Issue.STATUS_REPORTED else rng.choice(departments),
+                location=rng.choice(PLACES),
+                latitude=lat,
+                longitude=lng,
+                geohash=geohash_encode(lat, lng),
+                signature=minhash_signature(f"{title} {description}"),
+                status=status,
+                vote_count=votes,
+                priority=issue_priority(status, votes, created_at),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        with legacy_timestamps():
+            return Issue.objects.bulk_create(issues, batch_size=1000)
+
+    def seed_votes(self, issues, citizens, rng):
+        votes = [
+            Vote(user=user, issue=issue)
+            for issue in issues
+            for user in rng.sample(citizens, issue.vote_count)
+        ]
+        Vote.objects.bulk_create(votes, batch_size=2000)
+        return len(votes)
+
+    def seed_comments(self, issues, authors, average, rng):
+        # Build each thread in memory, then insert level by level so every
+        # parent has its id (and path) before its replies are written
+        levels = [[] for _ in range(MAX_COMMENT_DEPTH + 1)]
+        for issue in issues:
+            thread = []
+            for _ in range(round(rng.expovariate(1 / average)) if average else 0):
+                parent = rng.choice(thread) if thread and rng.random() < 0.6 else None
+                depth = parent[1] + 1 if parent else 0
+                if depth > MAX_COMMENT_DEPTH:
+                    parent, depth = None, 0
+                comment = Comment(
+                    issue=issue,
+                    user=rng.choice(authors),
+                    content=rng.choice(REPLIES),
+                    parent=parent[0] if parent else None,
+                )
+                thread.append((comment, depth))
+                levels[depth].append(comment)
+
+        total = 0
+        for level in levels:
+            if not level:
+                continue
+            Comment.objects.bulk_create(level, batch_size=2000)
+            for comment in level:
+                parent = comment.parent
+                comment.thread_id = parent.thread_id if parent else comment.pk
+                comment.path = (parent.path if parent else "") + comment_path_segment(comment.pk)
+            Comment.objects.bulk_update(level, ["thread", "path"], batch_size=1000)
+            total += len(level)
+        return total
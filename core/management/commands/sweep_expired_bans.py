@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.models import User
+from core.moderation import sweep_expired_bans
+
+
+class Command(BaseCommand):
+    help = "Lift every ban whose banned_until has passed. Meant to run from cron, e.g. hourly."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the expired bans, don't lift them.",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            expired = User.objects.expired_bans().count()
+            self.stdout.write(f"{expired} expired ban(s) would be lifted.")
+            return
+
+        lifted = sweep_expired_bans()
+        self.stdout.write(self.style.SUCCESS(f"Lifted {lifted} expired ban(s)."))
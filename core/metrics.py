@@ -0,0 +1,271 @@
+"""
+Request metrics: per-view latency histograms, database query counts and
+time, slow-query samples and cache hit rates, for the superadmin metrics
+page and the Prometheus endpoint.
+
+RequestMetricsMiddleware times every request, which costs two clock reads.
+Only a sample of requests (settings.METRICS_SAMPLE_RATE) also has its
+queries counted and timed through a database execute wrapper; the query
+figures are therefore per sampled request. A query slower than
+settings.METRICS_SLOW_QUERY_MS is kept with the application frames that
+issued it.
+
+Like the in-memory event broker, the registry lives in the process that
+serves the request: each worker reports its own traffic.
+"""
+import bisect
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+# Upper bounds in seconds, as in Prometheus' default buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_SAMPLES = 50
+SLOW_QUERY_SQL_CHARS = 500
+ORIGIN_FRAMES = 3
+
+
+def sample_rate():
+    return getattr(settings, "METRICS_SAMPLE_RATE", 0.1)
+
+
+def slow_query_seconds():
+    return getattr(settings, "METRICS_SLOW_QUERY_MS", 100) / 1000
+
+
+class ViewStats:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0  # 5xx responses
+        self.sampled = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.query_seconds = 0.0
+
+    def quantile(self, q):
+        """Estimate a latency quantile from the histogram, in seconds."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if seen + n >= rank and n:
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}  # view name -> ViewStats
+            self.cache = {}  # cache name -> [hits, misses]
+            self.slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+            self.started_at = timezone.now()
+
+    def record_request(self, view, seconds, status, queries=None, query_seconds=0.0):
+        with self._lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            if status >= 500:
+                stats.errors += 1
+            if queries is not None:
+                stats.sampled += 1
+                stats.queries += queries
+                stats.max_queries = max(stats.max_queries, queries)
+                stats.query_seconds += query_seconds
+
+    def record_cache(self, name, hit):
+        with self._lock:
+            counts = self.cache.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def record_slow_query(self, sql, seconds, view, origin):
+        with self._lock:
+            self.slow_queries.appendleft({
+                "sql": sql[:SLOW_QUERY_SQL_CHARS],
+                "ms": round(seconds * 1000, 1),
+                "view": view,
+                "origin": origin,
+                "at": timezone.now(),
+            })
+
+    def snapshot(self):
+        """Plain rows for the metrics page, slowest views (by total time) first."""
+        with self._lock:
+            views = []
+            for name, s in self.views.items():
+                p50, p95 = s.quantile(0.5), s.quantile(0.95)
+                views.append({
+                    "view": name,
+                    "requests": s.count,
+                    "errors": s.errors,
+                    "total_s": round(s.seconds, 2),
+                    "avg_ms": round(1000 * s.seconds / s.count, 1),
+                    "p50_ms": round(1000 * p50, 1),
+                    "p95_ms": round(1000 * p95, 1),
+                    "sampled": s.sampled,
+                    "avg_queries": round(s.queries / s.sampled, 1) if s.sampled else None,
+                    "max_queries": s.max_queries if s.sampled else None,
+                    "avg_db_ms": round(1000 * s.query_seconds / s.sampled, 1) if s.sampled else None,
+                })
+            caches = [
+                {
+                    "cache": name,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(100 * hits / (hits + misses), 1) if hits + misses else None,
+                }
+                for name, (hits, misses) in sorted(self.cache.items())
+            ]
+            return {
+                "views": sorted(views, key=lambda v: v["total_s"], reverse=True),
+                "caches": caches,
+                "slow_queries": list(self.slow_queries),
+                "started_at": self.started_at,
+            }
+
+    def prometheus_text(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP civicfix_{name} {help_text}")
+            lines.append(f"# TYPE civicfix_{name} {kind}")
+
+        with self._lock:
+            views = sorted(self.views.items())
+            family("request_duration_seconds", "histogram", "Request latency by view.")
+            for name, s in views:
+                label = f'view="{_escape(name)}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), s.buckets):
+                    cumulative += n
+                    lines.append(f'civicfix_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"civicfix_request_duration_seconds_sum{{{label}}} {s.seconds}")
+                lines.append(f"civicfix_request_duration_seconds_count{{{label}}} {s.count}")
+
+            family("request_errors_total", "counter", "Responses with a 5xx status, by view.")
+            for name, s in views:
+                lines.append(f'civicfix_request_errors_total{{view="{_escape(name)}"}} {s.errors}')
+            family("sampled_requests_total", "counter", "Requests whose queries were instrumented, by view.")
+            for name, s in views:
+                lines.append(f'civicfix_sampled_requests_total{{view="{_escape(name)}"}} {s.sampled}')
+            family("db_queries_total", "counter", "Queries run by sampled requests, by view.")
+            for name, s in views:
+                lines.append(f'civicfix_db_queries_total{{view="{_escape(name)}"}} {s.queries}')
+            family("db_query_seconds_total", "counter", "Time spent in queries by sampled requests, by view.")
+            for name, s in views:
+                lines.append(f'civicfix_db_query_seconds_total{{view="{_escape(name)}"}} {s.query_seconds}')
+
+            family("cache_requests_total", "counter", "Application cache lookups by cache and result.")
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'civicfix_cache_requests_total{{cache="{_escape(name)}",result="hit"}} {hits}')
+                lines.append(f'civicfix_cache_requests_total{{cache="{_escape(name)}",result="miss"}} {misses}')
+
+        family("metrics_sample_rate", "gauge", "Share of requests whose queries are instrumented.")
+        lines.append(f"civicfix_metrics_sample_rate {sample_rate()}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+def record_cache(name, hit):
+    registry.record_cache(name, hit)
+
+
+def _query_origin():
+    """The innermost application frames on the stack, as "file:line in function"."""
+    root = str(settings.BASE_DIR) + os.sep
+    frames = [
+        f for f in traceback.extract_stack()
+        if f.filename.startswith(root) and "site-packages" not in f.filename
+        and not f.filename.endswith((os.path.join("core", "metrics.py"), "manage.py"))
+    ]
+    return " < ".join(
+        f"{os.path.relpath(f.filename, root)}:{f.lineno} in {f.name}"
+        for f in reversed(frames[-ORIGIN_FRAMES:])
+    )
+
+
+class QueryTracker:
+    """Database execute wrapper counting and timing the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = []  # (sql, seconds, origin); the view is only known once the URL is resolved
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed >= slow_query_seconds():
+                self.slow.append((sql, elapsed, _query_origin()))
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "<unresolved>"
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """Times every request; instruments the queries of a sampled share of them."""
+
+    def process_request(self, request):
+        request._metrics_started = time.perf_counter()
+        if random.random() < sample_rate():
+            tracker = QueryTracker()
+            stack = ExitStack()
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            request._metrics_queries = (tracker, stack)
+
+    def process_response(self, request, response):
+        started = getattr(request, "_metrics_started", None)
+        if started is None:
+            return response
+        view = _view_name(request)
+        queries = getattr(request, "_metrics_queries", None)
+        if queries is None:
+            registry.record_request(view, time.perf_counter() - started, response.status_code)
+            return response
+
+        tracker, stack = queries
+        stack.close()
+        registry.record_request(
+            view, time.perf_counter() - started, response.status_code, tracker.count, tracker.seconds,
+        )
+        for sql, seconds, origin in tracker.slow:
+            registry.record_slow_query(sql, seconds, view, origin)
+        return response
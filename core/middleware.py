@@ -0,0 +1,92 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth, messages
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, logout
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .cache import get_principal, principal_user
+from .models import User
+
+
+def get_cached_user(request):
+    """
+    The signed-in user, built from the cached principal (see
+    core.cache.get_principal) instead of the User table. Anything unusual
+    — an unknown backend, a deleted or deactivated user, a session hash
+    that doesn't match — goes through Django's own lookup, which also
+    flushes the session when it must.
+    """
+    try:
+        user_id = User._meta.pk.to_python(request.session[SESSION_KEY])
+        backend = request.session[BACKEND_SESSION_KEY]
+    except (KeyError, ValidationError):
+        return AnonymousUser()
+
+    principal = get_principal(user_id) if backend in settings.AUTHENTICATION_BACKENDS else None
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if (
+        principal is None or not principal["fields"]["is_active"]
+        or not session_hash or not constant_time_compare(session_hash, principal["session_hash"])
+    ):
+        user = auth.get_user(request)
+        if not user.is_authenticated:
+            return user
+        principal = get_principal(user.pk)
+    user = principal_user(principal)
+    user.backend = backend
+    return user
+
+
+def _get_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = get_cached_user(request)
+    return request._cached_user
+
+
+async def _auser(request):
+    if not hasattr(request, "_acached_user"):
+        request._acached_user = await sync_to_async(get_cached_user)(request)
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware that sets request.user from the cached
+    principal. With the cached_db session engine a typical signed-in
+    request then reads neither the session nor the user from the database.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)  # keeps Django's configuration checks
+        request.user = SimpleLazyObject(partial(_get_user, request))
+        request.auser = partial(_auser, request)
+
+
+class BanEnforcementMiddleware(MiddlewareMixin):
+    """
+    Log out users who are banned while already signed in.
+
+    custom_login only stops banned users at the door; this catches sessions
+    that were open when the ban landed. The ban state comes with the cached
+    principal, so the check adds no query to the request.
+    """
+
+    def process_request(self, request):
+        user = request.user
+        if user.is_authenticated and user.is_currently_banned():
+            days_left = (user.banned_until - timezone.now()).days
+            logout(request)
+            messages.error(
+                request,
+                f"🚫 Your account is banned for {days_left} more days for reporting a fake issue."
+            )
+            return redirect('login')
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:45
+
+import cloudinary.models
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_count(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    Vote = apps.get_model('core', 'Vote')
+    counts = (
+        Vote.objects.filter(issue=OuterRef('pk'))
+        .order_by()
+        .values('issue')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    Issue.objects.update(
+        vote_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_banned_until_user_is_banned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='vote_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_vote_count, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='issue',
+            name='photo',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='images'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+from core.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    located = Issue.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for issue in located.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        issue.geohash = geohash_encode(issue.latitude, issue.longitude)
+        batch.append(issue)
+        if len(batch) >= 2000:
+            Issue.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Issue.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_issue_vote_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+from core.similarity import minhash_signature
+
+
+def backfill_signature(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    batch = []
+    for issue in Issue.objects.only('id', 'title', 'description').iterator(chunk_size=2000):
+        issue.signature = minhash_signature(f"{issue.title} {issue.description}")
+        batch.append(issue)
+        if len(batch) >= 2000:
+            Issue.objects.bulk_update(batch, ['signature'])
+            batch = []
+    Issue.objects.bulk_update(batch, ['signature'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_issue_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='signature',
+            field=models.CharField(blank=True, default='', editable=False, max_length=256),
+        ),
+        migrations.RunPython(backfill_signature, migrations.RunPython.noop),
+    ]
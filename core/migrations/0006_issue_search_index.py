@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from core import search
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'postgresql': search.POSTGRES_SETUP,
+        'sqlite': search.SQLITE_SETUP,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {
+        'postgresql': search.POSTGRES_TEARDOWN,
+        'sqlite': search.SQLITE_TEARDOWN,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_issue_signature'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
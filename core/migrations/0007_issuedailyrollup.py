@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    IssueDailyRollup = apps.get_model('core', 'IssueDailyRollup')
+    grouped = (
+        Issue.objects.annotate(day=TruncDate('created_at'))
+        .values('day', 'status', 'department_id', 'reporter_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    IssueDailyRollup.objects.bulk_create(
+        (IssueDailyRollup(**row) for row in grouped.iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_issue_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('acknowledged', 'Acknowledged'), ('in_progress', 'In Progress'), ('resolved', 'Resolved')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.department')),
+                ('reporter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'status'], name='core_issued_day_18c680_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status', 'department', 'reporter'), name='unique_issue_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Comment = apps.get_model('core', 'Comment')
+    # Parents always have lower ids than their replies
+    paths = {}
+    threads = {}
+    batch = []
+    for comment in Comment.objects.only('id', 'parent_id').order_by('id').iterator(chunk_size=2000):
+        segment = "%010x/" % comment.id
+        if comment.parent_id:
+            comment.path = paths[comment.parent_id] + segment
+            comment.thread_id = threads[comment.parent_id]
+        else:
+            comment.path = segment
+            comment.thread_id = comment.id
+        paths[comment.id] = comment.path
+        threads[comment.id] = comment.thread_id
+        batch.append(comment)
+        if len(batch) >= 2000:
+            Comment.objects.bulk_update(batch, ['path', 'thread'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['path', 'thread'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_issuedailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.comment'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
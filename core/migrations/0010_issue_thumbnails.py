@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_photoupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+from core.priority import issue_priority
+
+
+def backfill_priority(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    batch = []
+    for issue in Issue.objects.only('id', 'status', 'vote_count', 'created_at').iterator(chunk_size=2000):
+        issue.priority = issue_priority(issue.status, issue.vote_count, issue.created_at)
+        batch.append(issue)
+        if len(batch) >= 2000:
+            Issue.objects.bulk_update(batch, ['priority'])
+            batch = []
+    Issue.objects.bulk_update(batch, ['priority'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='priority',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.RunPython(backfill_priority, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['department', '-priority', '-id'], name='issue_dept_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_issue_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('batch', models.PositiveIntegerField()),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'batch'), name='unique_import_batch')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_importbatch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='issue',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['issue', 'created_at', 'id'], name='comment_thread_roots_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['issue', 'path'], name='comment_issue_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['-created_at', '-id'], name='issue_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='issue_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['department', '-created_at', '-id'], name='issue_dept_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('department__isnull', True)), fields=['-created_at', '-id'], name='issue_unassigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['-vote_count', '-created_at', '-id'], name='issue_votes_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['reporter', '-created_at'], name='issue_reporter_created_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:43
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Substr
+
+
+def backfill_map_cells(apps, schema_editor):
+    Issue = apps.get_model('core', 'Issue')
+    MapCell = apps.get_model('core', 'MapCell')
+    for precision in range(1, 8):
+        grouped = (
+            Issue.objects.exclude(geohash='')
+            .annotate(cell=Substr('geohash', 1, precision))
+            .values('cell', 'status')
+            .annotate(count=Count('id'), lat_sum=Sum('latitude'), lng_sum=Sum('longitude'))
+            .order_by()
+        )
+        MapCell.objects.bulk_create(
+            (MapCell(precision=precision, **row) for row in grouped.iterator()),
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_hot_view_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('cell', models.CharField(max_length=12)),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('acknowledged', 'Acknowledged'), ('in_progress', 'In Progress'), ('resolved', 'Resolved')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('lat_sum', models.FloatField(default=0.0)),
+                ('lng_sum', models.FloatField(default=0.0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['precision', 'cell'], name='mapcell_precision_cell_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cell', 'status'), name='unique_map_cell')],
+            },
+        ),
+        migrations.RunPython(backfill_map_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_mapcell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotspotChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('acknowledged', 'Acknowledged'), ('in_progress', 'In Progress'), ('resolved', 'Resolved')], max_length=20)),
+                ('cell', models.CharField(max_length=12)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.department')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HotspotGrid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('acknowledged', 'Acknowledged'), ('in_progress', 'In Progress'), ('resolved', 'Resolved')], max_length=20)),
+                ('cells', models.BinaryField(default=bytes)),
+                ('counts', models.BinaryField(default=bytes)),
+                ('density', models.BinaryField(default=bytes)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.department')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['department', 'week'], name='hotspot_dept_week_idx')],
+                'constraints': [models.UniqueConstraint(fields=('week', 'department', 'status'), name='unique_hotspot_grid')],
+            },
+        ),
+    ]
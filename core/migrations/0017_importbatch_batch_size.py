@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_hotspots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='batch_size',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:49
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_importbatch_batch_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photoupload',
+            name='photo',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='images'),
+        ),
+        migrations.AddField(
+            model_name='photoupload',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,10 +1,38 @@
 from cloudinary.models import CloudinaryField
 from datetime import timedelta
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
 from django.core.validators import FileExtensionValidator
 from django.conf import settings
 from django.db import models
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.functions import Now
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .geo import bounding_box, geohash_cover, geohash_encode, haversine_m
+from .priority import issue_priority, status_change_expression
+from .search import search_issues
+from .similarity import minhash_signature, signature_similarity
+
+DUPLICATE_RADIUS_M = 150
+DUPLICATE_THRESHOLD = 0.3
+
+class UserQuerySet(models.QuerySet):
+    def currently_banned(self):
+        return self.filter(is_banned=True, banned_until__gt=Now())
+
+    def expired_bans(self):
+        return self.filter(is_banned=True, banned_until__lte=Now())
+
+    def with_ban_state(self):
+        """Annotate ``ban_active``, evaluated by the database at query time."""
+        return self.annotate(ban_active=ExpressionWrapper(
+            Q(is_banned=True, banned_until__gt=Now()),
+            output_field=BooleanField(),
+        ))
+
+class UserManager(AuthUserManager.from_queryset(UserQuerySet)):
+    pass
 
 class User(AbstractUser):
     is_citizen = models.BooleanField(default=False)
@@ -33,6 +61,8 @@ class User(AbstractUser):
     is_banned = models.BooleanField(default=False)
     banned_until = models.DateTimeField(null=True, blank=True)
 
+    objects = UserManager()
+
     def ban(self, days=7):
         """Ban user for given number of days (default = 7)."""
         self.is_banned = True
@@ -46,14 +76,21 @@ class User(AbstractUser):
         self.save()
 
     def is_currently_banned(self):
-        """Check if user is still banned (auto-unban if expired)."""
-        if self.is_banned and self.banned_until:
-            if timezone.now() >= self.banned_until:
-                # Auto unban if ban expired
-                self.unban()
-                return False
-            return True
-        return False
+        """
+        Check if user is still banned. Read-only: expired bans are cleared
+        in bulk by the sweep_expired_bans command.
+        """
+        return bool(self.is_banned and self.banned_until and timezone.now() < self.banned_until)
+
+    # 🔹 Role lookups; on request.user they come filled in from the cached principal (core.cache)
+
+    @cached_property
+    def department_ids(self):
+        return list(self.departments.values_list("id", flat=True))
+
+    @cached_property
+    def admin_department_id(self):
+        return Department.objects.filter(admin=self).values_list("id", flat=True).first()
     
 class Department(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -82,6 +119,58 @@ class Department(models.Model):
     def __str__(self):
         return self.name
 
+class IssueQuerySet(models.QuerySet):
+    def in_bbox(self, south, west, north, east):
+        """Issues inside a lat/lng box, narrowed first by geohash cell."""
+        cells = Q()
+        for prefix in geohash_cover(south, west, north, east):
+            if prefix:
+                # Range scan on the geohash index ('{' sorts right after 'z')
+                cells |= Q(geohash__gte=prefix, geohash__lt=prefix + "{")
+        return self.filter(
+            cells,
+            latitude__range=(south, north),
+            longitude__range=(west, east),
+        )
+
+    def near(self, lat, lng, radius_m, limit=None):
+        """
+        Issues within `radius_m` metres of (lat, lng), nearest first.
+
+        Returns a list; each issue gets a ``distance_m`` attribute.
+        """
+        results = []
+        for issue in self.in_bbox(*bounding_box(lat, lng, radius_m)):
+            distance = haversine_m(lat, lng, issue.latitude, issue.longitude)
+            if distance <= radius_m:
+                issue.distance_m = distance
+                results.append(issue)
+        results.sort(key=lambda issue: issue.distance_m)
+        return results[:limit] if limit else results
+
+    def search(self, query):
+        """Issues matching a full-text `query`, annotated with a relevance ``rank``."""
+        return search_issues(self, query)
+
+    def similar_to(self, title, description, lat, lng, radius_m=DUPLICATE_RADIUS_M,
+                   threshold=DUPLICATE_THRESHOLD, limit=5):
+        """
+        Open issues near (lat, lng) whose text resembles `title`/`description`,
+        most similar first. Each issue gets ``similarity`` and ``distance_m``.
+        """
+        signature = minhash_signature(f"{title} {description}")
+        if not signature or lat is None or lng is None:
+            return []
+        candidates = self.exclude(status=Issue.STATUS_RESOLVED).near(lat, lng, radius_m)
+        matches = []
+        for issue in candidates:
+            issue.similarity = signature_similarity(signature, issue.signature)
+            if issue.similarity >= threshold:
+                matches.append(issue)
+        matches.sort(key=lambda issue: (-issue.similarity, issue.distance_m))
+        return matches[:limit]
+
+
 class Issue(models.Model):
     STATUS_REPORTED = 'reported'
     STATUS_ACKNOWLEDGED = 'acknowledged'
@@ -116,12 +205,20 @@ class Issue(models.Model):
     location = models.CharField(max_length=200, blank=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # 🔹 Spatial index cell for latitude/longitude, filled in on save()
+    geohash = models.CharField(max_length=12, blank=True, default="", db_index=True, editable=False)
+    # 🔹 MinHash of title + description, used to spot duplicate reports
+    signature = models.CharField(max_length=256, blank=True, default="", editable=False)
 
     photo = CloudinaryField(
         'images',
         blank=True,
         null=True,
     )
+    # 🔹 True while the photo waits in PhotoUpload for the background worker
+    photo_pending = models.BooleanField(default=False, editable=False)
+    # 🔹 Resized, metadata-free copies of the photo: {"webp": {"320": url, ...}, "jpeg": {...}}
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     status = models.CharField(
         max_length=20,
@@ -129,18 +226,99 @@ class Issue(models.Model):
         default=STATUS_REPORTED
     )
 
+    # 🔹 Denormalized number of votes, kept in step with Vote by core.signals
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
+    # 🔹 Resolver work-queue score from age, votes and status (see core.priority)
+    priority = models.FloatField(default=0.0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = IssueQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]  # 🔹 latest issues first by default
+        # 🔹 One index per access pattern of the hot views; `manage.py
+        # explain_views` checks that each is still used
+        indexes = [
+            # Resolver work queue: one department's issues, highest priority first
+            models.Index(fields=["department", "-priority", "-id"], name="issue_dept_priority_idx"),
+            # Feed, home, moderation and API: newest first, whole or filtered
+            models.Index(fields=["-created_at", "-id"], name="issue_created_idx"),
+            models.Index(fields=["status", "-created_at", "-id"], name="issue_status_created_idx"),
+            models.Index(fields=["department", "-created_at", "-id"], name="issue_dept_created_idx"),
+            models.Index(
+                fields=["-created_at", "-id"], condition=Q(department__isnull=True), name="issue_unassigned_idx",
+            ),
+            # Feed sorted by most voted
+            models.Index(fields=["-vote_count", "-created_at", "-id"], name="issue_votes_created_idx"),
+            # Citizen dashboard: my latest reports
+            models.Index(fields=["reporter", "-created_at"], name="issue_reporter_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+        self.signature = minhash_signature(f"{self.title} {self.description}")
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None and not self._state.adding and not kwargs.get("force_insert"):
+            # 🔹 vote_count is only changed in SQL (see core.signals): writing back
+            # the value loaded with the issue would undo votes cast since, so an
+            # update saves every loaded field but the counter and its priority
+            deferred = self.get_deferred_fields()
+            update_fields = {
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in deferred
+            } - {"vote_count", "priority"}
+        if update_fields is None or "vote_count" in update_fields:
+            self.priority = issue_priority(self.status, self.vote_count, self.created_at or timezone.now())
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {"latitude", "longitude"} & update_fields:
+                update_fields.add("geohash")
+            if {"title", "description"} & update_fields:
+                update_fields.add("signature")
+            if "vote_count" in update_fields:
+                update_fields.add("priority")
+            elif "status" in update_fields:
+                # Swap the stored status weight in SQL, keeping the votes' share
+                self.priority = status_change_expression(self.status)
+                update_fields.add("priority")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        if "priority" in self.__dict__ and hasattr(self.priority, "resolve_expression"):
+            del self.__dict__["priority"]  # deferred: read back from the row if asked for
+
     # 🔹 Helpers
-    def vote_count(self):
-        return self.votes.count() if hasattr(self, "votes") else 0
+
+    def srcset(self, fmt="jpeg"):
+        """`srcset` attribute value for the photo's `fmt` thumbnails ("" if none)."""
+        sizes = self.thumbnails.get(fmt, {})
+        return ", ".join(f"{sizes[w]} {w}w" for w in sorted(sizes, key=int))
+
+    @property
+    def webp_srcset(self):
+        return self.srcset("webp")
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset("jpeg")
+
+    @property
+    def card_image_url(self):
+        """Smallest JPEG thumbnail at least 640px wide, else the original."""
+        sizes = self.thumbnails.get("jpeg", {})
+        for width in sorted(sizes, key=int):
+            if int(width) >= 640:
+                return sizes[width]
+        if sizes:
+            return sizes[max(sizes, key=int)]
+        return self.photo.url if self.photo else ""
 
     def has_user_voted(self, user):
         if user.is_authenticated and hasattr(self, "votes"):
@@ -166,6 +344,10 @@ class Vote(models.Model):
     def __str__(self):
         return f"{self.user.username} voted on {self.issue.title}"
 
+def comment_path_segment(comment_id):
+    return "%010x/" % comment_id
+
+
 class Comment(models.Model):
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -173,12 +355,205 @@ class Comment(models.Model):
     parent = models.ForeignKey("self", null=True, blank=True, related_name="replies", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 🔹 Materialized path: the top-level comment of this thread, and the ids
+    # from it down to this comment ("<root>/<child>/.../<self>/", fixed-width
+    # hex) so sorting a thread by path yields it in display order.
+    thread = models.ForeignKey("self", null=True, blank=True, related_name="+", on_delete=models.CASCADE, editable=False)
+    path = models.CharField(max_length=1000, blank=True, default="", editable=False)
+
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Issue page: the issue's top-level comments (thread roots), oldest first
+            models.Index(
+                fields=["issue", "created_at", "id"], condition=Q(parent__isnull=True), name="comment_thread_roots_idx",
+            ),
+            # API: an issue's comments in path order
+            models.Index(fields=["issue", "path"], name="comment_issue_path_idx"),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user} on {self.issue}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            # The path includes our own id, so it can only be set after the insert
+            if self.parent_id:
+                self.thread_id = self.parent.thread_id
+                self.path = self.parent.path + comment_path_segment(self.pk)
+            else:
+                self.thread_id = self.pk
+                self.path = comment_path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(thread_id=self.thread_id, path=self.path)
+
     @property
     def is_reply(self):
-        return self.parent is not None
\ No newline at end of file
+        return self.parent_id is not None
+
+    @property
+    def depth(self):
+        return self.path.count("/") - 1
+
+
+class IssueDailyRollup(models.Model):
+    """
+    Number of issues created on `day` that currently have `status`,
+    `department` and `reporter`. Kept up to date by core.signals and
+    rebuilt by the backfill_issue_rollups command; superadmin_reports
+    reads only this table.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Issue.STATUS_CHOICES)
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    reporter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "status", "department", "reporter"],
+                name="unique_issue_daily_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count}"
+
+
+class MapCell(models.Model):
+    """
+    Number of issues with `status` inside geohash `cell`, and the sums of
+    their coordinates for the centroid. Every located issue is counted in
+    its cell at each precision up to core.clusters.CLUSTER_PRECISION, so a
+    map tile at any zoom reads one level of this grid instead of the
+    issues. Kept up to date by core.signals and rebuilt by the
+    backfill_issue_rollups command, like IssueDailyRollup.
+    """
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)
+    status = models.CharField(max_length=20, choices=Issue.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0.0)
+    lng_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cell", "status"], name="unique_map_cell"),
+        ]
+        indexes = [
+            # Map tiles: one precision's cells under a few geohash prefixes
+            models.Index(fields=["precision", "cell"], name="mapcell_precision_cell_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.cell} {self.status}: {self.count}"
+
+
+class HotspotGrid(models.Model):
+    """
+    Kernel density of the located issues created in the `week` starting on
+    that Monday that now have `department` and `status`, over the finest
+    map grid cells. Stored as parallel packed arrays (see core.hotspots),
+    a few bytes per cell. Written by the compute_hotspots command and read
+    by the department_hotspots view.
+    """
+    week = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=20, choices=Issue.STATUS_CHOICES)
+    cells = models.BinaryField(default=bytes)  # int64 row << 32 | col, ascending
+    counts = models.BinaryField(default=bytes)  # uint32 issues in each cell
+    density = models.BinaryField(default=bytes)  # float32 issues per km² at each cell
+    total = models.PositiveIntegerField(default=0)  # sum of counts, for trends without unpacking
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["week", "department", "status"], name="unique_hotspot_grid"),
+        ]
+        indexes = [
+            models.Index(fields=["department", "week"], name="hotspot_dept_week_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.week} {self.department_id} {self.status}: {self.total}"
+
+
+class HotspotChange(models.Model):
+    """
+    A map cell of one hotspot grid whose issue count may have changed since
+    compute_hotspots last ran. Recorded by core.signals and the bulk
+    moderation paths; the next run recounts the cell and deletes the row.
+    """
+    week = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=20, choices=Issue.STATUS_CHOICES)
+    cell = models.CharField(max_length=12)
+
+    def __str__(self):
+        return f"{self.week} {self.department_id} {self.status} {self.cell}"
+
+
+class PhotoUpload(models.Model):
+    """
+    A citizen's photo staged in the database until the process_photo_uploads
+    worker pushes it to the photo backend and sets Issue.photo. A failed
+    attempt keeps what it did upload in `photo` and `thumbnails` for the
+    next one.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    issue = models.OneToOneField(Issue, on_delete=models.CASCADE, related_name="photo_upload")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    data = models.BinaryField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 🔹 What earlier attempts did upload, so a retry doesn't upload it again
+    photo = CloudinaryField('images', blank=True, null=True)
+    thumbnails = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} for issue {self.issue_id} ({self.status})"
+
+
+
+class ImportBatch(models.Model):
+    """
+    Checkpoint of the import_issues command: one row per batch of a source
+    file that has been imported, written in the same transaction as the
+    batch's issues so a re-run skips it exactly. Batch `batch` holds rows
+    batch * batch_size up to (batch + 1) * batch_size of the file, so a
+    re-run must use the same batch size.
+    """
+    source = models.CharField(max_length=255)
+    batch = models.PositiveIntegerField()
+    # 🔹 Null on checkpoints written before the size was recorded
+    batch_size = models.PositiveIntegerField(null=True)
+    rows = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "batch"], name="unique_import_batch"),
+        ]
+
+    def __str__(self):
+        return f"{self.source} batch {self.batch} ({self.rows} rows)"
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_home_block, invalidate_principals, touch_last_modified
+from .clusters import move_map_cells_bulk, remove_map_cells_bulk
+from .hotspots import record_hotspot_changes_bulk
+from .models import Issue, User
+from .priority import status_change_expression
+from .rollups import move_rollups_bulk, remove_rollups_bulk, rollups_suspended
+
+BULK_CHUNK_SIZE = 500  # ids per statement, well under every database's parameter limit
+FAKE_REPORT_BAN_DAYS = 7
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        yield ids[start:start + BULK_CHUNK_SIZE]
+
+
+def _bulk_update(issue_ids, **changes):
+    """UPDATE the issues in `issue_ids` in one transaction, keeping the rollups, map grid and hotspots in step."""
+    changes["updated_at"] = timezone.now()  # update() skips auto_now
+    rollup_changes = {k: v for k, v in changes.items() if k in ("status", "department_id")}
+    if "status" in changes:
+        changes["priority"] = status_change_expression(changes["status"])
+    updated = 0
+    with transaction.atomic():
+        for chunk in _chunks(issue_ids):
+            issues = Issue.objects.filter(id__in=chunk)
+            move_rollups_bulk(issues, **rollup_changes)
+            if "status" in changes:
+                move_map_cells_bulk(issues, changes["status"])
+            record_hotspot_changes_bulk(issues, **rollup_changes)
+            updated += issues.update(**changes)
+    invalidate_home_block()
+    touch_last_modified("feed", *(f"issue:{pk}" for pk in issue_ids))
+    return updated
+
+
+def bulk_assign_department(issue_ids, department):
+    """Bulk version of Issue.assign_to_department()."""
+    return _bulk_update(issue_ids, department_id=department.id, status=Issue.STATUS_ACKNOWLEDGED)
+
+
+def bulk_set_status(issue_ids, status):
+    return _bulk_update(issue_ids, status=status)
+
+
+def bulk_delete_fake(issue_ids, ban_days=FAKE_REPORT_BAN_DAYS):
+    """
+    Delete fake reports and ban everyone who filed one.
+    Returns (issues deleted, reporters banned).
+    """
+    deleted = 0
+    with transaction.atomic():
+        reporter_ids = set(
+            Issue.objects.filter(id__in=issue_ids).values_list("reporter_id", flat=True).distinct()
+        )
+        banned = User.objects.filter(id__in=reporter_ids).update(
+            is_banned=True,
+            banned_until=timezone.now() + timedelta(days=ban_days),
+        )
+        with rollups_suspended():
+            for chunk in _chunks(issue_ids):
+                issues = Issue.objects.filter(id__in=chunk)
+                remove_rollups_bulk(issues)
+                remove_map_cells_bulk(issues)
+                record_hotspot_changes_bulk(issues)
+                deleted += issues.delete()[1].get("core.Issue", 0)
+    invalidate_home_block()
+    invalidate_principals(reporter_ids)
+    return deleted, banned
+
+
+def sweep_expired_bans():
+    """
+    Clear every ban whose banned_until has passed, in one UPDATE. Returns the count.
+
+    Cached principals need no invalidation: they hold the expiry time, which
+    has already passed for every row this touches.
+    """
+    return User.objects.expired_bans().update(is_banned=False, banned_until=None)
@@ -0,0 +1,99 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value):
+    # Full microsecond precision: DjangoJSONEncoder rounds to milliseconds,
+    # which would make the cursor skip or repeat rows.
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_cursor(values):
+    """Encode the sort-key values of a row as an opaque, URL-safe token."""
+    raw = json.dumps(list(values), default=_json_default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor back into its list of values."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _seek_filter(ordering, values):
+    """
+    Build the "strictly after this row" condition for a multi-column sort,
+    e.g. for (-created_at, -id):  created_at < c  OR  (created_at = c AND id < i).
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def keyset_paginate(queryset, cursor=None, page_size=12, ordering=("-created_at", "-id")):
+    """
+    Return one page of `queryset` sorted by `ordering`, seeking past `cursor`.
+
+    `ordering` must end in a unique column (normally ``id``) so every row has
+    a distinct position. Unlike OFFSET pagination the database only ever reads
+    `page_size + 1` rows from the index, so page 500 costs the same as page 1.
+
+    Works on values() querysets too, as long as they select the `ordering` fields.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        try:
+            queryset = queryset.filter(_seek_filter(ordering, values))
+        except (TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last[f.lstrip("-")] for f in ordering)
+        else:
+            next_cursor = encode_cursor(getattr(last, f.lstrip("-")) for f in ordering)
+    return KeysetPage(rows, next_cursor)
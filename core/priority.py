@@ -0,0 +1,38 @@
+"""
+Work-queue priority for issues, measured in days of waiting.
+
+An issue gains one point per day since it was reported, VOTE_WEIGHT per
+vote, and a bonus for where it sits in the workflow. Because the age term
+is linear in created_at, the stored score never needs refreshing as time
+passes: every issue ages at the same rate, so the ordering holds.
+"""
+from datetime import datetime, timezone
+
+from django.db.models import Case, F, FloatField, Value, When
+
+PRIORITY_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+VOTE_WEIGHT = 1.0  # one vote counts as much as a day of waiting
+STATUS_WEIGHTS = {
+    'reported': 7.0,      # nobody has looked at it yet
+    'acknowledged': 7.0,
+    'in_progress': 0.0,   # already being worked on
+    'resolved': -3650.0,  # sinks below every open issue
+}
+
+
+def issue_priority(status, vote_count, created_at):
+    age_days = (PRIORITY_EPOCH - created_at).total_seconds() / 86400
+    return STATUS_WEIGHTS.get(status, 0.0) + VOTE_WEIGHT * vote_count + age_days
+
+
+def status_change_expression(new_status):
+    """
+    F-expression for the priority of rows whose status is set to
+    `new_status` by a queryset update(), swapping out their old status weight.
+    """
+    old_weight = Case(
+        *[When(status=status, then=Value(weight)) for status, weight in STATUS_WEIGHTS.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return F('priority') - old_weight + Value(STATUS_WEIGHTS.get(new_status, 0.0))
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Issue, IssueDailyRollup
+
+ROLLUP_FIELDS = ("created_at", "status", "department_id", "reporter_id")
+KEY_FIELDS = ("day", "status", "department_id", "reporter_id")
+DELTA_CHUNK_SIZE = 250  # buckets per statement
+
+_suspended = ContextVar("rollups_suspended", default=False)
+
+
+@contextmanager
+def rollups_suspended():
+    """Skip the per-row rollup signals, for bulk code that applies its own deltas."""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def rollups_are_suspended():
+    return _suspended.get()
+
+
+def rollup_key(created_at, status, department_id, reporter_id):
+    return {
+        "day": timezone.localdate(created_at),
+        "status": status,
+        "department_id": department_id,
+        "reporter_id": reporter_id,
+    }
+
+
+def issue_rollup_key(issue):
+    return rollup_key(*(getattr(issue, f) for f in ROLLUP_FIELDS))
+
+
+def apply_rollup_delta(key, delta):
+    """Add `delta` to the rollup row for `key`, creating it if needed."""
+    rows = IssueDailyRollup.objects.filter(**key)
+    if rows.update(count=F("count") + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            IssueDailyRollup.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Another request created the row first, add to it instead
+        rows.update(count=F("count") + delta)
+
+
+def move_rollup(old_key, new_key):
+    """Move one issue from the `old_key` bucket to the `new_key` one."""
+    if old_key == new_key:
+        return
+    with transaction.atomic():
+        apply_rollup_delta(old_key, -1)
+        apply_rollup_delta(new_key, 1)
+
+
+def _bucket(key):
+    return tuple(key[f] for f in KEY_FIELDS)
+
+
+def _bucket_filter(buckets):
+    rows = Q()
+    for bucket in buckets:
+        rows |= Q(**dict(zip(KEY_FIELDS, bucket)))
+    return rows
+
+
+def _lock_order(bucket):
+    day, status, department_id, reporter_id = bucket
+    return day, status, department_id is not None, department_id or 0, reporter_id
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add `deltas` ({(day, status, department_id, reporter_id): n}) to the
+    rollups, creating missing rows. One UPDATE per chunk of buckets, as in
+    core.clusters.apply_cell_deltas; wrap the call in a transaction when the
+    chunks must apply together.
+    """
+    deltas = {bucket: n for bucket, n in deltas.items() if n}
+    buckets = sorted(deltas, key=_lock_order)
+    for start in range(0, len(buckets), DELTA_CHUNK_SIZE):
+        chunk = {bucket: deltas[bucket] for bucket in buckets[start:start + DELTA_CHUNK_SIZE]}
+        rows = IssueDailyRollup.objects.filter(_bucket_filter(chunk))
+        updated = rows.update(count=F("count") + Case(
+            *(When(Q(**dict(zip(KEY_FIELDS, bucket))), then=Value(n)) for bucket, n in chunk.items()),
+            default=Value(0), output_field=IntegerField(),
+        ))
+        if updated == len(chunk):
+            continue
+        existing = set(rows.values_list(*KEY_FIELDS))
+        missing = {bucket: n for bucket, n in chunk.items() if bucket not in existing and n > 0}
+        if not missing:
+            continue
+        try:
+            with transaction.atomic():
+                IssueDailyRollup.objects.bulk_create(
+                    IssueDailyRollup(count=n, **dict(zip(KEY_FIELDS, bucket))) for bucket, n in missing.items()
+                )
+        except IntegrityError:
+            # Another request created some of them first; add to those instead
+            apply_rollup_deltas(missing)
+
+
+def _grouped_keys(queryset):
+    return (
+        queryset.annotate(day=TruncDate("created_at"))
+        .values(*KEY_FIELDS)
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+
+
+def move_rollups_bulk(queryset, **changes):
+    """
+    Apply the rollup moves for `queryset` before it is ``update()``-d with
+    `changes` (``status`` and/or ``department_id``): the net delta of every
+    bucket, applied in a few statements whatever the number of issues.
+    """
+    deltas = defaultdict(int)
+    for group in _grouped_keys(queryset):
+        n = group.pop("n")
+        new_key = {**group, **changes}
+        if new_key != group:
+            deltas[_bucket(group)] -= n
+            deltas[_bucket(new_key)] += n
+    apply_rollup_deltas(deltas)
+
+
+def remove_rollups_bulk(queryset):
+    """Subtract `queryset` from the rollups before it is deleted."""
+    apply_rollup_deltas({_bucket(group): -group["n"] for group in _grouped_keys(queryset)})
+
+
+def rebuild_rollups(batch_size=2000):
+    """Recompute every rollup row from Issue. Returns the number of rows written."""
+    grouped = (
+        Issue.objects.annotate(day=TruncDate("created_at"))
+        .values("day", "status", "department_id", "reporter_id")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    with transaction.atomic():
+        IssueDailyRollup.objects.all().delete()
+        rows = IssueDailyRollup.objects.bulk_create(
+            (IssueDailyRollup(**row) for row in grouped.iterator()),
+            batch_size=batch_size,
+        )
+    return len(rows)
@@ -0,0 +1,144 @@
+"""
+Full-text search over Issue.title, description and location.
+
+Postgres uses a generated, weighted ``tsvector`` column with a GIN index;
+SQLite uses an external-content FTS5 table kept in sync by triggers. Both
+are created by migration 0006 and maintained by the database itself, so
+save(), delete(), bulk_create() and queryset updates all stay in sync.
+On SQLite the triggers are re-checked after every migrate (see
+ensure_sqlite_triggers).
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "core_issue_fts"
+
+# Title matches count most, then location, then description
+POSTGRES_SETUP = [
+    """
+    ALTER TABLE core_issue ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(location, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX core_issue_search_vector_gin ON core_issue USING GIN (search_vector)",
+]
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS core_issue_search_vector_gin",
+    "ALTER TABLE core_issue DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_issue_fts_insert AFTER INSERT ON core_issue BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_issue_fts_delete AFTER DELETE ON core_issue BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_issue_fts_update AFTER UPDATE OF title, description, location ON core_issue BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END
+    """,
+]
+SQLITE_REBUILD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+SQLITE_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description, location,
+        content='core_issue', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    SQLITE_REBUILD,
+]
+SQLITE_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS core_issue_fts_insert",
+    "DROP TRIGGER IF EXISTS core_issue_fts_delete",
+    "DROP TRIGGER IF EXISTS core_issue_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def ensure_sqlite_triggers(using_connection):
+    """
+    Reinstall the FTS5 sync triggers if they are missing, and resync the index.
+
+    SQLite migrations that alter core_issue rebuild the table, which silently
+    drops its triggers, so this runs after every migrate.
+    """
+    if using_connection.vendor != "sqlite":
+        return
+    with using_connection.cursor() as cursor:
+        if FTS_TABLE not in using_connection.introspection.table_names(cursor):
+            return
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND name IN ('core_issue_fts_insert', 'core_issue_fts_delete', 'core_issue_fts_update')"
+        )
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+            return
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(SQLITE_REBUILD)
+
+
+def _fts5_query(terms):
+    # Quote every term so user input can't inject FTS5 syntax; the last one
+    # is a prefix match so results appear while a word is still being typed.
+    quoted = ['"%s"' % t for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_issues(queryset, query):
+    """
+    Filter `queryset` to issues matching `query` and annotate a ``rank``
+    (higher is more relevant). Returns the queryset unchanged if `query`
+    has no searchable words.
+    """
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return queryset
+
+    if connection.vendor == "postgresql":
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.alias(
+            search_match=RawSQL(f"core_issue.search_vector @@ {tsquery}", [query], output_field=BooleanField()),
+        ).filter(search_match=True).annotate(
+            rank=RawSQL(f"ts_rank_cd(core_issue.search_vector, {tsquery})", [query], output_field=FloatField()),
+        )
+
+    if connection.vendor == "sqlite":
+        match = _fts5_query(terms)
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]),
+        ).annotate(
+            # bm25() is lower-is-better; weights mirror the Postgres A/B/C ones
+            rank=RawSQL(
+                f"(SELECT -bm25({FTS_TABLE}, 10.0, 2.0, 5.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = core_issue.id)",
+                [match],
+                output_field=FloatField(),
+            ),
+        )
+
+    # Other databases: unranked substring match on every term
+    for term in terms:
+        queryset = queryset.filter(
+            Q(title__icontains=term) | Q(description__icontains=term) | Q(location__icontains=term)
+        )
+    return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
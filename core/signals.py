@@ -0,0 +1,221 @@
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, QuerySet
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import HOME_CACHE_KEY, invalidate_home_block, invalidate_principals, touch_last_modified
+from .clusters import CELL_FIELDS, apply_issue_delta, issue_map_cell_key, map_cell_key, move_map_cell
+from .hotspots import HOTSPOT_FIELDS, hotspot_key, record_hotspot_changes, record_hotspot_changes_bulk
+from .models import Comment, Department, Issue, User, Vote
+from .priority import VOTE_WEIGHT
+from .rollups import (
+    ROLLUP_FIELDS, apply_rollup_delta, issue_rollup_key, move_rollup, rollup_key, rollups_are_suspended,
+)
+from .search import ensure_sqlite_triggers
+
+
+@receiver(post_save, sender=Vote)
+def increment_vote_count(sender, instance, created, **kwargs):
+    if created:
+        Issue.objects.filter(pk=instance.issue_id).update(
+            vote_count=F("vote_count") + 1,
+            priority=F("priority") + VOTE_WEIGHT,
+            updated_at=Now(),
+        )
+
+
+@receiver(post_delete, sender=Vote)
+def decrement_vote_count(sender, instance, origin=None, **kwargs):
+    # The issue itself is going away, no point touching its counter
+    if isinstance(origin, Issue) or (isinstance(origin, QuerySet) and origin.model is Issue):
+        return
+    Issue.objects.filter(pk=instance.issue_id).update(
+        vote_count=F("vote_count") - 1,
+        priority=F("priority") - VOTE_WEIGHT,
+        updated_at=Now(),
+    )
+
+
+@receiver(pre_save, sender=Issue)
+def remember_rollup_key(sender, instance, **kwargs):
+    # Read the stored values so post_save knows which bucket, map cell and
+    # hotspot cell the issue left
+    instance._old_rollup_key = instance._old_map_cell_key = instance._old_hotspot_key = None
+    if rollups_are_suspended():
+        return
+    if not instance._state.adding and instance.pk:
+        old = Issue.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS, *CELL_FIELDS).first()
+        if old:
+            instance._old_rollup_key = rollup_key(*(old[f] for f in ROLLUP_FIELDS))
+            instance._old_map_cell_key = map_cell_key(*(old[f] for f in CELL_FIELDS))
+            instance._old_hotspot_key = hotspot_key(*(old[f] for f in HOTSPOT_FIELDS))
+
+
+@receiver(post_save, sender=Issue)
+def update_issue_rollup(sender, instance, created, **kwargs):
+    if rollups_are_suspended():
+        return
+    if created:
+        apply_rollup_delta(issue_rollup_key(instance), 1)
+    elif instance._old_rollup_key is not None:
+        move_rollup(instance._old_rollup_key, issue_rollup_key(instance))
+
+
+@receiver(post_delete, sender=Issue)
+def remove_issue_rollup(sender, instance, **kwargs):
+    if rollups_are_suspended():
+        return
+    apply_rollup_delta(issue_rollup_key(instance), -1)
+
+
+@receiver(post_save, sender=Issue)
+def update_issue_map_cell(sender, instance, created, **kwargs):
+    if rollups_are_suspended():
+        return
+    if created:
+        apply_issue_delta(issue_map_cell_key(instance), 1)
+    elif instance._old_rollup_key is not None:  # the old row was read, see remember_rollup_key
+        move_map_cell(instance._old_map_cell_key, issue_map_cell_key(instance))
+
+
+@receiver(post_delete, sender=Issue)
+def remove_issue_map_cell(sender, instance, **kwargs):
+    if rollups_are_suspended():
+        return
+    apply_issue_delta(issue_map_cell_key(instance), -1)
+
+
+@receiver(post_save, sender=Issue)
+def record_issue_hotspot_change(sender, instance, created, **kwargs):
+    if rollups_are_suspended():
+        return
+    new_key = hotspot_key(*(getattr(instance, f) for f in HOTSPOT_FIELDS))
+    if created:
+        record_hotspot_changes(new_key)
+    elif instance._old_rollup_key is not None and instance._old_hotspot_key != new_key:
+        record_hotspot_changes(instance._old_hotspot_key, new_key)
+
+
+@receiver(post_delete, sender=Issue)
+def record_issue_hotspot_removal(sender, instance, **kwargs):
+    if rollups_are_suspended():
+        return
+    record_hotspot_changes(hotspot_key(*(getattr(instance, f) for f in HOTSPOT_FIELDS)))
+
+
+@receiver(pre_delete, sender=Department)
+def record_department_hotspot_changes(sender, instance, **kwargs):
+    # Its issues become unassigned; its own grids go with it
+    record_hotspot_changes_bulk(Issue.objects.filter(department=instance), department_id=None)
+
+
+# ---- Landing page cache invalidation ----
+
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=User)
+def invalidate_home_on_change(sender, **kwargs):
+    invalidate_home_block()
+
+
+@receiver(post_save, sender=User)
+def invalidate_home_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only, which doesn't change any count
+    if created or update_fields is None or "is_active" in update_fields:
+        invalidate_home_block()
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def invalidate_home_on_vote(sender, instance, **kwargs):
+    # Votes only show on the home page through the recent issues' counters
+    block = cache.get(HOME_CACHE_KEY)
+    if block is not None and instance.issue_id in block['recent_ids']:
+        invalidate_home_block()
+
+
+# ---- Page validators and anonymous page cache ----
+
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+def touch_issue_pages(sender, instance, **kwargs):
+    touch_last_modified("feed", f"issue:{instance.pk}")
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_pages_of_issue(sender, instance, **kwargs):
+    # Comments only show on the issue page, but the feed's cards count votes
+    scopes = [f"issue:{instance.issue_id}"]
+    if sender is Vote:
+        scopes.append("feed")
+    touch_last_modified(*scopes)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def touch_feed(sender, **kwargs):
+    touch_last_modified("feed")
+
+
+# ---- Cached principals (request.user) ----
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_principal_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only, which the principal doesn't hold
+    if update_fields is None or set(update_fields) - {"last_login"}:
+        invalidate_principals([instance.pk])
+
+
+@receiver(m2m_changed, sender=Department.users.through)
+def invalidate_principals_on_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.departments.add(...) and friends
+        if action.startswith("post_"):
+            invalidate_principals([instance.pk])
+    elif action == "pre_clear":
+        # The members are gone once the clear is done
+        instance._cleared_member_ids = list(instance.users.values_list("id", flat=True))
+    elif action == "post_clear":
+        invalidate_principals(instance._cleared_member_ids)
+    elif action in ("post_add", "post_remove"):
+        invalidate_principals(pk_set)
+
+
+@receiver(pre_save, sender=Department)
+def remember_department_admin(sender, instance, **kwargs):
+    instance._old_admin_id = None
+    if not instance._state.adding and instance.pk:
+        instance._old_admin_id = Department.objects.filter(pk=instance.pk).values_list("admin_id", flat=True).first()
+
+
+@receiver(post_save, sender=Department)
+def invalidate_principals_on_admin_change(sender, instance, **kwargs):
+    if instance._old_admin_id != instance.admin_id:
+        invalidate_principals([pk for pk in (instance._old_admin_id, instance.admin_id) if pk])
+
+
+@receiver(pre_delete, sender=Department)
+def remember_department_principals(sender, instance, **kwargs):
+    # Deleting the department drops its memberships without m2m_changed
+    instance._principal_ids = [*instance.users.values_list("id", flat=True), instance.admin_id]
+
+
+@receiver(post_delete, sender=Department)
+def invalidate_department_principals(sender, instance, **kwargs):
+    invalidate_principals([pk for pk in getattr(instance, "_principal_ids", ()) if pk])
+
+
+# ---- Full-text search ----
+
+@receiver(post_migrate)
+def reinstall_search_triggers(sender, using="default", **kwargs):
+    if sender.name == "core":
+        ensure_sqlite_triggers(connections[using])
@@ -0,0 +1,39 @@
+import random
+import re
+import zlib
+
+SIGNATURE_SIZE = 32  # hash functions per MinHash signature
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)  # fixed seed: stored signatures must stay comparable
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(SIGNATURE_SIZE)]
+
+
+def shingles(text, size=3):
+    """Character `size`-grams of lower-cased, punctuation-free `text`."""
+    text = " ".join(re.findall(r"\w+", text.lower()))
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(text):
+    """
+    MinHash of the trigrams of `text`, as a hex string of SIGNATURE_SIZE
+    32-bit values ("" for empty text). The fraction of positions two
+    signatures share estimates the Jaccard similarity of their trigram sets.
+    """
+    hashes = [zlib.crc32(s.encode()) for s in shingles(text)]
+    if not hashes:
+        return ""
+    return "".join(
+        "%08x" % (min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def signature_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity (0..1) of two minhash_signature() values."""
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    matches = sum(sig_a[i:i + 8] == sig_b[i:i + 8] for i in range(0, len(sig_a), 8))
+    return matches / (len(sig_a) // 8)
@@ -1,3 +1,1503 @@
-from django.test import TestCase
+"""
+Query-budget regression suite, and behavioural tests for the features
+behind it.
 
-# Create your tests here.
+QueryBudgetTests seeds a small synthetic city (see the seed_data command),
+then requests every route in core.urls as the kind of user who normally uses
+it and records the number of queries and the latency of each request. A
+route that runs more queries than its budget in ROUTES fails the suite,
+which is how an N+1 shows up before it reaches production. A route added to
+core.urls without a budget fails too.
+
+The cache is cleared before every request, so budgets are for a cold cache
+(the worst case), where signing in still costs a session and a user query;
+test_warm_requests_skip_auth_queries checks that a warm one costs none.
+Latency percentiles are printed at the end of the run when BENCHMARK_REPEAT
+is set; they are for reading, not asserted, as they depend on the machine.
+
+ExplainTests EXPLAINs the queries of the hot views (see core.explain) and
+fails on a full scan or unindexed sort that isn't listed in KNOWN_PLANS.
+
+The other classes check that what the optimisations keep (vote counts,
+rollups, the map grid, hotspot grids, caches, checkpoints) agrees with a
+recount, and that pagination, search, throttling, bans, metrics, imports and
+exports behave as their views and commands promise.
+
+    python manage.py test core
+    BENCHMARK_REPEAT=50 python manage.py test core   # print steadier percentiles
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .cache import HOME_CACHE_KEY
+from .clusters import rebuild_map_cells, tile_of
+from .events import publish_issue_event
+from .explain import check_views
+from .hotspots import load_grid, rebuild_hotspots, week_start
+from .management.commands.benchmark_nearby import BENCH_USERNAME
+from .management.commands.seed_data import SEED_PASSWORD
+from .metrics import LATENCY_BUCKETS, MetricsRegistry, ViewStats, registry
+from .models import (
+    Comment, Department, HotspotChange, HotspotGrid, ImportBatch, Issue, IssueDailyRollup, MapCell, PhotoUpload, User, Vote,
+)
+from .moderation import bulk_set_status
+from .pagination import encode_cursor
+from .priority import issue_priority
+from .rollups import rebuild_rollups
+from .similarity import minhash_signature
+from .throttle import take_token
+from .thumbnails import make_thumbnails
+from .uploads import MAX_ATTEMPTS, RETRY_BASE_DELAY, LocalFileSystemUploader, process_pending_uploads, stage_photo
+from .urls import urlpatterns
+from .views import COMMENT_THREADS_PER_PAGE, ISSUE_FEED_PAGE_SIZE, WORK_QUEUE_PAGE_SIZE
+
+REPEAT = int(os.getenv("BENCHMARK_REPEAT", "5"))
+REPORT_LATENCY = "BENCHMARK_REPEAT" in os.environ
+
+
+def _fresh_issue(case):
+    # For routes that delete their issue: a new one for every request
+    return [Issue.objects.create(
+        title="Benchmark pothole", description="Throwaway issue", reporter=case.reporter,
+        latitude=9.93, longitude=76.26,
+    ).pk]
+
+
+# route pattern -> who requests it, how, and the most queries it may run.
+# "args" builds the URL arguments (and any rows the request consumes) and
+# runs outside the query capture.
+ROUTES = {
+    "": {"user": "anon", "budget": 5},
+    "superadmin/": {"user": "admin", "budget": 2},
+    "superadmin/departments/": {"user": "admin", "budget": 3},
+    "superadmin/departments/<int:pk>/": {
+        "user": "admin", "args": lambda c: [c.department.pk], "budget": 4,
+    },
+    "superadmin/manage/": {"user": "admin", "budget": 4},
+    # The same for any number of issues (up to a chunk): one UPDATE for the
+    # report rollups and one for the map cells, plus creating missing rows
+    # of each, and the hotspot change log
+    "superadmin/manage/bulk/": {
+        "user": "admin", "method": "post", "budget": 21,
+        "headers": {"x-requested-with": "XMLHttpRequest"},
+        "data": lambda c: {"action": "status", "new_status": Issue.STATUS_IN_PROGRESS, "issue_ids": c.issue_ids[:20]},
+    },
+    "superadmin/assign-department/<int:issue_id>/": {
+        "user": "admin", "method": "post", "args": lambda c: [c.issue.pk], "budget": 6,
+        "data": lambda c: {"department_id": c.department.pk},
+    },
+    "register/": {"user": "anon", "budget": 0},
+    "login/": {
+        "user": "anon", "method": "post", "budget": 10,
+        "data": lambda c: {"username": c.citizen.username, "password": SEED_PASSWORD},
+    },
+    "logout/": {"user": "citizen", "method": "post", "budget": 4},
+    "dashboard/": {"user": "citizen", "budget": 5},
+    # The report form lives on the citizen dashboard; only its POST is served.
+    # Here and on status changes the issue's finest map cell may be new, which
+    # takes an UPDATE, a SELECT and an INSERT in a savepoint instead of one UPDATE.
+    # Every issue write also logs its hotspot cells for compute_hotspots
+    "report-issue/": {
+        "user": "citizen", "method": "post", "budget": 15,
+        "data": {"title": "Pothole near Bus Stand", "description": "Deep pothole", "location": "Bus Stand",
+                 "latitude": 9.93, "longitude": 76.26},
+    },
+    "issues/": {"user": "citizen", "budget": 3},
+    "issues/nearby/": {"user": "anon", "query": {"lat": 9.9312, "lng": 76.2673, "radius": 2000}, "budget": 1},
+    "issues/similar/": {
+        "user": "citizen", "budget": 3,
+        "query": {"lat": 9.9312, "lng": 76.2673, "title": "Pothole near MG Road", "description": "Deep pothole"},
+    },
+    "issues/<int:pk>/": {"user": "anon", "args": lambda c: [c.issue.pk], "budget": 4},
+    "issues/<int:pk>/events/": {"user": "anon", "args": lambda c: [c.issue.pk], "budget": 1},
+    "issues/<int:pk>/comment/": {
+        "user": "citizen", "method": "post", "args": lambda c: [c.issue.pk], "budget": 5,
+        "data": {"content": "Still not fixed."},
+    },
+    "issues/<int:pk>/comment/<int:parent_id>/": {
+        "user": "citizen", "method": "post", "args": lambda c: [c.issue.pk, c.comment.pk], "budget": 6,
+        "data": {"content": "Agreed."},
+    },
+    "vote/<int:issue_id>/": {
+        "user": "citizen", "method": "post", "args": lambda c: [c.issue.pk], "budget": 11,
+    },
+    "department/": {"user": "resolver", "budget": 4},
+    "department/events/": {"user": "resolver", "budget": 4},
+    "department/hotspots/": {"user": "resolver", "budget": 5},
+    "update-issue-status/<int:issue_id>/": {
+        "user": "resolver", "method": "post", "args": lambda c: [c.issue.pk], "budget": 18,
+        "data": {"status": Issue.STATUS_IN_PROGRESS},
+    },
+    "manage-users/": {"user": "admin", "budget": 3},
+    "ban-user/<int:user_id>/": {"user": "admin", "args": lambda c: [c.victim.pk], "budget": 4},
+    "unban-user/<int:user_id>/": {"user": "admin", "args": lambda c: [c.victim.pk], "budget": 4},
+    "issues/<int:issue_id>/delete_fake/": {"user": "admin", "args": _fresh_issue, "budget": 12},
+    "reports/": {"user": "admin", "budget": 7},
+    "reports/export/<str:dataset>/": {
+        "user": "admin", "args": lambda c: ["issues"], "query": {"format": "ndjson"}, "budget": 3,
+    },
+    "reports/metrics/": {"user": "admin", "budget": 2},
+    "metrics/": {"user": "admin", "budget": 2},
+    "delete-issue/<int:issue_id>/": {"user": "admin", "args": _fresh_issue, "budget": 10},
+    "api/v1/issues/": {"user": "anon", "query": {"sort": "most_voted"}, "budget": 1},
+    "api/v1/issues/<int:pk>/": {"user": "anon", "args": lambda c: [c.issue.pk], "budget": 1},
+    "api/v1/issues/<int:pk>/comments/": {"user": "anon", "args": lambda c: [c.issue.pk], "budget": 1},
+    "api/v1/departments/": {"user": "anon", "budget": 1},
+    "api/v1/map/<int:z>/<int:x>/<int:y>/": {
+        "user": "anon", "args": lambda c: [12, *tile_of(c.issue.latitude, c.issue.longitude, 12)], "budget": 1,
+    },
+}
+
+
+# The seeded accounts share a password; a fast hasher keeps the login route
+# about queries rather than key stretching
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], LIVE_UPDATES=True)
+class QueryBudgetTests(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_data", users=40, issues=200, stdout=StringIO())
+        # The busiest assigned issue: most comments, so N+1s are visible
+        cls.issue = (
+            Issue.objects.filter(department__isnull=False)
+            .annotate(n=Count("comments")).order_by("-n", "id").first()
+        )
+        cls.department = cls.issue.department
+        cls.comment = cls.issue.comments.order_by("id").first()
+        cls.issue_ids = list(Issue.objects.order_by("id").values_list("id", flat=True))
+        citizens = User.objects.filter(username__startswith="seed_citizen").order_by("id")
+        cls.citizen, cls.victim, cls.reporter = citizens[0], citizens[1], citizens[2]
+        cls.users = {
+            "anon": None,
+            "citizen": cls.citizen,
+            "resolver": cls.department.users.get(),
+            "admin": User.objects.get(username="seed_admin"),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if REPORT_LATENCY and cls.results:
+            lines = [f"\n{'route':<45} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8}"]
+            for route, (queries, timings) in cls.results.items():
+                p50 = statistics.median(timings)
+                p95 = statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0]
+                lines.append(f"/{route:<44} {queries:>7} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f}")
+            print("\n".join(lines))
+
+    def test_every_route_has_a_budget(self):
+        routes = {str(pattern.pattern) for pattern in urlpatterns}
+        self.assertEqual(routes - set(ROUTES), set(), "routes without a query budget")
+        self.assertEqual(set(ROUTES) - routes, set(), "budgets for routes that no longer exist")
+
+    def test_query_budgets(self):
+        for pattern in urlpatterns:
+            route = str(pattern.pattern)
+            with self.subTest(route=route):
+                self.measure(route, pattern.name, ROUTES[route])
+
+    def test_warm_requests_skip_auth_queries(self):
+        # Once the session and principal are cached, a signed-in request
+        # reads neither the session nor the user from the database
+        for role, url in (("citizen", "/dashboard/"), ("resolver", "/department/"), ("admin", "/superadmin/")):
+            with self.subTest(role=role):
+                client = Client()
+                client.force_login(self.users[role])
+                client.get(url)
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                auth_queries = [
+                    q["sql"] for q in captured.captured_queries
+                    if re.search(r'FROM "(django_session|core_user)"', q["sql"])
+                ]
+                self.assertEqual(auth_queries, [])
+
+    def measure(self, route, name, spec):
+        queries, timings = 0, []
+        for _ in range(REPEAT):
+            client = Client()
+            if self.users[spec["user"]] is not None:
+                client.force_login(self.users[spec["user"]])
+            url = reverse(name, args=spec["args"](self) if "args" in spec else [])
+            data = spec.get("data", spec.get("query", {}))
+            if callable(data):
+                data = data(self)
+            cache.clear()
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, spec.get("method", "get"))(url, data, headers=spec.get("headers"))
+                if response.streaming and not response.is_async:
+                    # Exports do their reading while streaming
+                    b"".join(response.streaming_content)
+                timings.append(time.perf_counter() - started)
+            if response.streaming and response.is_async:
+                # Event streams never end; only opening one is measured
+                response.close()
+
+            self.assertLess(response.status_code, 400, f"{url} answered {response.status_code}")
+            queries = max(queries, len(captured))
+            self.assertLessEqual(
+                len(captured), spec["budget"],
+                f"{url} ran {len(captured)} queries, budget is {spec['budget']}:\n"
+                + "\n".join(q["sql"] for q in captured.captured_queries),
+            )
+        self.results[route] = (queries, timings)
+
+
+class ExplainTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_data", users=40, issues=200, stdout=StringIO())
+
+    def test_hot_views_use_indexes(self):
+        for label, url, sql, plan, problems, known in check_views():
+            with self.subTest(view=label, sql=sql[:80]):
+                self.assertTrue(known or not problems, f"{url}: {', '.join(problems)}\n{sql}\n" + "\n".join(plan))
+
+
+class IssueFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+        now = timezone.now()
+        for i in range(30):
+            issue = Issue.objects.create(title=f"Issue {i}", description="Needs fixing", reporter=cls.citizen)
+            # Runs of equal timestamps and vote counts, so the id tie-break is exercised
+            Issue.objects.filter(pk=issue.pk).update(created_at=now - timedelta(hours=i // 4), vote_count=i % 3)
+
+    def setUp(self):
+        self.client.force_login(self.citizen)
+
+    def walk(self, **params):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse("view_all_issues"), {**params, **({"cursor": cursor} if cursor else {})})
+            page = response.context["page"]
+            self.assertLessEqual(len(page), ISSUE_FEED_PAGE_SIZE)
+            seen += [issue.pk for issue in page]
+            cursor = page.next_cursor
+            if not cursor:
+                return seen
+
+    def test_pages_follow_each_sort_without_gaps_or_repeats(self):
+        for sort, ordering in (("newest", ("-created_at", "-id")), ("most_voted", ("-vote_count", "-created_at", "-id"))):
+            with self.subTest(sort=sort):
+                self.assertEqual(
+                    self.walk(sort=sort), list(Issue.objects.order_by(*ordering).values_list("id", flat=True)),
+                )
+
+    def test_new_issues_do_not_shift_later_pages(self):
+        first = self.client.get(reverse("view_all_issues")).context["page"]
+        Issue.objects.create(title="Brand new", description="Reported meanwhile", reporter=self.citizen)
+        second = self.client.get(reverse("view_all_issues"), {"cursor": first.next_cursor}).context["page"]
+        expected = list(Issue.objects.exclude(title="Brand new").order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual([i.pk for i in first] + [i.pk for i in second], expected[:2 * ISSUE_FEED_PAGE_SIZE])
+
+    def test_infinite_scroll_batch(self):
+        first = self.client.get(reverse("view_all_issues")).context["page"]
+        data = self.client.get(reverse("view_all_issues"), {"cursor": first.next_cursor, "format": "json"}).json()
+        self.assertTrue(data["has_next"])
+        self.assertIn("Issue", data["html"])
+
+    def test_bad_cursor_restarts_from_the_top(self):
+        for cursor in ("not-a-cursor", encode_cursor(["x"]), encode_cursor(["yesterday", 3])):
+            with self.subTest(cursor=cursor):
+                page = self.client.get(reverse("view_all_issues"), {"cursor": cursor}).context["page"]
+                self.assertEqual(
+                    [i.pk for i in page],
+                    list(Issue.objects.order_by("-created_at", "-id").values_list("id", flat=True)[:ISSUE_FEED_PAGE_SIZE]),
+                )
+
+
+class VoteCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.voters = [User.objects.create_user(f"voter{i}", is_citizen=True) for i in range(3)]
+        cls.department = Department.objects.create(name="Roads")
+        cls.issue = Issue.objects.create(
+            title="Pothole", description="Deep pothole", reporter=cls.reporter, latitude=9.93, longitude=76.26,
+        )
+
+    def setUp(self):
+        cache.clear()  # throttle buckets left by earlier tests
+
+    def assertCountMatchesVotes(self, issue):
+        issue.refresh_from_db()
+        self.assertEqual(issue.vote_count, issue.votes.count())
+        self.assertAlmostEqual(issue.priority, issue_priority(issue.status, issue.vote_count, issue.created_at))
+
+    def test_vote_toggle(self):
+        client = Client()
+        client.force_login(self.voters[0])
+        url = reverse("vote_issue", args=[self.issue.pk])
+        self.assertEqual(client.post(url).json()["vote_count"], 1)
+        self.assertCountMatchesVotes(self.issue)
+        self.assertEqual(client.post(url).json(), {"success": True, "voted": False, "vote_count": 0})
+        self.assertCountMatchesVotes(self.issue)
+
+    def test_saving_a_stale_issue_keeps_later_votes(self):
+        # Loaded before the votes, as update_issue_status does
+        stale = Issue.objects.get(pk=self.issue.pk)
+        for voter in self.voters[:2]:
+            Vote.objects.create(user=voter, issue=self.issue)
+        stale.status = Issue.STATUS_IN_PROGRESS
+        stale.save()
+        self.assertAlmostEqual(stale.priority, issue_priority(Issue.STATUS_IN_PROGRESS, 2, stale.created_at))
+        self.assertCountMatchesVotes(self.issue)
+        self.assertEqual(self.issue.vote_count, 2)
+
+    def test_assigning_a_stale_issue_keeps_later_votes(self):
+        stale = Issue.objects.get(pk=self.issue.pk)
+        Vote.objects.create(user=self.voters[0], issue=self.issue)
+        stale.assign_to_department(self.department)
+        self.assertCountMatchesVotes(self.issue)
+        self.assertEqual((self.issue.vote_count, self.issue.department), (1, self.department))
+
+    def test_vote_removed_after_load(self):
+        Vote.objects.create(user=self.voters[0], issue=self.issue)
+        stale = Issue.objects.get(pk=self.issue.pk)
+        Vote.objects.filter(issue=self.issue).delete()
+        stale.title = "Pothole on MG Road"
+        stale.save()
+        self.assertCountMatchesVotes(self.issue)
+        self.assertEqual(self.issue.vote_count, 0)
+
+    def test_rebuild_vote_counts_repairs_drift(self):
+        Vote.objects.create(user=self.voters[0], issue=self.issue)
+        Issue.objects.filter(pk=self.issue.pk).update(vote_count=5)
+        call_command("rebuild_vote_counts", stdout=StringIO())
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.vote_count, 1)
+
+
+class NearbyIssuesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        # ~0m, ~110m, ~440m and ~2.2km north of the centre, plus one across a geohash cell edge
+        cls.issues = [
+            Issue.objects.create(title=f"Issue {i}", description="Needs fixing", reporter=reporter,
+                                 latitude=9.9312 + dlat, longitude=76.2673 + dlng)
+            for i, (dlat, dlng) in enumerate(((0, 0), (0.001, 0), (0.004, 0), (0.02, 0), (0, -0.0035)))
+        ]
+
+    def test_issues_within_radius_nearest_first(self):
+        response = self.client.get(reverse("nearby_issues"), {"lat": 9.9312, "lng": 76.2673, "radius": 500})
+        found = response.json()["issues"]
+        self.assertEqual([i["id"] for i in found], [self.issues[n].pk for n in (0, 1, 4, 2)])
+        distances = [i["distance_m"] for i in found]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[1], 111.2, delta=1)
+
+    def test_rejects_bad_coordinates_and_radius(self):
+        for params in ({"lat": "nan", "lng": 76.26}, {"lat": 9.93, "lng": "inf"}, {"lat": 9.93},
+                       {"lat": 9.93, "lng": 76.26, "radius": 50000}):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(reverse("nearby_issues"), params).status_code, 400)
+
+    def test_benchmark_seeds_like_save_and_cleans_up(self):
+        before = rollup_snapshot(), map_cell_snapshot()
+        call_command("benchmark_nearby", seed=30, queries=5, stdout=StringIO())
+        synthetic = Issue.objects.filter(reporter__username=BENCH_USERNAME)
+        issue = synthetic.first()
+        self.assertEqual(issue.signature, minhash_signature(f"{issue.title} {issue.description}"))
+        self.assertAlmostEqual(issue.priority, issue_priority(issue.status, 0, issue.created_at))
+        self.assertEqual(sum(rollup_snapshot().values()), Issue.objects.count())
+        self.assertEqual(sum(count for (cell, _), (count, *_) in map_cell_snapshot().items() if len(cell) == 1), 35)
+
+        call_command("benchmark_nearby", queries=5, cleanup=True, stdout=StringIO())
+        self.assertFalse(synthetic.exists())
+        self.assertEqual((rollup_snapshot(), map_cell_snapshot()), before)
+
+
+class SimilarIssuesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+
+        def issue(title, lat, lng, **extra):
+            return Issue.objects.create(
+                title=title, description="Deep pothole next to the bus stand, two wheelers keep falling in",
+                reporter=cls.citizen, latitude=lat, longitude=lng, **extra,
+            )
+
+        cls.nearby = issue("Pothole near bus stand", 9.93, 76.26)
+        cls.far = issue("Pothole near bus stand", 9.95, 76.26)  # ~2km north
+        cls.resolved = issue("Pothole near bus stand", 9.9301, 76.26, status=Issue.STATUS_RESOLVED)
+        cls.unrelated = Issue.objects.create(
+            title="Streetlight out", description="The streetlight by the temple has been dark for a week",
+            reporter=cls.citizen, latitude=9.9301, longitude=76.2601,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.citizen)
+
+    def similar(self, **params):
+        return self.client.get(reverse("similar_issues"), params)
+
+    def test_finds_open_issues_nearby_with_similar_text(self):
+        response = self.similar(
+            lat=9.9302, lng=76.2601, title="Pothole near the bus stand",
+            description="Deep pothole next to the bus stand, two wheelers keep falling in",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i["id"] for i in response.json()["issues"]], [self.nearby.pk])
+        self.assertGreater(response.json()["issues"][0]["similarity"], 0.5)
+
+    def test_rejects_bad_coordinates(self):
+        for lat, lng in (("nan", "76.26"), ("inf", "76.26"), ("9.93", "-inf"), ("91", "76.26"), ("x", "76.26")):
+            with self.subTest(lat=lat, lng=lng):
+                response = self.similar(lat=lat, lng=lng, title="Pothole", description="Deep pothole")
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()["success"])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+
+        def issue(title, description, location=""):
+            return Issue.objects.create(title=title, description=description, location=location, reporter=cls.citizen)
+
+        cls.in_title = issue("Flooded drain", "Water everywhere after the rain")
+        cls.in_location = issue("Broken slab", "Someone will fall in", location="Drain road junction")
+        cls.in_description = issue("Bad smell", "Comes from the blocked drain by the school")
+        cls.unrelated = issue("Streetlight out", "Dark at night")
+
+    def search(self, query):
+        return list(Issue.objects.search(query).order_by("-rank", "-id"))
+
+    def test_title_outranks_location_outranks_description(self):
+        self.assertEqual(self.search("drain"), [self.in_title, self.in_location, self.in_description])
+
+    def test_every_word_must_match_with_stemming_and_prefix(self):
+        self.assertEqual(self.search("flooding drains"), [self.in_title])
+        self.assertEqual(self.search("streetli"), [self.unrelated])
+        self.assertEqual(self.search("drain pothole"), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        Issue.objects.filter(pk=self.unrelated.pk).update(title="Streetlight out near the drain")
+        self.assertIn(self.unrelated, self.search("drain"))
+        self.in_title.delete()
+        self.assertNotIn(self.in_title.pk, [i.pk for i in self.search("flooded")])
+
+    def test_feed_sorts_by_relevance(self):
+        self.client.force_login(self.citizen)
+        response = self.client.get(reverse("view_all_issues"), {"q": "drain"})
+        self.assertEqual(response.context["selected_sort"], "relevance")
+        self.assertEqual(
+            [i.pk for i in response.context["issues"]], [self.in_title.pk, self.in_location.pk, self.in_description.pk],
+        )
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('drain" OR "light'), [])
+        self.assertEqual(list(Issue.objects.search("!!!")), list(Issue.objects.all()))
+
+
+def rollup_snapshot():
+    # Summed: rows whose department was deleted can share a key
+    totals = Counter()
+    for row in IssueDailyRollup.objects.all():
+        totals[row.day, row.status, row.department_id, row.reporter_id] += row.count
+    return +totals
+
+
+def map_cell_snapshot():
+    return {
+        (cell.cell, cell.status): (cell.count, round(cell.lat_sum, 6), round(cell.lng_sum, 6))
+        for cell in MapCell.objects.exclude(count=0)
+    }
+
+
+class DerivedDataTestCase(TestCase):
+    """Checks the incrementally kept rollups and map grid against a rebuild from Issue."""
+
+    def assertDerivedDataMatchesRecount(self):
+        rollups, cells = rollup_snapshot(), map_cell_snapshot()
+        rebuild_rollups()
+        rebuild_map_cells()
+        self.assertEqual(rollups, rollup_snapshot())
+        self.assertEqual(cells, map_cell_snapshot())
+
+
+class RollupTests(DerivedDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", password=None)
+        cls.reporters = [User.objects.create_user(f"citizen{i}", is_citizen=True) for i in range(3)]
+        cls.roads, cls.water = Department.objects.create(name="Roads"), Department.objects.create(name="Water")
+        for i in range(12):
+            issue = Issue.objects.create(
+                title=f"Issue {i}", description="Needs fixing", reporter=cls.reporters[i % 3],
+                department=(cls.roads, cls.water, None)[i % 3], latitude=9.93 + i / 100, longitude=76.26,
+            )
+            Issue.objects.filter(pk=issue.pk).update(created_at=issue.created_at - timedelta(days=i % 4))
+        rebuild_rollups()
+        rebuild_map_cells()
+
+    def test_issue_writes_keep_rollups_in_step(self):
+        issue = Issue.objects.create(title="New", description="Needs fixing", reporter=self.reporters[0])
+        issue.assign_to_department(self.water)
+        issue.status = Issue.STATUS_RESOLVED
+        issue.latitude, issue.longitude = 9.95, 76.27
+        issue.save()
+        Issue.objects.filter(department=self.roads).first().delete()
+        self.assertDerivedDataMatchesRecount()
+
+    def test_deleting_a_department_or_reporter(self):
+        self.roads.delete()
+        self.reporters[1].delete()
+        self.assertDerivedDataMatchesRecount()
+
+    def test_reports_page_totals(self):
+        self.client.force_login(self.admin)
+        context = self.client.get(reverse("superadmin_reports")).context
+        self.assertEqual(context["total_issues"], Issue.objects.count())
+        self.assertEqual(
+            {row["status"]: row["count"] for row in context["status_counts"]},
+            dict(Issue.objects.values_list("status").annotate(n=Count("id")).order_by()),
+        )
+        self.assertEqual(
+            {row["reporter__username"]: row["count"] for row in context["top_citizens"]},
+            {user.username: 4 for user in self.reporters},
+        )
+        self.assertEqual(sum(row["count"] for row in context["issues_last_30_days"]), 12)
+
+
+class HomeStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+        cls.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=cls.citizen)
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self):
+        context = self.client.get(reverse("home")).context
+        return {key: context[key] for key in ("total_issues", "resolved_issues", "active_users", "total_departments")}
+
+    def test_served_from_cache_until_something_changes(self):
+        self.assertEqual(self.stats(), {"total_issues": 1, "resolved_issues": 0, "active_users": 1, "total_departments": 0})
+        with self.assertNumQueries(0):
+            self.client.get(reverse("home"))
+
+        self.issue.status = Issue.STATUS_RESOLVED
+        self.issue.save()
+        Issue.objects.create(title="Streetlight", description="Out", reporter=self.citizen)
+        Department.objects.create(name="Roads")
+        User.objects.create_user("another")
+        self.assertEqual(self.stats(), {"total_issues": 2, "resolved_issues": 1, "active_users": 2, "total_departments": 1})
+
+    def test_recent_issue_votes_refresh_the_block(self):
+        self.stats()
+        Vote.objects.create(user=self.citizen, issue=self.issue)
+        recent = self.client.get(reverse("home")).context["recent_issues"]
+        self.assertEqual(recent[0].vote_count, 1)
+
+    def test_logins_keep_the_block(self):
+        self.stats()
+        self.client.force_login(self.citizen)  # saves last_login only
+        self.assertIsNotNone(cache.get(HOME_CACHE_KEY))
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+        cls.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=cls.citizen)
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(issue=self.issue, user=self.citizen, content=content, parent=parent)
+
+    def test_threads_render_depth_first_at_any_depth(self):
+        first = self.comment("1")
+        second = self.comment("2")
+        reply = self.comment("1.1", first)
+        self.comment("2.1", second)
+        deep = reply
+        for depth in range(2, 12):
+            deep = self.comment(f"1.1{'.1' * (depth - 1)}", deep)
+        self.comment("1.2", first)
+
+        comments = list(self.client.get(reverse("issue_detail", args=[self.issue.pk])).context["comments"])
+        self.assertEqual(
+            [c.content for c in comments],
+            ["1", "1.1", *(f"1.1{'.1' * n}" for n in range(1, 11)), "1.2", "2", "2.1"],
+        )
+        self.assertEqual([c.depth for c in comments[:12]], list(range(12)))
+        self.assertEqual({c.thread_id for c in comments[:13]}, {first.pk})
+
+    def test_pages_split_between_threads(self):
+        for i in range(COMMENT_THREADS_PER_PAGE + 1):
+            self.comment(f"reply to {i}", self.comment(f"thread {i}"))
+        second = self.client.get(reverse("issue_detail", args=[self.issue.pk]), {"page": 2}).context["comments"]
+        self.assertEqual([c.content for c in second], [f"thread {COMMENT_THREADS_PER_PAGE}", f"reply to {COMMENT_THREADS_PER_PAGE}"])
+
+
+def jpeg_bytes(width, height, **save_options):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "orange").save(out, "JPEG", **save_options)
+    return out.getvalue()
+
+
+class FailingUploader:
+    def upload(self, file, filename):
+        raise ConnectionError("photo backend unreachable")
+
+    upload_derivative = upload
+
+
+class RecordingUploader(LocalFileSystemUploader):
+    """Notes each upload and whether a transaction was open; fails after `fail_after` of them."""
+
+    def __init__(self, location, fail_after=None):
+        super().__init__(location=location)
+        self.fail_after = fail_after
+        self.uploads, self.open_transactions = [], set()
+
+    def record(self, filename):
+        if len(self.uploads) == self.fail_after:
+            raise ConnectionError("photo backend unreachable")
+        self.uploads.append(filename)
+        self.open_transactions.add(len(connection.atomic_blocks))
+
+    def upload(self, file, filename):
+        self.record(filename)
+        return super().upload(file, filename)
+
+    def upload_derivative(self, file, filename):
+        self.record(filename)
+        return super().upload_derivative(file, filename)
+
+
+class PhotoUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.uploader = LocalFileSystemUploader(location=directory.name)
+        self.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=self.citizen)
+        stage_photo(self.issue, SimpleUploadedFile("pothole.jpg", jpeg_bytes(800, 600), "image/jpeg"))
+
+    def test_report_form_stages_the_photo(self):
+        cache.clear()
+        self.client.force_login(self.citizen)
+        self.client.post(reverse("report_issue"), {
+            "title": "Streetlight out", "description": "Dark at night", "location": "MG Road",
+            "photo": SimpleUploadedFile("light.jpg", jpeg_bytes(100, 100), "image/jpeg"),
+        })
+        issue = Issue.objects.get(title="Streetlight out")
+        self.assertTrue(issue.photo_pending)
+        self.assertFalse(issue.photo)
+        self.assertEqual(issue.photo_upload.filename, "light.jpg")
+
+    def test_worker_uploads_and_clears_the_flag(self):
+        self.assertEqual(process_pending_uploads(uploader=self.uploader), (1, 0))
+        self.issue.refresh_from_db()
+        self.assertFalse(self.issue.photo_pending)
+        self.assertTrue(str(self.issue.photo).startswith("local/"))
+        self.assertFalse(PhotoUpload.objects.exists())
+
+    def test_uploads_run_outside_a_transaction(self):
+        uploader = RecordingUploader(self.uploader.storage.location)
+        outside = len(connection.atomic_blocks)  # the test case's own
+        self.assertEqual(process_pending_uploads(uploader=uploader), (1, 0))
+        self.assertEqual(uploader.open_transactions, {outside})
+
+    def test_retries_reuse_what_was_uploaded(self):
+        # The original and two of the six thumbnails get through
+        flaky = RecordingUploader(self.uploader.storage.location, fail_after=3)
+        self.assertEqual(process_pending_uploads(uploader=flaky), (0, 1))
+        self.assertEqual(flaky.uploads[0], "pothole.jpg")
+        job = PhotoUpload.objects.get()
+        self.assertTrue(job.photo)
+        self.assertEqual(sum(map(len, job.thumbnails.values())), 2)
+
+        PhotoUpload.objects.update(next_attempt_at=timezone.now())
+        retry = RecordingUploader(self.uploader.storage.location)
+        self.assertEqual(process_pending_uploads(uploader=retry), (1, 0))
+        self.assertEqual(len(retry.uploads), 4)
+        self.assertNotIn("pothole.jpg", retry.uploads)
+        self.issue.refresh_from_db()
+        self.assertEqual(str(self.issue.photo), str(job.photo))
+        self.assertEqual({key: len(urls) for key, urls in self.issue.thumbnails.items()}, {"webp": 3, "jpeg": 3})
+
+    def test_failures_back_off_then_give_up(self):
+        self.assertEqual(process_pending_uploads(uploader=FailingUploader()), (0, 1))
+        job = PhotoUpload.objects.get()
+        self.assertEqual((job.attempts, job.status), (1, PhotoUpload.STATUS_PENDING))
+        self.assertGreater(job.next_attempt_at, timezone.now() + RETRY_BASE_DELAY - timedelta(seconds=5))
+        # Not due yet
+        self.assertEqual(process_pending_uploads(uploader=self.uploader), (0, 0))
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            PhotoUpload.objects.update(next_attempt_at=timezone.now())
+            process_pending_uploads(uploader=FailingUploader())
+        job.refresh_from_db()
+        self.issue.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (PhotoUpload.STATUS_FAILED, "photo backend unreachable"))
+        self.assertFalse(self.issue.photo_pending)
+
+
+class ThumbnailTests(TestCase):
+    def thumbnails(self, data):
+        return {(key, width): Image.open(io.BytesIO(content)) for key, width, content in make_thumbnails(data)}
+
+    def test_widths_formats_and_orientation(self):
+        # A 1200x800 camera photo tagged "rotate 90°": upright it is 800 wide
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = "Phone camera"
+        thumbs = self.thumbnails(jpeg_bytes(1200, 800, exif=exif.tobytes()))
+        self.assertEqual(set(thumbs), {(key, w) for key in ("webp", "jpeg") for w in (320, 640, 800)})
+        self.assertEqual(thumbs["jpeg", 320].size, (320, 480))
+        self.assertEqual(thumbs["webp", 800].format, "WEBP")
+        for image in thumbs.values():
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_never_upscales(self):
+        self.assertEqual({w for _, w in self.thumbnails(jpeg_bytes(200, 100))}, {200})
+
+    def test_ignores_non_images(self):
+        self.assertEqual(self.thumbnails(b"not an image"), {})
+
+    def test_uploaded_photo_gets_srcsets(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        issue = Issue.objects.create(
+            title="Pothole", description="Deep pothole", reporter=User.objects.create_user("citizen"),
+        )
+        stage_photo(issue, SimpleUploadedFile("pothole.jpg", jpeg_bytes(1500, 1000), "image/jpeg"))
+        process_pending_uploads(uploader=LocalFileSystemUploader(location=directory.name))
+        issue.refresh_from_db()
+        self.assertEqual(sorted(issue.thumbnails["webp"], key=int), ["320", "640", "960"])
+        self.assertIn("pothole-320w.jpg 320w", issue.jpeg_srcset)
+        self.assertEqual(issue.card_image_url, issue.thumbnails["jpeg"]["640"])
+
+
+class BulkModerationTests(DerivedDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_data", users=20, issues=80, stdout=StringIO())
+        cls.admin = User.objects.get(username="seed_admin")
+        cls.department = Department.objects.order_by("id").first()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def bulk(self, **data):
+        return self.client.post(
+            reverse("bulk_issue_action"), data, headers={"x-requested-with": "XMLHttpRequest"},
+        )
+
+    def open_issue_ids(self, n):
+        return list(
+            Issue.objects.exclude(status=Issue.STATUS_RESOLVED).order_by("id").values_list("id", flat=True)[:n]
+        )
+
+    def test_set_status(self):
+        ids = self.open_issue_ids(30)
+        before = {i.pk: i for i in Issue.objects.filter(id__in=ids)}
+        response = self.bulk(action="status", new_status=Issue.STATUS_RESOLVED, issue_ids=ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["success"])
+        for issue in Issue.objects.filter(id__in=ids):
+            self.assertEqual(issue.status, Issue.STATUS_RESOLVED)
+            self.assertAlmostEqual(
+                issue.priority, issue_priority(issue.status, issue.vote_count, issue.created_at), places=6,
+            )
+            self.assertEqual(issue.vote_count, before[issue.pk].vote_count)
+        self.assertDerivedDataMatchesRecount()
+
+    def test_assign_department(self):
+        ids = self.open_issue_ids(30)
+        self.bulk(action="assign", department_id=self.department.pk, issue_ids=ids)
+        self.assertEqual(
+            set(Issue.objects.filter(id__in=ids).values_list("department_id", "status")),
+            {(self.department.pk, Issue.STATUS_ACKNOWLEDGED)},
+        )
+        self.assertDerivedDataMatchesRecount()
+
+    def test_delete_fake_bans_reporters(self):
+        ids = self.open_issue_ids(10)
+        reporters = set(Issue.objects.filter(id__in=ids).values_list("reporter_id", flat=True))
+        response = self.bulk(action="delete_fake", issue_ids=ids)
+        self.assertTrue(response.json()["success"])
+        self.assertFalse(Issue.objects.filter(id__in=ids).exists())
+        self.assertEqual(set(User.objects.currently_banned().values_list("id", flat=True)), reporters)
+        self.assertDerivedDataMatchesRecount()
+
+    def test_queries_do_not_grow_with_the_selection(self):
+        queries = []
+        for ids, status in ((self.open_issue_ids(5), Issue.STATUS_IN_PROGRESS),
+                            (self.open_issue_ids(60), Issue.STATUS_RESOLVED)):
+            with CaptureQueriesContext(connection) as captured:
+                bulk_set_status(ids, status)
+            queries.append(len(captured))
+        self.assertLessEqual(queries[1], queries[0] + 2)  # at most one more missing-row insert per table
+
+    def test_rejects_unknown_status(self):
+        response = self.bulk(action="status", new_status="bogus", issue_ids=self.open_issue_ids(3))
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.banned = User.objects.create_user("banned", password="pw", is_citizen=True)
+        cls.expired = User.objects.create_user("expired", password="pw", is_citizen=True)
+        User.objects.filter(pk=cls.banned.pk).update(is_banned=True, banned_until=timezone.now() + timedelta(days=3))
+        User.objects.filter(pk=cls.expired.pk).update(is_banned=True, banned_until=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, username):
+        return self.client.post(reverse("login"), {"username": username, "password": "pw"})
+
+    def test_banned_users_are_turned_away_at_login(self):
+        self.assertRedirects(self.login("banned"), reverse("login"), fetch_redirect_response=False)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_expired_ban_lets_the_user_in_without_writing_it(self):
+        self.assertRedirects(self.login("expired"), reverse("home"), fetch_redirect_response=False)
+        # The check is read-only; the sweep lifts the ban
+        self.assertTrue(User.objects.get(pk=self.expired.pk).is_banned)
+
+    def test_ban_logs_out_open_sessions(self):
+        citizen = User.objects.create_user("citizen", is_citizen=True)
+        self.client.force_login(citizen)
+        self.assertEqual(self.client.get(reverse("citizen_dashboard")).status_code, 200)
+        User.objects.get(pk=citizen.pk).ban(days=7)
+        self.assertRedirects(self.client.get(reverse("citizen_dashboard")), reverse("login"), fetch_redirect_response=False)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_sweep_lifts_only_expired_bans(self):
+        out = StringIO()
+        call_command("sweep_expired_bans", "--dry-run", stdout=out)
+        self.assertIn("1 expired ban(s) would be lifted", out.getvalue())
+        self.assertTrue(User.objects.get(pk=self.expired.pk).is_banned)
+
+        call_command("sweep_expired_bans", stdout=StringIO())
+        self.assertEqual(
+            set(User.objects.filter(is_banned=True).values_list("username", flat=True)), {"banned"},
+        )
+        self.assertIsNone(User.objects.get(pk=self.expired.pk).banned_until)
+
+
+class WorkQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.resolver = User.objects.create_user("resolver", is_resolver=True)
+        cls.outsider = User.objects.create_user("outsider", is_resolver=True)
+        cls.department = Department.objects.create(name="Roads")
+        cls.department.users.add(cls.resolver)
+        other = Department.objects.create(name="Water")
+        statuses = [Issue.STATUS_REPORTED, Issue.STATUS_ACKNOWLEDGED, Issue.STATUS_IN_PROGRESS, Issue.STATUS_RESOLVED]
+        for i in range(40):
+            issue = Issue.objects.create(
+                title=f"Issue {i}", description="Needs fixing", reporter=reporter,
+                department=other if i % 10 == 0 else cls.department, status=statuses[i % 4],
+            )
+            # Spread the ages and votes so the three priority terms all matter
+            created_at = issue.created_at - timedelta(days=i % 7)
+            Issue.objects.filter(pk=issue.pk).update(
+                created_at=created_at, vote_count=i % 5,
+                priority=issue_priority(issue.status, i % 5, created_at),
+            )
+
+    def test_pages_walk_open_issues_by_priority(self):
+        self.client.force_login(self.resolver)
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse("department_dashboard"), {"cursor": cursor} if cursor else {})
+            page = response.context["page"]
+            self.assertLessEqual(len(page), WORK_QUEUE_PAGE_SIZE)
+            seen += [issue.pk for issue in page]
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        expected = list(
+            Issue.objects.filter(department=self.department).exclude(status=Issue.STATUS_RESOLVED)
+            .order_by("-priority", "-id").values_list("id", flat=True)
+        )
+        self.assertGreater(len(expected), WORK_QUEUE_PAGE_SIZE)
+        self.assertEqual(seen, expected)
+
+    def test_status_filter(self):
+        self.client.force_login(self.resolver)
+        response = self.client.get(reverse("department_dashboard"), {"status": Issue.STATUS_RESOLVED})
+        self.assertEqual({issue.status for issue in response.context["issues"]}, {Issue.STATUS_RESOLVED})
+
+    def test_only_members_change_status(self):
+        issue = Issue.objects.filter(department=self.department, status=Issue.STATUS_REPORTED).first()
+        url = reverse("update_issue_status", args=[issue.pk])
+        for user, expected in ((self.outsider, Issue.STATUS_REPORTED), (self.resolver, Issue.STATUS_IN_PROGRESS)):
+            self.client.force_login(user)
+            self.client.post(url, {"status": Issue.STATUS_IN_PROGRESS})
+            issue.refresh_from_db()
+            self.assertEqual(issue.status, expected)
+        # In progress drops the "not looked at yet" weight
+        self.assertAlmostEqual(issue.priority, issue_priority(issue.status, issue.vote_count, issue.created_at))
+
+
+class LiveUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=reporter)
+
+    def setUp(self):
+        cache.clear()  # the anonymous page cache would serve the other setting's page
+
+    @override_settings(LIVE_UPDATES=False)
+    def test_off_under_wsgi(self):
+        self.assertNotContains(self.client.get(reverse("issue_detail", args=[self.issue.pk])), "EventSource")
+        self.assertEqual(self.client.get(reverse("issue_events", args=[self.issue.pk])).status_code, 204)
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish_issue_event(self.issue, "vote", vote_count=1)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(LIVE_UPDATES=True)
+    def test_page_follows_its_stream(self):
+        self.assertContains(self.client.get(reverse("issue_detail", args=[self.issue.pk])), "EventSource")
+
+    @override_settings(LIVE_UPDATES=True)
+    async def test_stream_delivers_committed_events(self):
+        response = await self.async_client.get(reverse("issue_events", args=[self.issue.pk]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+
+        def vote():
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_issue_event(self.issue, "vote", vote_count=3)
+
+        await sync_to_async(vote)()
+        event = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertTrue(event.startswith("event: vote\n"))
+        self.assertIn('"vote_count": 3', event)
+        response.close()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.department = Department.objects.create(name="Roads")
+        cls.issues = [
+            Issue.objects.create(
+                title=f"Issue {i}", description="Needs fixing", reporter=reporter,
+                department=cls.department if i % 2 else None,
+                status=Issue.STATUS_RESOLVED if i % 5 == 0 else Issue.STATUS_REPORTED,
+            )
+            for i in range(7)
+        ]
+        root = Comment.objects.create(issue=cls.issues[0], user=reporter, content="Root")
+        Comment.objects.create(issue=cls.issues[0], user=reporter, content="Reply", parent=root)
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_fields_choose_keys_and_columns(self):
+        with CaptureQueriesContext(connection) as captured:
+            body = self.get("api_issue_detail", self.issues[1].pk, fields="title,department").json()
+        self.assertEqual(body["result"], {"title": "Issue 1", "department": "Roads"})
+        self.assertNotIn('"description"', captured.captured_queries[0]["sql"])
+
+        response = self.get("api_issue_list", fields="title,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+
+    def test_list_pages_and_filters(self):
+        seen, cursor = [], None
+        while True:
+            body = self.get("api_issue_list", limit=3, fields="id", **({"cursor": cursor} if cursor else {})).json()
+            seen += [row["id"] for row in body["results"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [issue.pk for issue in reversed(self.issues)])
+
+        body = self.get("api_issue_list", department="none", status=Issue.STATUS_REPORTED, fields="id").json()
+        self.assertEqual({row["id"] for row in body["results"]}, {self.issues[2].pk, self.issues[4].pk, self.issues[6].pk})
+        self.assertEqual(self.get("api_issue_list", cursor="garbage").status_code, 400)
+
+    def test_comments_and_missing_issues(self):
+        body = self.get("api_issue_comments", self.issues[0].pk, fields="content,depth").json()
+        self.assertEqual(body["results"], [{"content": "Root", "depth": 0}, {"content": "Reply", "depth": 1}])
+        self.assertEqual(self.get("api_issue_comments", self.issues[1].pk).json()["results"], [])
+        self.assertEqual(self.get("api_issue_detail", 999999).status_code, 404)
+        self.assertEqual(self.get("api_issue_comments", 999999).status_code, 404)
+        self.assertEqual(self.get("api_department_list").json()["results"], [{"id": self.department.pk, "name": "Roads"}])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+        cls.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=cls.citizen)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("issue_detail", args=[self.issue.pk])
+
+    def test_issue_page_revalidates_until_it_changes(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, headers={"if-none-match": etag}).status_code, 304)
+        Comment.objects.create(issue=self.issue, user=self.citizen, content="Still there")
+        response = self.client.get(self.url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Still there")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_anonymous_pages_come_from_the_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), "Deep pothole")
+
+    def test_signed_in_pages_are_not_shared(self):
+        self.client.get(self.url)
+        self.client.force_login(self.citizen)
+        response = self.client.get(self.url)
+        self.assertContains(response, "Write a comment")
+        self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_feed_etag_follows_votes(self):
+        self.client.force_login(self.citizen)
+        feed = reverse("view_all_issues")
+        etag = self.client.get(feed)["ETag"]
+        self.assertEqual(self.client.get(feed, headers={"if-none-match": etag}).status_code, 304)
+        Vote.objects.create(user=self.citizen, issue=self.issue)
+        self.assertEqual(self.client.get(feed, headers={"if-none-match": etag}).status_code, 200)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", password="x")
+        cls.department = Department.objects.create(name="Roads")
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.old = Issue.objects.create(title="Old, \"quoted\"", description="a", reporter=reporter, department=cls.department)
+        cls.new = Issue.objects.create(title="New", description="b", reporter=reporter, status=Issue.STATUS_RESOLVED)
+        Issue.objects.filter(pk=cls.old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        Vote.objects.create(user=reporter, issue=cls.old)
+
+    def export(self, *args, **options):
+        out = StringIO()
+        call_command("export_data", *args, stdout=out, **options)
+        return out.getvalue()
+
+    def exported(self, dataset, key="id", **filters):
+        return [json.loads(line)[key] for line in self.export(dataset, format="ndjson", **filters).splitlines()]
+
+    def test_filters_pick_rows(self):
+        since = (timezone.localdate() - timedelta(days=2)).isoformat()
+        self.assertEqual(self.exported("issues", start=since), [self.new.pk])
+        self.assertEqual(self.exported("issues", end=since), [self.old.pk])
+        self.assertEqual(self.exported("issues", department="none"), [self.new.pk])
+        self.assertEqual(self.exported("issues", status=Issue.STATUS_RESOLVED), [self.new.pk])
+        self.assertEqual(self.exported("votes", "issue_id", department=str(self.department.pk)), [self.old.pk])
+        self.assertEqual(self.exported("votes", status=Issue.STATUS_RESOLVED), [])
+
+    def test_csv_round_trips(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("issues"))))
+        self.assertEqual([row["title"] for row in rows], ['Old, "quoted"', "New"])
+        self.assertEqual(rows[0]["department"], "Roads")
+        self.assertEqual(rows[1]["department"], "")
+
+    def test_csv_neutralises_formulas(self):
+        titles = ['=HYPERLINK("http://evil")', "+1", "-1+2", "@SUM(A1)", "\tcmd", "\rcmd"]
+        for title in titles + ["a=b"]:
+            Issue.objects.filter(pk=self.new.pk).update(title=title)
+            with self.subTest(title=title):
+                rows = list(csv.DictReader(io.StringIO(self.export("issues"))))
+                self.assertEqual(rows[1]["title"], "'" + title if title in titles else title)
+                self.assertEqual(self.exported("issues", key="title")[1], title)
+
+    def test_bad_filters_are_refused(self):
+        with self.assertRaisesMessage(CommandError, "start must be a date"):
+            self.export("issues", start="yesterday")
+        self.client.force_login(self.admin)
+        url = reverse("export_data", args=["issues"])
+        self.assertEqual(self.client.get(url, {"status": "lost"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 404)
+        self.assertEqual(self.client.get(reverse("export_data", args=["users"])).status_code, 404)
+
+    def test_view_streams_the_same_lines(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("export_data", args=["issues"]), {"format": "ndjson", "department": "none"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn("civicfix-issues-", response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content).decode(), self.export("issues", format="ndjson", department="none"))
+
+
+class ImportTests(DerivedDataTestCase):
+    records = [
+        {
+            "title": f"Legacy complaint {i}", "description": "Imported from the old 311 system",
+            "reporter": f"legacy{i % 4}", "department": "Roads" if i % 2 else "",
+            "status": Issue.STATUS_RESOLVED if i % 3 == 0 else Issue.STATUS_REPORTED,
+            "latitude": 9.93 + i / 1000, "longitude": 76.26, "created_at": f"2024-03-{i % 28 + 1:02d}T08:00:00",
+        }
+        for i in range(25)
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, records):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        return path
+
+    def run_import(self, path, **options):
+        call_command("import_issues", path, source="legacy.ndjson", stdout=StringIO(), **options)
+
+    def imported_titles(self):
+        return sorted(Issue.objects.values_list("title", flat=True))
+
+    def test_import(self):
+        self.run_import(self.write("legacy.ndjson", self.records + [{"title": "", "reporter": "x"}]), batch_size=10)
+        self.assertEqual(self.imported_titles(), sorted(r["title"] for r in self.records))
+        issue = Issue.objects.get(title="Legacy complaint 3")
+        self.assertEqual(
+            (issue.reporter.username, issue.department, issue.status, issue.created_at.day),
+            ("legacy3", Department.objects.get(name="Roads"), Issue.STATUS_RESOLVED, 4),
+        )
+        self.assertNotEqual(issue.geohash, "")
+        self.assertDerivedDataMatchesRecount()
+
+    def test_interrupted_import_resumes_where_it_stopped(self):
+        # The first run stops after two whole batches
+        self.run_import(self.write("partial.ndjson", self.records[:20]), batch_size=10)
+        self.assertEqual(ImportBatch.objects.count(), 2)
+        path = self.write("legacy.ndjson", self.records)
+        self.run_import(path)  # picks up the size the import started with
+        self.assertEqual(self.imported_titles(), sorted(r["title"] for r in self.records))
+        self.assertEqual(set(ImportBatch.objects.values_list("batch", "batch_size")), {(0, 10), (1, 10), (2, 10)})
+        # Nothing is left to do, whatever is asked
+        self.run_import(path, batch_size=10)
+        self.assertEqual(Issue.objects.count(), len(self.records))
+
+    def test_resume_refuses_another_batch_size(self):
+        self.run_import(self.write("partial.ndjson", self.records[:20]), batch_size=10)
+        with self.assertRaisesMessage(CommandError, "--batch-size 10"):
+            self.run_import(self.write("legacy.ndjson", self.records), batch_size=8)
+        self.assertEqual(Issue.objects.count(), 20)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.addCleanup(registry.reset)
+        registry.reset()
+
+    def test_histogram_and_quantiles(self):
+        metrics = MetricsRegistry()
+        # A bound belongs to its own bucket; 20s only fits +Inf
+        for seconds in (0.005, 0.02, 0.02, 0.7, 20):
+            metrics.record_request("feed", seconds, 200)
+        metrics.record_request("vote", 0.3, 500, queries=3, query_seconds=0.01)
+        metrics.record_request("vote", 0.2, 200, queries=7, query_seconds=0.03)
+
+        feed = metrics.views["feed"]
+        self.assertEqual(feed.buckets, [1, 0, 2, 0, 0, 0, 0, 1, 0, 0, 0, 1])
+        # The median's rank (2.5) is halfway through the two requests in (0.01, 0.025]
+        self.assertAlmostEqual(feed.quantile(0.5), 0.01 + 0.015 * 0.75)
+        self.assertEqual(feed.quantile(0.95), LATENCY_BUCKETS[-1])
+        self.assertIsNone(ViewStats().quantile(0.5))
+
+        feed_row, vote_row = metrics.snapshot()["views"]  # slowest in total first
+        self.assertEqual(
+            (feed_row["view"], feed_row["requests"], feed_row["errors"], feed_row["p50_ms"], feed_row["sampled"]),
+            ("feed", 5, 0, 21.2, 0),
+        )
+        self.assertIsNone(feed_row["avg_queries"])
+        self.assertEqual(
+            {k: vote_row[k] for k in ("requests", "errors", "sampled", "avg_queries", "max_queries", "avg_db_ms")},
+            {"requests": 2, "errors": 1, "sampled": 2, "avg_queries": 5.0, "max_queries": 7, "avg_db_ms": 20.0},
+        )
+
+    def test_prometheus_text(self):
+        metrics = MetricsRegistry()
+        name = 'odd "view" \\ name'
+        for seconds in (0.003, 0.04, 3):
+            metrics.record_request(name, seconds, 200, queries=2, query_seconds=0.5)
+        metrics.record_cache("home", hit=True)
+        metrics.record_cache("home", hit=False)
+        metrics.record_cache("home", hit=True)
+        lines = metrics.prometheus_text().splitlines()
+
+        label = 'view="odd \\"view\\" \\\\ name"'
+        buckets = [line for line in lines if line.startswith("civicfix_request_duration_seconds_bucket")]
+        self.assertEqual(len(buckets), len(LATENCY_BUCKETS) + 1)
+        self.assertEqual(buckets[0], f'civicfix_request_duration_seconds_bucket{{{label},le="0.005"}} 1')
+        self.assertEqual(buckets[4], f'civicfix_request_duration_seconds_bucket{{{label},le="0.1"}} 2')
+        self.assertEqual(buckets[8], f'civicfix_request_duration_seconds_bucket{{{label},le="2.5"}} 2')
+        self.assertEqual(buckets[9], f'civicfix_request_duration_seconds_bucket{{{label},le="5.0"}} 3')
+        self.assertEqual(buckets[-1], f'civicfix_request_duration_seconds_bucket{{{label},le="+Inf"}} 3')
+        counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+        for line in (
+            f"civicfix_request_duration_seconds_count{{{label}}} 3",
+            f"civicfix_sampled_requests_total{{{label}}} 3",
+            f"civicfix_db_queries_total{{{label}}} 6",
+            'civicfix_cache_requests_total{cache="home",result="hit"} 2',
+            'civicfix_cache_requests_total{cache="home",result="miss"} 1',
+            "# TYPE civicfix_request_duration_seconds histogram",
+        ):
+            self.assertIn(line, lines)
+
+    @override_settings(METRICS_SAMPLE_RATE=1, METRICS_SLOW_QUERY_MS=0)
+    def test_sampled_requests_count_their_queries(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user("citizen", is_citizen=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("home"))
+        (row,) = registry.snapshot()["views"]
+        self.assertEqual((row["view"], row["requests"], row["sampled"]), ("home", 1, 1))
+        self.assertTrue(queries)  # a cold session and user lookup at least
+        self.assertEqual(row["max_queries"], len(queries))
+        # A 0ms threshold keeps every query as a slow one, with where it came from
+        slow = registry.snapshot()["slow_queries"]
+        self.assertEqual(len(slow), len(queries))
+        self.assertTrue(all(q["view"] == "home" and q["origin"] for q in slow))
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_timed(self):
+        self.client.get(reverse("home"))
+        (row,) = registry.snapshot()["views"]
+        self.assertEqual((row["requests"], row["sampled"], row["avg_queries"]), (1, 0, None))
+        self.assertEqual(sum(registry.views["home"].buckets), 1)
+
+
+@override_settings(THROTTLE_RATES={"vote": "2/min"})
+class ThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user("citizen", is_citizen=True)
+        cls.neighbour = User.objects.create_user("neighbour", is_citizen=True)
+        cls.issue = Issue.objects.create(title="Pothole", description="Deep pothole", reporter=cls.citizen)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("vote_issue", args=[self.issue.pk])
+
+    def vote(self, user, ip="10.0.0.1", **headers):
+        if self.client.session.get("_auth_user_id") != str(user.pk):
+            self.client.force_login(user)
+        return self.client.post(self.url, REMOTE_ADDR=ip, headers=headers)
+
+    def test_third_request_in_a_minute_is_refused(self):
+        for _ in range(2):
+            self.assertEqual(self.vote(self.citizen).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.vote(self.citizen, x_requested_with="XMLHttpRequest")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response["Retry-After"]), range(1, 31))
+        self.assertFalse(response.json()["success"])
+        self.assertEqual(self.issue.votes.count(), 0)
+
+        response = self.vote(self.citizen)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_user_and_address_are_limited_separately(self):
+        self.vote(self.citizen)
+        self.vote(self.citizen)
+        # Same address, different account
+        self.assertEqual(self.vote(self.neighbour).status_code, 429)
+        # Same account, different address
+        self.assertEqual(self.vote(self.citizen, ip="10.0.0.2").status_code, 429)
+        self.assertEqual(self.vote(self.neighbour, ip="10.0.0.2").status_code, 200)
+
+    @override_settings(THROTTLE_RATES={"comment": "2/min"})
+    def test_comments_are_throttled_and_validated(self):
+        url = reverse("add_comment", args=[self.issue.pk])
+        detail = reverse("issue_detail", args=[self.issue.pk])
+        self.assertRedirects(self.client.post(url, {"content": "Hello"}), f"{reverse('login')}?next={url}")
+        self.client.force_login(self.citizen)
+        self.assertRedirects(self.client.get(url), detail, fetch_redirect_response=False)
+        self.assertRedirects(self.client.post(url, {"content": ""}), detail, fetch_redirect_response=False)
+        self.assertFalse(self.issue.comments.exists())
+
+        self.assertRedirects(self.client.post(url, {"content": "Still there"}), detail, fetch_redirect_response=False)
+        self.assertEqual(self.client.post(url, {"content": "Again"}).status_code, 429)
+        self.assertEqual(list(self.issue.comments.values_list("content", flat=True)), ["Still there"])
+
+    def test_bucket_refills_over_time(self):
+        self.assertEqual(take_token("vote", ["ip:x"], now=0), 0)
+        self.assertEqual(take_token("vote", ["ip:x"], now=0), 0)
+        self.assertEqual(take_token("vote", ["ip:x"], now=0), 30)
+        self.assertEqual(take_token("vote", ["ip:x"], now=29), 1)
+        self.assertEqual(take_token("vote", ["ip:x"], now=30), 0)
+        self.assertEqual(take_token("comment", ["ip:x"], now=0), 0)  # no rate set
+
+
+class ClusterTests(DerivedDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.a = Issue.objects.create(title="A", description="a", reporter=cls.reporter, latitude=9.9312, longitude=76.2673)
+        cls.b = Issue.objects.create(title="B", description="b", reporter=cls.reporter, latitude=9.9314, longitude=76.2675,
+                                     status=Issue.STATUS_RESOLVED)
+        cls.far = Issue.objects.create(title="C", description="c", reporter=cls.reporter, latitude=8.5241, longitude=76.9366)
+        Issue.objects.create(title="No location", description="d", reporter=cls.reporter)
+
+    def setUp(self):
+        cache.clear()
+
+    def clusters(self, z, lat=9.9312, lng=76.2673):
+        response = self.client.get(reverse("api_map_tile", args=[z, *tile_of(lat, lng, z)]))
+        return response.json()["clusters"]
+
+    def test_clusters_count_and_centre_their_issues(self):
+        [cluster] = self.clusters(14)
+        self.assertEqual(cluster["count"], 2)
+        self.assertEqual(cluster["statuses"], {Issue.STATUS_REPORTED: 1, Issue.STATUS_RESOLVED: 1})
+        self.assertAlmostEqual(cluster["lat"], 9.9313, places=6)
+        self.assertAlmostEqual(cluster["lng"], 76.2674, places=6)
+        # The whole world in one tile: every located issue, once
+        self.assertEqual(sum(c["count"] for c in self.clusters(0)), 3)
+        self.assertEqual(self.clusters(14, 8.5241, 76.9366)[0]["lat"], 8.5241)
+
+    def test_grid_follows_issue_changes(self):
+        self.a.status = Issue.STATUS_IN_PROGRESS
+        self.a.save()
+        self.b.latitude, self.b.longitude = 8.5243, 76.9368
+        self.b.save()
+        self.far.delete()
+        Issue.objects.create(title="E", description="e", reporter=self.reporter, latitude=9.93, longitude=76.26)
+        bulk_set_status([self.a.pk, self.b.pk], Issue.STATUS_RESOLVED)
+        self.assertDerivedDataMatchesRecount()
+        self.assertEqual([c["count"] for c in self.clusters(14, 8.5243, 76.9368)], [1])
+
+    def test_tiles_revalidate_until_the_grid_changes(self):
+        url = reverse("api_map_tile", args=[12, *tile_of(9.9312, 76.2673, 12)])
+        response = self.client.get(url)
+        self.assertIn("max-age", response["Cache-Control"])
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, headers={"if-none-match": etag}).status_code, 304)
+        Issue.objects.create(title="E", description="e", reporter=self.reporter, latitude=9.9313, longitude=76.2674)
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(c["count"] for c in response.json()["clusters"]), 3)
+
+    def test_tiles_outside_the_map_are_not_found(self):
+        self.assertEqual(self.client.get(reverse("api_map_tile", args=[2, 4, 0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_map_tile", args=[23, 0, 0])).status_code, 404)
+
+
+def hotspot_snapshot():
+    return {
+        (grid.week, grid.department_id, grid.status): load_grid(grid)
+        for grid in HotspotGrid.objects.all()
+    }
+
+
+class HotspotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.roads = Department.objects.create(name="Roads")
+        cls.water = Department.objects.create(name="Water")
+        cls.resolver = User.objects.create_user("resolver", is_resolver=True)
+        cls.roads.users.add(cls.resolver)
+        reporter = User.objects.create_user("reporter", is_citizen=True)
+        cls.issues = [
+            Issue.objects.create(
+                title=f"Pothole {i}", description="Deep pothole", reporter=reporter, department=cls.roads,
+                latitude=9.9312 + i * 0.0004, longitude=76.2673,
+            )
+            for i in range(6)
+        ]
+        cls.leak = Issue.objects.create(
+            title="Leak", description="Burst pipe", reporter=reporter, department=cls.water, latitude=9.95, longitude=76.28,
+        )
+        Issue.objects.filter(pk__in=[i.pk for i in cls.issues[:2]]).update(created_at=timezone.now() - timedelta(days=7))
+
+    def setUp(self):
+        call_command("compute_hotspots", stdout=StringIO())
+
+    def assertGridsMatchRebuild(self):
+        current = hotspot_snapshot()
+        rebuild_hotspots()
+        rebuilt = hotspot_snapshot()
+        self.assertEqual(current.keys(), rebuilt.keys())
+        for key, (counts, density) in rebuilt.items():
+            self.assertEqual(current[key][0], counts)
+            for cell in current[key][1].keys() | density.keys():
+                self.assertAlmostEqual(current[key][1].get(cell, 0.0), density.get(cell, 0.0), delta=0.01)
+
+    def test_update_matches_rebuild(self):
+        self.issues[2].status = Issue.STATUS_IN_PROGRESS
+        self.issues[2].save()
+        self.issues[3].latitude = 9.9412
+        self.issues[3].save()
+        self.issues[4].delete()
+        self.leak.department = self.roads
+        self.leak.save()
+        bulk_set_status([self.issues[0].pk, self.issues[5].pk], Issue.STATUS_RESOLVED)
+        Issue.objects.create(
+            title="Another", description="Pothole", reporter=self.leak.reporter, department=self.roads,
+            latitude=9.9313, longitude=76.2674,
+        )
+        self.assertEqual(HotspotGrid.objects.get(department=self.water).total, 1)
+
+        call_command("compute_hotspots", stdout=StringIO())
+        self.assertFalse(HotspotChange.objects.exists())
+        self.assertFalse(HotspotGrid.objects.filter(department=self.water).exists())
+        self.assertGridsMatchRebuild()
+
+    def test_resolvers_see_their_departments_hotspots(self):
+        self.client.force_login(self.resolver)
+        response = self.client.get(reverse("department_hotspots"), {"department": self.water.pk})
+        self.assertEqual(response.context["filters"]["department"], str(self.roads.pk))
+        self.assertEqual([row["total"] for row in response.context["trend"]], [2, 4])
+        self.assertEqual(sum(spot["issues"] for spot in response.context["hotspots"]), 4)
+        busiest = response.context["hotspots"][0]
+        self.assertAlmostEqual(busiest["density"], max(point[2] for point in response.context["points"]), delta=0.05)
+
+        for week in ("2024-02-30", "last week"):
+            with self.subTest(week=week):
+                response = self.client.get(reverse("department_hotspots"), {"week": week})
+                self.assertEqual(response.context["filters"]["week"], week_start(timezone.now()))
+
+        response = self.client.get(reverse("department_hotspots"), {"status": Issue.STATUS_RESOLVED})
+        self.assertEqual(response.context["trend"], [])
+        self.assertEqual(response.context["hotspots"], [])
@@ -0,0 +1,112 @@
+"""
+Token-bucket rate limiting for the write endpoints (vote, comment, report).
+
+Each scope has a rate in settings.THROTTLE_RATES, e.g. "30/min": a bucket
+holds up to 30 tokens and refills at 30 per minute, so short bursts pass
+while a sustained flood is held to the rate. A request takes one token from
+the user's bucket and one from its IP's, and is refused with 429 and
+Retry-After when either is empty. That catches one account scripted from
+many addresses as well as many accounts from one address.
+
+Buckets are (tokens, timestamp) pairs in the cache named by
+settings.THROTTLE_CACHE: one get_many and at most one set_many per check,
+before the view touches the database. With several server processes that
+cache must be shared (e.g. Redis); the default local-memory cache, as used
+by the tests, limits each process separately. The read-modify-write isn't
+atomic, so concurrent requests can occasionally get a token more than the
+rate allows; the limit is approximate, which is fine for abuse control.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+THROTTLE_KEY = "core:throttle:%s:%s"
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def parse_rate(rate):
+    """Parse "30/min" into (30, 60): the bucket size and the seconds it takes to refill."""
+    count, _, period = rate.partition("/")
+    try:
+        return int(count), PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid throttle rate {rate!r}; expected e.g. '30/min'")
+
+
+def client_ip(request):
+    """
+    The client address. Behind THROTTLE_NUM_PROXIES trusted proxies it is
+    the entry those proxies appended to X-Forwarded-For; anything to the
+    left of it was written by the client.
+    """
+    proxies = getattr(settings, "THROTTLE_NUM_PROXIES", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if proxies and forwarded:
+        addresses = [a.strip() for a in forwarded.split(",")]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def take_token(scope, idents, now=None):
+    """
+    Take a token from the `scope` bucket of every identifier in `idents`.
+    Returns 0 if allowed, otherwise the seconds until a token is available
+    (and nothing is taken).
+    """
+    rate = settings.THROTTLE_RATES.get(scope)
+    if not rate:
+        return 0
+    capacity, period = parse_rate(rate)
+    refill = capacity / period  # tokens per second
+    now = time.time() if now is None else now
+
+    cache = caches[getattr(settings, "THROTTLE_CACHE", "default")]
+    keys = [THROTTLE_KEY % (scope, ident) for ident in idents]
+    buckets = cache.get_many(keys)
+
+    levels = {}
+    for key in keys:
+        tokens, stamp = buckets.get(key, (capacity, now))
+        levels[key] = min(capacity, tokens + (now - stamp) * refill)
+    lowest = min(levels.values())
+    if lowest < 1:
+        return math.ceil((1 - lowest) / refill)
+
+    # An idle bucket refills completely within `period`, so it can expire then
+    cache.set_many({key: (tokens - 1, now) for key, tokens in levels.items()}, math.ceil(period))
+    return 0
+
+
+def throttle(scope, methods=("POST",)):
+    """
+    Rate-limit a view's `methods` requests with the `scope` bucket, per user
+    (when signed in) and per IP. Refused requests get a 429 response with
+    Retry-After, as JSON for AJAX callers.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                idents = [f"ip:{client_ip(request)}"]
+                if request.user.is_authenticated:
+                    idents.append(f"user:{request.user.pk}")
+                retry_after = take_token(scope, idents)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def too_many_requests(request, retry_after):
+    message = f"Too many requests. Please try again in {retry_after} seconds."
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        response = JsonResponse({"success": False, "error": message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(retry_after)
+    return response
@@ -0,0 +1,47 @@
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_FORMATS = {
+    # key: (Pillow format, file extension, save options)
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def make_thumbnails(data):
+    """
+    Resize an uploaded photo to each of THUMBNAIL_WIDTHS in every format of
+    THUMBNAIL_FORMATS. Yields (format key, width, encoded bytes).
+
+    Orientation from EXIF is applied to the pixels and all metadata (EXIF,
+    GPS, ICC, comments) is dropped. Images are never upscaled; a photo
+    narrower than the largest width also gets a full-size derivative.
+    Yields nothing if `data` is not an image Pillow can read.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        return
+
+    if image.mode not in ("RGB", "L"):
+        # Flatten transparency onto white; JPEG has no alpha channel
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+
+    widths = [w for w in THUMBNAIL_WIDTHS if w < image.width]
+    if image.width < THUMBNAIL_WIDTHS[-1]:
+        widths.append(image.width)
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        # A fresh image carries none of the source's metadata
+        resized = image.resize((width, height), Image.LANCZOS)
+        for key, (pil_format, _, options) in THUMBNAIL_FORMATS.items():
+            out = io.BytesIO()
+            resized.save(out, pil_format, **options)
+            yield key, width, out.getvalue()
@@ -0,0 +1,157 @@
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import touch_last_modified
+from .models import Issue, PhotoUpload
+from .thumbnails import THUMBNAIL_FORMATS, make_thumbnails
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+class CloudinaryUploader:
+    """Uploads to Cloudinary, as CloudinaryField.pre_save would have done."""
+
+    def upload(self, file, filename):
+        from cloudinary import uploader
+        return uploader.upload_resource(file, type="upload", resource_type="image")
+
+    def upload_derivative(self, file, filename):
+        from cloudinary import uploader
+        return uploader.upload(file, type="upload", resource_type="image", folder="thumbnails")["secure_url"]
+
+
+class LocalFileSystemUploader:
+    """Stand-in for tests and offline development: writes under MEDIA_ROOT."""
+
+    def __init__(self, location=None, base_url="/media/photos/"):
+        location = location or Path(getattr(settings, "MEDIA_ROOT", "") or settings.BASE_DIR / "media") / "photos"
+        self.storage = FileSystemStorage(location=location, base_url=base_url)
+
+    def upload(self, file, filename):
+        name = self.storage.save(filename, file)
+        # Stored like a Cloudinary public id so Issue.photo stays truthy
+        return f"local/{name}"
+
+    def upload_derivative(self, file, filename):
+        return self.storage.url(self.storage.save(f"thumbnails/{filename}", file))
+
+
+def get_uploader():
+    return import_string(settings.PHOTO_UPLOAD_BACKEND)()
+
+
+def stage_photo(issue, file):
+    """Keep `file` in the staging table and flag `issue` as waiting on it."""
+    PhotoUpload.objects.create(
+        issue=issue,
+        filename=Path(file.name).name,
+        content_type=getattr(file, "content_type", "") or "",
+        data=file.read(),
+    )
+    if not issue.photo_pending:
+        Issue.objects.filter(pk=issue.pk).update(photo_pending=True)
+        issue.photo_pending = True
+
+
+def upload_thumbnails(uploader, data, filename, thumbnails=None):
+    """
+    Generate and upload the responsive derivatives of a photo.
+    Returns the mapping stored in Issue.thumbnails: {format: {width: url}}.
+
+    Derivatives already in `thumbnails` (from an earlier attempt) are not
+    uploaded again. The mapping is filled in place, so if an upload fails
+    it still holds the ones that made it.
+    """
+    stem = Path(filename).stem
+    thumbnails = {} if thumbnails is None else thumbnails
+    for key, width, content in make_thumbnails(data):
+        if str(width) in thumbnails.get(key, {}):
+            continue
+        name = f"{stem}-{width}w.{THUMBNAIL_FORMATS[key][1]}"
+        url = uploader.upload_derivative(ContentFile(content, name=name), name)
+        thumbnails.setdefault(key, {})[str(width)] = url
+    return thumbnails
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+
+
+def claim_upload(skip_locked):
+    """
+    Take the next due job, or None. The attempt is counted and the job is
+    pushed back by its retry delay before the row lock is released, so
+    other workers pass it over while it uploads, and it comes round again
+    if this worker dies before recording the outcome.
+    """
+    with transaction.atomic():
+        job = (
+            PhotoUpload.objects
+            .select_for_update(skip_locked=skip_locked)
+            .filter(status=PhotoUpload.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by("next_attempt_at")
+            .first()
+        )
+        if job is not None:
+            job.attempts += 1
+            job.next_attempt_at = timezone.now() + retry_delay(job.attempts)
+            job.save(update_fields=["attempts", "next_attempt_at"])
+    return job
+
+
+def process_pending_uploads(limit=10, uploader=None):
+    """
+    Upload up to `limit` due photos. Returns (uploaded, failed) counts.
+
+    Rows are claimed with SKIP LOCKED where the database supports it, so
+    several workers can drain the queue side by side. No transaction is
+    open while the photo backend is called: the claim and the outcome are
+    each written in a short one of their own.
+    """
+    uploader = uploader or get_uploader()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    uploaded = failed = 0
+
+    for _ in range(limit):
+        job = claim_upload(skip_locked)
+        if job is None:
+            break
+
+        data = bytes(job.data)
+        try:
+            # The original first: thumbnails without it would be useless
+            if not job.photo:
+                job.photo = uploader.upload(ContentFile(data, name=job.filename), job.filename)
+            upload_thumbnails(uploader, data, job.filename, job.thumbnails)
+        except Exception as e:
+            with transaction.atomic():
+                changes = {"last_error": str(e), "photo": job.photo, "thumbnails": job.thumbnails}
+                if job.attempts >= MAX_ATTEMPTS:
+                    changes["status"] = PhotoUpload.STATUS_FAILED
+                    Issue.objects.filter(pk=job.issue_id).update(photo_pending=False, updated_at=timezone.now())
+                    touch_last_modified("feed", f"issue:{job.issue_id}")
+                # update() rather than save(): the issue may have been deleted meanwhile
+                PhotoUpload.objects.filter(pk=job.pk).update(**changes)
+            failed += 1
+            continue
+
+        with transaction.atomic():
+            issue = Issue.objects.filter(pk=job.issue_id).first()
+            if issue is not None:
+                issue.photo = job.photo
+                issue.photo_pending = False
+                issue.thumbnails = job.thumbnails
+                issue.save(update_fields=["photo", "photo_pending", "thumbnails", "updated_at"])
+            PhotoUpload.objects.filter(pk=job.pk).delete()
+        uploaded += 1
+
+    return uploaded, failed
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -8,6 +8,7 @@ urlpatterns = [
     path("superadmin/departments/", views.manage_departments, name="manage_departments"),
     path("superadmin/departments/<int:pk>/", views.department_detail, name="department_detail"),
     path("superadmin/manage/", views.manage_issues, name="manage_issues"),
+    path("superadmin/manage/bulk/", views.bulk_issue_action, name="bulk_issue_action"),
     path("superadmin/assign-department/<int:issue_id>/", views.assign_department, name="assign_department"),
     path('register/', views.register, name='register'),
     path('login/', views.custom_login, name='login'),
@@ -15,16 +16,31 @@ urlpatterns = [
     path('dashboard/', views.citizen_dashboard, name='citizen_dashboard'),
     path('report-issue/', views.report_issue, name='report_issue'),
     path('issues/', views.view_all_issues, name='view_all_issues'),
+    path('issues/nearby/', views.nearby_issues, name='nearby_issues'),
+    path('issues/similar/', views.similar_issues, name='similar_issues'),
     path("issues/<int:pk>/", views.issue_detail, name="issue_detail"),
+    path("issues/<int:pk>/events/", views.issue_events, name="issue_events"),
     path("issues/<int:pk>/comment/", views.add_comment, name="add_comment"),
     path("issues/<int:pk>/comment/<int:parent_id>/", views.add_comment, name="add_comment"),
     path('vote/<int:issue_id>/', views.vote_issue, name='vote_issue'),  
     path("department/", views.department_dashboard, name="department_dashboard"), 
+    path("department/events/", views.department_events, name="department_events"),
+    path("department/hotspots/", views.department_hotspots, name="department_hotspots"),
     path("update-issue-status/<int:issue_id>/", views.update_issue_status, name="update_issue_status"),
     path('manage-users/', views.manage_users, name='manage_users'),
     path('ban-user/<int:user_id>/', views.ban_user, name='ban_user'),
     path('unban-user/<int:user_id>/', views.unban_user, name='unban_user'),
     path('issues/<int:issue_id>/delete_fake/', views.delete_fake_issue, name='delete_fake_issue'),
     path("reports/", views.superadmin_reports, name="superadmin_reports"),
+    path("reports/export/<str:dataset>/", views.export_data, name="export_data"),
+    path("reports/metrics/", views.superadmin_metrics, name="superadmin_metrics"),
+    path("metrics/", views.metrics_endpoint, name="metrics"),
     path('delete-issue/<int:issue_id>/', views.delete_issue, name='delete_issue'),
+
+    # 🔹 Read-only JSON API
+    path("api/v1/issues/", api.issue_list, name="api_issue_list"),
+    path("api/v1/issues/<int:pk>/", api.issue_detail, name="api_issue_detail"),
+    path("api/v1/issues/<int:pk>/comments/", api.issue_comments, name="api_issue_comments"),
+    path("api/v1/departments/", api.department_list, name="api_department_list"),
+    path("api/v1/map/<int:z>/<int:x>/<int:y>/", api.map_tile, name="api_map_tile"),
 ]
\ No newline at end of file
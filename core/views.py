@@ -2,35 +2,65 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import AuthenticationForm
-from django.db import IntegrityError
-from django.db.models import Exists, OuterRef, Count
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+from django.utils.http import urlencode
 from django.utils import timezone
-from django.utils.timezone import now, timedelta
-from django.views.decorators.http import require_POST
-from .models import Issue, User, Vote, Comment, Department
+from django.utils.crypto import constant_time_compare
+from django.utils.timezone import timedelta
+from django.views.decorators.http import condition, require_POST
+from .models import Issue, IssueDailyRollup, HotspotGrid, User, Vote, Comment, Department
+from .cache import (
+    cache_anonymous_page, feed_last_modified, get_home_block, home_cache_stats, issue_last_modified, page_etag,
+)
+from .events import department_channel, event_stream, issue_channel, publish_issue_event
+from .exports import DATASETS, EXPORT_FORMATS, export_lines, parse_filters
 from .forms import CitizenRegistrationForm, IssueForm, CommentForm
+from .hotspots import cell_location, merge_grids
+from .metrics import registry as metrics_registry, sample_rate
+from .moderation import bulk_assign_department, bulk_delete_fake, bulk_set_status
+from .pagination import InvalidCursor, keyset_paginate
+from .throttle import throttle
+from .uploads import stage_photo
+
+ISSUE_FEED_PAGE_SIZE = 12
+ISSUE_FEED_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'most_voted': ('-vote_count', '-created_at', '-id'),
+    'relevance': ('-rank', '-id'),  # only with ?q=
+}
+COMMENT_THREADS_PER_PAGE = 20
+MANAGE_ISSUES_PAGE_SIZE = 50
+WORK_QUEUE_PAGE_SIZE = 25
+NEARBY_DEFAULT_RADIUS_M = 500
+NEARBY_MAX_RADIUS_M = 5000
+NEARBY_LIMIT = 50
+HOTSPOT_WEEKS = 12
+HOTSPOT_TOP = 10
 
 def home(request):
-    total_issues = Issue.objects.count()
-    resolved_issues = Issue.objects.filter(status=Issue.STATUS_RESOLVED).count()
-    active_users = User.objects.filter(is_active=True).count()
-    total_departments = Department.objects.count()
-    
-    recent_issues = Issue.objects.all().order_by('-created_at')[:3]
-    
+    context = dict(get_home_block())
+    recent_issues = context['recent_issues']
+
+    # Per-user overlay on top of the shared cached block
+    voted = set()
+    if request.user.is_authenticated and recent_issues:
+        voted = set(
+            Vote.objects.filter(user=request.user, issue_id__in=context['recent_ids'])
+            .values_list('issue_id', flat=True)
+        )
     for issue in recent_issues:
-        issue.user_has_voted = issue.has_user_voted(request.user) if request.user.is_authenticated else False
+        issue.user_has_voted = issue.id in voted
 
-    
-    context = {
-        'total_issues': total_issues,
-        'resolved_issues': resolved_issues,
-        'active_users': active_users,
-        'total_departments': total_departments,
-        'recent_issues': recent_issues,
-    }
     return render(request, 'core/index.html', context)
 
 
@@ -42,7 +72,7 @@ def citizen_dashboard(request):
     
     # Get only basic data for now
     all_user_issues = Issue.objects.filter(reporter=request.user)
-    user_issues_display = all_user_issues.order_by('-created_at')[:5]
+    user_issues_display = all_user_issues.select_related('department').order_by('-created_at')[:5]
     resolved_count = all_user_issues.filter(status='resolved').count()
     
     context = {
@@ -53,6 +83,7 @@ def citizen_dashboard(request):
     return render(request, 'dashboard/citizen_dashboard.html', context)
 
 @login_required
+@throttle('report')
 def report_issue(request):
     if not request.user.is_citizen:
         messages.error(request, 'Access denied. Citizen role required.')
@@ -64,7 +95,15 @@ def report_issue(request):
             issue = form.save(commit=False)
             issue.reporter = request.user
             issue.status = "reported"  # default status
-            issue.save()
+            # Stage the photo for the background uploader instead of letting
+            # CloudinaryField upload it while the citizen waits
+            photo = form.cleaned_data.get('photo')
+            issue.photo = None
+            issue.photo_pending = bool(photo)
+            with transaction.atomic():
+                issue.save()
+                if photo:
+                    stage_photo(issue, photo)
             messages.success(request, 'Issue reported successfully!')
             return redirect('citizen_dashboard')
         else:
@@ -74,7 +113,23 @@ def report_issue(request):
     
     return render(request, 'core/report_issue.html', {'form': form})
 
+def _feed_etag(request):
+    return page_etag(request, feed_last_modified())
+
+def _issue_etag(request, pk):
+    return page_etag(request, issue_last_modified(pk))
+
+def _issue_last_modified(request, pk):
+    # Only anonymous pages are the same for everyone since that time
+    if request.user.is_authenticated:
+        return None
+    return issue_last_modified(pk)
+
+def _issue_page_scope(pk):
+    return f"issue:{pk}", issue_last_modified(pk)
+
 @login_required
+@condition(etag_func=_feed_etag)
 def view_all_issues(request):
     if not request.user.is_active:
         messages.error(request, 'Access denied. Citizen role required.')
@@ -84,19 +139,119 @@ def view_all_issues(request):
     user_vote_subq = Vote.objects.filter(user=request.user, issue_id=OuterRef('pk'))
     issues = (
         Issue.objects
-        .select_related('reporter')
+        .select_related('reporter', 'department')
         .annotate(user_has_voted=Exists(user_vote_subq))
-        .order_by('-created_at')
     )
 
-    # Optional filter (status only now)
+    # Optional filters: status and full-text search
     status = request.GET.get('status') or ''
     if status:
         issues = issues.filter(status=status)
+    q = (request.GET.get('q') or '').strip()
+    if q:
+        issues = issues.search(q)
+
+    default_sort = 'relevance' if q else 'newest'
+    sort = request.GET.get('sort') or default_sort
+    if sort not in ISSUE_FEED_ORDERINGS or (sort == 'relevance' and not q):
+        sort = default_sort
+    ordering = ISSUE_FEED_ORDERINGS[sort]
+
+    # Keyset pagination on the sort key; a bad cursor restarts from the top
+    try:
+        page = keyset_paginate(issues, request.GET.get('cursor'), ISSUE_FEED_PAGE_SIZE, ordering)
+    except InvalidCursor:
+        page = keyset_paginate(issues, None, ISSUE_FEED_PAGE_SIZE, ordering)
+
+    # Infinite-scroll mode: only the next batch of cards plus the next cursor
+    if request.GET.get('format') == 'json':
+        html = render_to_string('issues/_issue_cards.html', {'issues': page}, request=request)
+        return JsonResponse({
+            'html': html,
+            'next_cursor': page.next_cursor,
+            'has_next': page.has_next,
+        })
 
     return render(request, 'issues/view_all_issues.html', {
-        'issues': issues,
+        'issues': page,
+        'page': page,
         'selected_status': status,
+        'selected_sort': sort,
+        'search_query': q,
+        'filter_query': urlencode({k: v for k, v in [('q', q), ('status', status), ('sort', sort)] if v}),
+    })
+
+
+def nearby_issues(request):
+    """JSON list of issues within ?radius= metres (default 500) of ?lat=&lng=."""
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+        radius = float(request.GET.get('radius') or NEARBY_DEFAULT_RADIUS_M)
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'lat and lng are required numbers'}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= NEARBY_MAX_RADIUS_M):
+        return JsonResponse({'success': False, 'error': 'Coordinates or radius out of range'}, status=400)
+
+    issues = Issue.objects.only('id', 'title', 'status', 'latitude', 'longitude', 'vote_count')
+    status = request.GET.get('status') or ''
+    if status:
+        issues = issues.filter(status=status)
+
+    nearby = issues.near(lat, lng, radius, limit=NEARBY_LIMIT)
+    return JsonResponse({
+        'success': True,
+        'issues': [
+            {
+                'id': issue.id,
+                'title': issue.title,
+                'status': issue.status,
+                'latitude': issue.latitude,
+                'longitude': issue.longitude,
+                'vote_count': issue.vote_count,
+                'distance_m': round(issue.distance_m, 1),
+                'url': reverse('issue_detail', args=[issue.id]),
+            }
+            for issue in nearby
+        ],
+    })
+
+
+@login_required
+def similar_issues(request):
+    """Possible duplicates of an issue that is about to be reported (JSON)."""
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'lat and lng are required numbers'}, status=400)
+    # Also turns away nan and inf, which float() accepts
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({'success': False, 'error': 'Coordinates out of range'}, status=400)
+
+    matches = Issue.objects.only(
+        'id', 'title', 'status', 'latitude', 'longitude', 'vote_count', 'signature'
+    ).similar_to(request.GET.get('title', ''), request.GET.get('description', ''), lat, lng)
+    voted = set(
+        Vote.objects.filter(user=request.user, issue__in=[i.id for i in matches])
+        .values_list('issue_id', flat=True)
+    ) if matches else set()
+
+    return JsonResponse({
+        'success': True,
+        'issues': [
+            {
+                'id': issue.id,
+                'title': issue.title,
+                'status': issue.get_status_display(),
+                'vote_count': issue.vote_count,
+                'user_has_voted': issue.id in voted,
+                'similarity': round(issue.similarity, 2),
+                'distance_m': round(issue.distance_m),
+                'url': reverse('issue_detail', args=[issue.id]),
+            }
+            for issue in matches
+        ],
     })
 
 
@@ -121,8 +276,8 @@ def custom_login(request):
             user = authenticate(username=username, password=password)
 
             if user is not None:
-                # 🔹 Auto unban check
-                if hasattr(user, "is_currently_banned") and user.is_currently_banned():
+                # 🔹 Ban check (expired bans are lifted by sweep_expired_bans)
+                if user.is_currently_banned():
                     days_left = (user.banned_until - timezone.now()).days
                     messages.error(
                         request,
@@ -145,22 +300,29 @@ def custom_login(request):
 
 @login_required
 @require_POST
+@throttle('vote')
 def vote_issue(request, issue_id):
     try:
-        issue = Issue.objects.get(id=issue_id)
-        vote, created = Vote.objects.get_or_create(user=request.user, issue=issue)
-        
-        if not created:
-            # User already voted, so remove the vote (toggle)
-            vote.delete()
-            voted = False
-        else:
-            voted = True
-        
+        with transaction.atomic():
+            # Row lock serializes concurrent toggles on this issue so the
+            # counter maintained by core.signals can never drift
+            issue = Issue.objects.select_for_update().get(id=issue_id)
+            vote, created = Vote.objects.get_or_create(user=request.user, issue=issue)
+
+            if not created:
+                # User already voted, so remove the vote (toggle)
+                vote.delete()
+                voted = False
+            else:
+                voted = True
+
+            issue.refresh_from_db(fields=['vote_count'])
+            publish_issue_event(issue, 'vote', vote_count=issue.vote_count)
+
         return JsonResponse({
             'success': True,
             'voted': voted,
-            'vote_count': issue.vote_count()
+            'vote_count': issue.vote_count
         })
         
     except Issue.DoesNotExist:
@@ -169,9 +331,10 @@ def vote_issue(request, issue_id):
         return JsonResponse({'success': False, 'error': str(e)})
     
 @login_required
+@throttle('comment')
 def add_comment(request, pk, parent_id=None):
     issue = get_object_or_404(Issue, pk=pk)
-    parent = get_object_or_404(Comment, pk=parent_id) if parent_id else None
+    parent = get_object_or_404(Comment, pk=parent_id, issue=issue) if parent_id else None
 
     if request.method == "POST":
         form = CommentForm(request.POST)
@@ -181,22 +344,31 @@ def add_comment(request, pk, parent_id=None):
             comment.user = request.user
             comment.parent = parent
             comment.save()
+            publish_issue_event(issue, 'comment', comment_id=comment.pk, user=request.user.username)
     return redirect("issue_detail", pk=pk)
 
+@condition(etag_func=_issue_etag, last_modified_func=_issue_last_modified)
+@cache_anonymous_page(_issue_page_scope)
 def issue_detail(request, pk):
     issue = get_object_or_404(Issue, pk=pk)
-    comments = issue.comments.filter(parent__isnull=True)  # top-level comments
-    return render(request, "issues/issue_detail.html", {"issue": issue, "comments": comments})
 
-def add_comment(request, pk, parent_id=None):
-    if request.method == "POST" and request.user.is_authenticated:
-        issue = get_object_or_404(Issue, pk=pk)
-        text = request.POST.get("text")
-        content = request.POST.get("content")
-    if content:
-        parent = Comment.objects.get(pk=parent_id) if parent_id else None
-        Comment.objects.create(issue=issue, user=request.user, content=content, parent=parent)
-    return redirect("issue_detail", pk=pk)
+    # Paginate by thread (top-level comment), then load every comment of the
+    # threads on this page, with their authors, in a single query. Sorting
+    # by materialized path yields each thread depth-first, ready to render.
+    threads = issue.comments.filter(parent__isnull=True).order_by('created_at', 'id')
+    page = Paginator(threads, COMMENT_THREADS_PER_PAGE).get_page(request.GET.get('page'))
+    comments = (
+        Comment.objects
+        .filter(thread_id__in=page.object_list.values('id'))
+        .select_related('user')
+        .order_by('path')
+    )
+    return render(request, "issues/issue_detail.html", {
+        "issue": issue,
+        "comments": comments,
+        "page_obj": page,
+        "live_updates": settings.LIVE_UPDATES,
+    })
 
 def superadmin_check(user):
     return user.is_superuser  
@@ -204,7 +376,9 @@ def superadmin_check(user):
 @login_required
 @user_passes_test(superadmin_check)
 def superadmin_dashboard(request):
-    return render(request, "dashboard/superadmin_dashboard.html")
+    return render(request, "dashboard/superadmin_dashboard.html", {
+        "home_cache": home_cache_stats(),
+    })
 
 @login_required
 @user_passes_test(superadmin_check)
@@ -273,8 +447,6 @@ def department_detail(request, pk):
 @login_required
 @user_passes_test(superadmin_check)
 def manage_issues(request):
-    issues = Issue.objects.all().order_by('-created_at')
-
     if request.method == "POST":
         issue_id = request.POST.get("issue_id")
         dept_id = request.POST.get("department")
@@ -285,10 +457,98 @@ def manage_issues(request):
             issue.assign_to_department(department)  # 🔹 uses helper
         return redirect("manage_issues")  # refresh page after save
 
+    issues = _moderation_queryset(request.GET)
+    try:
+        page = keyset_paginate(issues, request.GET.get('cursor'), MANAGE_ISSUES_PAGE_SIZE)
+    except InvalidCursor:
+        page = keyset_paginate(issues, None, MANAGE_ISSUES_PAGE_SIZE)
+
+    filters = {k: request.GET.get(k, '') for k in ('status', 'department')}
     return render(request, "issues/manage_issues.html", {
-    "issues": issues,
-    "departments": Department.objects.all()
-})
+        "issues": page,
+        "page": page,
+        "departments": Department.objects.all(),
+        "status_choices": Issue.STATUS_CHOICES,
+        "filters": filters,
+        "filter_query": urlencode({k: v for k, v in filters.items() if v}),
+    })
+
+
+def _moderation_queryset(params):
+    """Issues matching the manage_issues filters in `params` (GET or POST)."""
+    issues = Issue.objects.select_related('reporter', 'department')
+    status = params.get('status')
+    if status:
+        issues = issues.filter(status=status)
+    department = params.get('department')
+    if department == 'none':
+        issues = issues.filter(department__isnull=True)
+    elif department:
+        issues = issues.filter(department_id=department)
+    return issues
+
+
+@login_required
+@user_passes_test(superadmin_check)
+@require_POST
+def bulk_issue_action(request):
+    """
+    Apply one moderation action to many issues at once: the ticked
+    `issue_ids`, or with scope=filter every issue matching the filters.
+    """
+    action = request.POST.get("action")
+    if request.POST.get("scope") == "filter":
+        issue_ids = list(_moderation_queryset(request.POST).values_list('id', flat=True))
+    else:
+        issue_ids = [int(i) for i in request.POST.getlist("issue_ids") if i.isdigit()]
+
+    deleted_ids = []
+    if not issue_ids:
+        error = "No issues selected."
+    elif action == "assign":
+        department = Department.objects.filter(id=request.POST.get("department_id") or None).first()
+        error = None if department else "Please select a department."
+        if department:
+            count = bulk_assign_department(issue_ids, department)
+            message = f"{count} issue(s) assigned to {department.name}."
+    elif action == "status":
+        new_status = request.POST.get("new_status")
+        error = None if new_status in dict(Issue.STATUS_CHOICES) else "Please select a status."
+        if not error:
+            count = bulk_set_status(issue_ids, new_status)
+            message = f"{count} issue(s) marked {dict(Issue.STATUS_CHOICES)[new_status]}."
+    elif action == "delete_fake":
+        error = None
+        count, banned = bulk_delete_fake(issue_ids)
+        deleted_ids = issue_ids
+        message = f"✅ {count} fake issue(s) deleted and {banned} reporter(s) banned for 7 days."
+    else:
+        error = "Unknown action."
+
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        if error:
+            return JsonResponse({"success": False, "error": error}, status=400)
+        # Only the rows that changed go back to the page
+        rows = ""
+        if request.POST.get("scope") != "filter" and action != "delete_fake":
+            updated = Issue.objects.select_related('reporter', 'department').filter(id__in=issue_ids)
+            rows = render_to_string("issues/_manage_issue_rows.html", {
+                "issues": updated,
+                "departments": Department.objects.all(),
+            }, request=request)
+        return JsonResponse({
+            "success": True,
+            "message": message,
+            "rows": rows,
+            "deleted_ids": deleted_ids,
+            "reload": request.POST.get("scope") == "filter",
+        })
+
+    if error:
+        messages.error(request, error)
+    else:
+        messages.success(request, message)
+    return redirect("manage_issues")
 
 @user_passes_test(superadmin_check)
 def assign_department(request, issue_id):
@@ -308,7 +568,7 @@ def assign_department(request, issue_id):
 @login_required
 @user_passes_test(superadmin_check)
 def manage_users(request):
-    citizens = User.objects.filter(is_citizen=True).order_by('-date_joined')
+    citizens = User.objects.filter(is_citizen=True).with_ban_state().order_by('-date_joined')
     return render(request, 'core/manage_users.html', {'citizens': citizens})
 
 
@@ -338,40 +598,63 @@ def delete_fake_issue(request, issue_id):
     messages.success(request, f"✅ Issue deleted and user {reporter.username} has been banned for 7 days.")
     return redirect("manage_issues")
 
+@login_required
+@user_passes_test(superadmin_check)
+def export_data(request, dataset):
+    """Stream a dataset as CSV or NDJSON (?format=), filtered like the export_data command."""
+    fmt = request.GET.get('format', 'csv')
+    if dataset not in DATASETS or fmt not in EXPORT_FORMATS:
+        raise Http404("Unknown export")
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(export_lines(dataset, fmt, filters), content_type=EXPORT_FORMATS[fmt])
+    stamp = timezone.localdate().isoformat()
+    response['Content-Disposition'] = f'attachment; filename="civicfix-{dataset}-{stamp}.{fmt}"'
+    return response
+
 @login_required
 @user_passes_test(superadmin_check)
 def superadmin_reports(request):
+    # Everything below reads the incrementally maintained daily rollups,
+    # never the Issue table itself
+    rollups = IssueDailyRollup.objects.order_by()
+
     # 1. Total issues reported
-    total_issues = Issue.objects.count()
+    total_issues = rollups.aggregate(total=Sum('count'))['total'] or 0
 
     # 2. Issues per status
     status_counts = (
-        Issue.objects.values('status')
-        .annotate(count=Count('id'))
-        .order_by()
+        rollups.values('status')
+        .annotate(count=Sum('count'))
+        .filter(count__gt=0)
     )
 
     # 3. Top 5 departments with most assigned issues
     top_departments = (
-        Issue.objects.values('department__name')
-        .annotate(count=Count('id'))
+        rollups.values('department__name')
+        .annotate(count=Sum('count'))
+        .filter(count__gt=0)
         .order_by('-count')[:5]
     )
 
     # 4. Top citizens by number of reports
     top_citizens = (
-        Issue.objects.values('reporter__username')
-        .annotate(count=Count('id'))
+        rollups.values('reporter__username')
+        .annotate(count=Sum('count'))
+        .filter(count__gt=0)
         .order_by('-count')[:5]
     )
 
     # 5. Issues over time (last 30 days)
-    last_30_days = now() - timedelta(days=30)
+    last_30_days = timezone.localdate() - timedelta(days=30)
     issues_last_30_days = (
-        Issue.objects.filter(created_at__gte=last_30_days)
-        .extra(select={'day': "date(created_at)"})
+        rollups.filter(day__gte=last_30_days)
         .values('day')
-        .annotate(count=Count('id'))
+        .annotate(count=Sum('count'))
+        .filter(count__gt=0)
         .order_by('day')
     )
 
@@ -381,9 +664,35 @@ def superadmin_reports(request):
         "top_departments": list(top_departments),
         "top_citizens": list(top_citizens),
         "issues_last_30_days": list(issues_last_30_days),
+        "export_datasets": [(key, key.replace("_", " ").capitalize()) for key in DATASETS],
     }
     return render(request, "core/superadmin_reports.html", context)
 
+@login_required
+@user_passes_test(superadmin_check)
+def superadmin_metrics(request):
+    """Per-view latency, queries and cache hit rates recorded by this process."""
+    if request.method == "POST" and request.POST.get("action") == "reset":
+        metrics_registry.reset()
+        messages.success(request, "Metrics reset.")
+        return redirect("superadmin_metrics")
+    return render(request, "core/superadmin_metrics.html", {
+        **metrics_registry.snapshot(),
+        "sample_rate": round(100 * sample_rate(), 1),
+        "slow_query_ms": settings.METRICS_SLOW_QUERY_MS,
+    })
+
+def metrics_endpoint(request):
+    """Prometheus scrape target: a bearer METRICS_TOKEN, or a superadmin session."""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if not (
+        (token and constant_time_compare(authorization, f"Bearer {token}"))
+        or (request.user.is_authenticated and superadmin_check(request.user))
+    ):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(metrics_registry.prometheus_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @login_required
 @user_passes_test(superadmin_check)
 def delete_issue(request, issue_id):
@@ -398,17 +707,120 @@ def resolver_check(user):
 @login_required
 @user_passes_test(lambda u: u.is_resolver)
 def department_dashboard(request):
-    departments = request.user.departments.all()
-    issues = Issue.objects.filter(department__in=departments).order_by('-created_at')
-    return render(request, "dashboard/department_dashboard.html", {"issues": issues, "departments": departments})
+    # 🔹 The ids come with request.user; only the names need a query
+    dept_ids = request.user.department_ids
+    departments = list(Department.objects.filter(id__in=dept_ids))
+
+    # 🔹 Work queue: highest priority first, open issues unless asked otherwise
+    selected_department = request.GET.get('department', '')
+    selected_status = request.GET.get('status', 'open')
+    issues = Issue.objects.select_related('reporter', 'department')
+    if selected_department.isdigit() and int(selected_department) in dept_ids:
+        issues = issues.filter(department_id=selected_department)
+    else:
+        selected_department = ''
+        issues = issues.filter(department_id__in=dept_ids)
+    if selected_status == 'open':
+        issues = issues.exclude(status=Issue.STATUS_RESOLVED)
+    elif selected_status in dict(Issue.STATUS_CHOICES):
+        issues = issues.filter(status=selected_status)
+
+    ordering = ('-priority', '-id')
+    try:
+        page = keyset_paginate(issues, request.GET.get('cursor'), WORK_QUEUE_PAGE_SIZE, ordering)
+    except InvalidCursor:
+        page = keyset_paginate(issues, None, WORK_QUEUE_PAGE_SIZE, ordering)
+
+    filters = {'department': selected_department, 'status': selected_status}
+    return render(request, "dashboard/department_dashboard.html", {
+        "issues": page,
+        "page": page,
+        "departments": departments,
+        "status_choices": Issue.STATUS_CHOICES,
+        "filters": filters,
+        "filter_query": urlencode({k: v for k, v in filters.items() if v}),
+        "live_updates": settings.LIVE_UPDATES,
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_resolver or u.is_superuser)
+def department_hotspots(request):
+    # 🔹 Resolvers see their own departments, superadmins every department
+    if request.user.is_superuser:
+        departments = list(Department.objects.all())
+    else:
+        departments = list(Department.objects.filter(id__in=request.user.department_ids))
+    dept_ids = [dept.id for dept in departments]
+
+    selected_department = request.GET.get('department', '')
+    if selected_department == 'none' and request.user.is_superuser:
+        department_id = None
+    elif selected_department.isdigit() and int(selected_department) in dept_ids:
+        department_id = int(selected_department)
+    elif dept_ids:
+        department_id = dept_ids[0]
+        selected_department = str(department_id)
+    else:
+        return render(request, "dashboard/department_hotspots.html", {"departments": []})
+
+    selected_status = request.GET.get('status', 'all')
+    grids = HotspotGrid.objects.filter(department_id=department_id)
+    if selected_status == 'open':
+        grids = grids.exclude(status=Issue.STATUS_RESOLVED)
+    elif selected_status in dict(Issue.STATUS_CHOICES):
+        grids = grids.filter(status=selected_status)
+    else:
+        selected_status = 'all'
+
+    # 🔹 Weekly totals for the trend chart, read without unpacking any grid
+    trend = list(grids.values('week').annotate(total=Sum('total')).order_by('-week')[:HOTSPOT_WEEKS])[::-1]
+    weeks = [row['week'] for row in trend]
+    try:
+        week = parse_date(request.GET.get('week') or '')
+    except ValueError:
+        # Well-formed but impossible, e.g. 2024-02-30
+        week = None
+    if week not in weeks:
+        week = weeks[-1] if weeks else None
+
+    points, hotspots = [], []
+    if week:
+        previous_week = week - timedelta(days=7)
+        loaded = list(grids.filter(week__in=[week, previous_week]))
+        counts, density = merge_grids(g for g in loaded if g.week == week)
+        _, previous = merge_grids(g for g in loaded if g.week == previous_week)
+        points = [[*cell_location(cell), round(value, 3)] for cell, value in density.items()]
+        # 🔹 Busiest cells this week and how their density moved since last week
+        for cell in sorted(counts, key=density.get, reverse=True)[:HOTSPOT_TOP]:
+            lat, lng = cell_location(cell)
+            hotspots.append({
+                'lat': round(lat, 5),
+                'lng': round(lng, 5),
+                'issues': counts[cell],
+                'density': round(density[cell], 1),
+                'change': round(density[cell] - previous.get(cell, 0.0), 1),
+            })
+
+    return render(request, "dashboard/department_hotspots.html", {
+        "departments": departments,
+        "status_choices": Issue.STATUS_CHOICES,
+        "filters": {'department': selected_department, 'status': selected_status, 'week': week},
+        "weeks": weeks[::-1],
+        "trend": [{'week': row['week'].isoformat(), 'total': row['total']} for row in trend],
+        "points": points,
+        "hotspots": hotspots,
+    })
 
 @login_required
 @user_passes_test(lambda u: u.is_resolver)
 def update_issue_status(request, issue_id):
-    issue = get_object_or_404(Issue, id=issue_id)
-
-    # Make sure the user belongs to the department assigned to the issue
-    if issue.department not in request.user.departments.all():
+    # Make sure the user belongs to the department assigned to the issue,
+    # checked in the same query via the (department, user) unique index
+    membership = Department.users.through.objects.filter(
+        department_id=OuterRef('department_id'), user_id=request.user.id,
+    )
+    issue = get_object_or_404(Issue.objects.annotate(is_member=Exists(membership)), id=issue_id)
+    if not issue.is_member:
         return redirect("department_dashboard")
 
     if request.method == "POST":
@@ -416,4 +828,32 @@ def update_issue_status(request, issue_id):
         if new_status in [Issue.STATUS_IN_PROGRESS, Issue.STATUS_RESOLVED]:
             issue.status = new_status
             issue.save()
-    return redirect("department_dashboard")
\ No newline at end of file
+            publish_issue_event(issue, 'status', status=issue.status, status_display=issue.get_status_display())
+    return redirect("department_dashboard")
+
+
+# 🔹 Live updates (server-sent events; see core.events)
+
+def _event_stream_response(channels):
+    if not settings.LIVE_UPDATES:
+        # 204 tells EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(event_stream(channels), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
+async def issue_events(request, pk):
+    if not await Issue.objects.filter(pk=pk).aexists():
+        raise Http404("Issue not found")
+    return _event_stream_response([issue_channel(pk)])
+
+@login_required
+@user_passes_test(lambda u: u.is_resolver)
+async def department_events(request):
+    user = await request.auser()
+    dept_ids = user.department_ids
+    selected = request.GET.get('department', '')
+    if selected.isdigit() and int(selected) in dept_ids:
+        dept_ids = [int(selected)]
+    return _event_stream_response([department_channel(pk) for pk in dept_ids])